@@ -0,0 +1,158 @@
+import math
+from threading import Event, Lock
+
+from global_classes import monotonic
+from geodesy import to_enu
+
+## how much a new interval between location updates weighs in the estimate of the update interval
+INTERVAL_WEIGHT = 0.25
+
+
+## @ingroup Onboard
+# @brief Detects when the drone reaches its target, from the location updates of DroneKit
+#
+# Every location update checks the distance to the target, so a waiting thread is woken up by the update
+# that reaches it instead of by its next poll. The velocity is used to predict when the drone will be within
+# the distance threshold: when that happens before the next location update is expected,
+# the arrival is set at the predicted time, so the next waypoint is sent as soon as the drone crosses the threshold.
+#
+# Usage:
+#     detector.set_target(latitude, longitude, altitude)
+#     while not detector.arrived():
+#         detector.wait(0.5)
+#     detector.clear()
+class ArrivalDetector():
+    def __init__(self, threshold):
+        """
+        Args:
+            threshold: how close (in meters) the drone should get to its target before it is considered "reached"
+        """
+        ## how close (in meters) the drone should get to its target before it is considered "reached"
+        self.threshold = threshold
+        ## tuple with the latitude, longitude and altitude of the target, None when there is no target
+        self.target = None
+        ## how close (in meters) the drone should get to the current target, see set_target
+        self.radius = threshold
+        ## boolean, True once the drone was within the threshold of the target
+        self.reached = False
+        ## the monotonic time at which the drone is predicted to be within the threshold, None if it is not predicted
+        self.deadline = None
+        ## threading.Event that wakes up the waiting thread, on arrival or by wake()
+        self.event = Event()
+        ## the location of the last update, to tell location updates apart from other attribute updates
+        self.last_location = None
+        ## the velocity (north, east, down) in m/s at the last location update
+        self.last_velocity = None
+        ## the monotonic time of the last location update
+        self.last_update = None
+        ## the estimated seconds between two location updates
+        self.interval = None
+        ## lock, the DroneKit thread updates while the navigation thread sets the target
+        self.lock = Lock()
+
+    def set_target(self, latitude, longitude, altitude, radius=None):
+        """
+        Start waiting for a new target, a drone that is already there arrives right away
+
+        Args:
+            latitude: the latitude of the target
+            longitude: the longitude of the target
+            altitude: the altitude of the target, relative to the home location
+            radius: how close (in meters) the drone should get to this target, by default the threshold
+        """
+        with self.lock:
+            self.target = (latitude, longitude, altitude)
+            self.radius = radius if radius is not None else self.threshold
+            self.reached = False
+            self.deadline = None
+            self.event.clear()
+            self.check()
+
+    ## stop waiting for the target
+    def clear(self):
+        with self.lock:
+            self.target = None
+            self.reached = False
+            self.deadline = None
+            self.event.clear()
+
+    ## wake up the thread that is waiting, e.g. when the drone is interrupted
+    def wake(self):
+        self.event.set()
+
+    def update(self, telemetry, now):
+        """
+        Check a new TelemetrySnapshot, this is called from the DroneKit thread
+
+        Args:
+            telemetry: TelemetrySnapshot instance
+            now: the monotonic time of the update
+        """
+        location = (telemetry.latitude, telemetry.longitude, telemetry.height)
+        if None in location or location == self.last_location:
+            return  # e.g. a battery update, it says nothing new about the position
+        with self.lock:
+            if self.last_update is not None:
+                interval = now - self.last_update
+                if self.interval is None:
+                    self.interval = interval
+                else:
+                    self.interval += INTERVAL_WEIGHT * (interval - self.interval)
+            self.last_location = location
+            self.last_velocity = telemetry.velocity
+            self.last_update = now
+            self.check()
+
+    ## compare the last location with the target and predict the arrival, the lock should be held
+    def check(self):
+        if self.target is None or self.reached or self.last_location is None:
+            return
+        east, north = to_enu(self.last_location[0], self.last_location[1], self.target[0], self.target[1])
+        up = self.target[2] - self.last_location[2]
+        distance = math.sqrt(north ** 2 + east ** 2 + up ** 2)
+        if distance <= self.radius:
+            self.reached = True
+            self.event.set()
+            return
+        self.deadline = None
+        if self.last_velocity is None or self.interval is None:
+            return
+        velocity_north, velocity_east, velocity_down = self.last_velocity
+        # the speed at which the distance to the target shrinks
+        closing = (velocity_north * north + velocity_east * east - velocity_down * up) / distance
+        if closing <= 0.0:
+            return
+        eta = (distance - self.radius) / closing
+        if eta <= self.interval:  # the drone crosses the threshold before the next update tells us
+            self.deadline = self.last_update + eta
+            self.event.set()  # the waiting thread waits until the deadline instead of its poll
+
+    def arrived(self, now=None):
+        """
+        Args:
+            now: the monotonic time, by default the current time
+        Returns:
+            True if the drone is within the threshold of the target, or is predicted to be by now
+        """
+        if self.reached:
+            return True
+        deadline = self.deadline
+        if deadline is None:
+            return False
+        if now is None:
+            now = monotonic()
+        return deadline <= now
+
+    def wait(self, timeout):
+        """
+        Wait until the drone arrives, until wake() is called or until the timeout expires
+
+        Args:
+            timeout: the most seconds to wait
+        """
+        deadline = self.deadline
+        if deadline is not None:
+            timeout = min(timeout, max(0.0, deadline - monotonic()))
+        self.event.wait(timeout)
+        if not self.reached:
+            self.event.clear()  # a new prediction only had to shorten this wait
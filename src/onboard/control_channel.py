@@ -0,0 +1,349 @@
+import json
+import struct
+import socket
+import threading
+
+import wire_format
+from global_classes import MessageCodes, recv_exact
+
+## the request that turns a new connection with the control module into a channel
+CHANNEL_OPEN = json.dumps({'message_type': 'channel', 'message': 'open'})
+## navigation messages that take priority over every other request, they interrupt what the drone is doing
+PRIORITY_MESSAGES = ('emergency', 'stop')
+## seconds to wait for the control module to accept a new channel
+OPEN_TIMEOUT = 5.0
+
+
+def is_channel_request(raw):
+    """
+    Check whether a request asks to open a channel
+
+    Args:
+        raw: the first request that was received on a new connection
+    Returns:
+        True if the connection should be kept open as a channel
+    """
+    if 'channel' not in raw:  # cheap check, so we don't parse every request twice
+        return False
+    try:
+        packet = wire_format.loads(raw)
+    except ValueError:
+        return False
+    return isinstance(packet, dict) and packet.get('message_type') == 'channel' and packet.get('message') == 'open'
+
+
+def is_priority_request(raw):
+    """
+    Check whether a request is a navigation message that should skip the queue, like 'emergency'
+
+    Args:
+        raw: the request in JSON format
+    Returns:
+        True if the request should be sent over the priority lane
+    """
+    if 'navigation' not in raw:  # cheap check, so we don't parse every request twice
+        return False
+    try:
+        packet = wire_format.loads(raw)
+    except ValueError:
+        return False
+    return isinstance(packet, dict) and packet.get('message_type') == 'navigation' and packet.get('message') in PRIORITY_MESSAGES
+
+
+def parse_control_response(buf):
+    """
+    Parse a response of the control module from the bytes that were received so far
+
+    Args:
+        buf: the bytes received from the control module
+    Returns:
+        a tuple (status_code, fields), where fields is a list with the length-prefixed fields
+        that follow the status code, or None if the response is not complete yet
+    """
+    if len(buf) < 4:
+        return None
+    status_code = struct.unpack(">I", buf[:4])[0]
+    if status_code in (MessageCodes.STATUS_RESPONSE, MessageCodes.JOB_ACCEPTED):
+        field_count = 1  # the response
+    elif status_code == MessageCodes.START_HEARTBEAT:
+        field_count = 3  # the host and port of the workstation, and the heartbeat options in JSON
+    elif status_code == MessageCodes.SUBSCRIBE:
+        field_count = 1  # the subscription in JSON
+    else:
+        field_count = 0
+
+    offset = 4
+    fields = []
+    for i in range(field_count):
+        if len(buf) < offset + 4:
+            return None
+        length = struct.unpack(">I", buf[offset:offset + 4])[0]
+        if len(buf) < offset + 4 + length:
+            return None
+        fields.append(buf[offset + 4:offset + 4 + length])
+        offset += 4 + length
+    return status_code, fields
+
+
+## @ingroup Onboard
+# @brief A long-lived connection with the control module that can carry many requests at the same time
+#
+# The connection is opened with a CHANNEL_OPEN request, after that every request is preceded by
+# its length and a request ID ('>II') and every response by the request ID and its length ('>II').
+# The response itself has the same format as on a one-shot connection.
+# A reader thread hands every response to the thread that is waiting for it.
+class ControlChannel():
+    def __init__(self, path="/tmp/uds_control", timeout=OPEN_TIMEOUT):
+        """
+        Connect to the control module and open the channel
+
+        Args:
+            path: the path of the unix domain socket of the control module
+            timeout: seconds to wait for the connection and the ACK of the control module,
+                socket.timeout (a socket.error) is raised after it
+        """
+        ## socket to the control module
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path)
+            self.sock.sendall(struct.pack(">I", len(CHANNEL_OPEN)) + CHANNEL_OPEN)
+            raw_response = recv_exact(self.sock, 4)
+        except socket.error:
+            self.sock.close()
+            raise
+        if raw_response is None or struct.unpack(">I", raw_response)[0] != MessageCodes.ACK:
+            self.sock.close()
+            raise socket.error("the control module refused to open a channel")
+        self.sock.settimeout(None)  # a request can take as long as the drone needs for it
+
+        ## boolean, False once the channel is broken or closed
+        self.alive = True
+        ## how many threads are using this channel, this is managed by the ControlChannelPool
+        self.users = 0
+        ## lock to make sure requests of different threads don't get interleaved
+        self.send_lock = threading.Lock()
+        ## lock that protects self.pending
+        self.pending_lock = threading.Lock()
+        ## dict with request ID: [threading.Event, response] of the requests waiting for a response
+        self.pending = {}
+        ## the ID of the next request
+        self.next_id = 0
+
+        reader = threading.Thread(target=self.read_responses)
+        reader.daemon = True
+        reader.start()
+
+    def request(self, data):
+        """
+        Send a request and wait for the response
+
+        Args:
+            data: the message to send to the control module
+        Returns:
+            a tuple (status_code, fields), like parse_control_response
+        """
+        slot = [threading.Event(), None]
+        with self.pending_lock:
+            if not self.alive:
+                raise socket.error("the channel is closed")
+            request_id = self.next_id
+            self.next_id = (self.next_id + 1) & 0xffffffff
+            self.pending[request_id] = slot
+        try:
+            with self.send_lock:
+                self.sock.sendall(struct.pack(">II", len(data), request_id) + data)
+        except socket.error:
+            self.close()
+            raise
+        slot[0].wait()
+        if slot[1] is None:
+            raise socket.error("the channel was closed before the response arrived")
+        return slot[1]
+
+    ## read the responses and wake up the threads that are waiting for them
+    def read_responses(self):
+        while True:
+            try:
+                header = recv_exact(self.sock, 8)
+                if header is None:
+                    break
+                request_id, length = struct.unpack(">II", header)
+                body = recv_exact(self.sock, length)
+                if body is None:
+                    break
+            except socket.error:
+                break
+            with self.pending_lock:
+                slot = self.pending.pop(request_id, None)
+            if slot is not None:
+                slot[1] = parse_control_response(body)
+                slot[0].set()
+        self.close()
+
+    ## close the channel, the threads that are still waiting will get a socket.error
+    def close(self):
+        with self.pending_lock:
+            self.alive = False
+            slots = self.pending.values()
+            self.pending = {}
+        for slot in slots:
+            slot[0].set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+
+## @ingroup Onboard
+# @brief A pool of ControlChannel instances, shared by all threads of the Server
+#
+# A request goes to the channel with the fewest users, a new channel is only opened when every channel is in use.
+# When the pool is full and every channel has max_users users, the request waits for a channel.
+# Priority requests, see is_priority_request, never wait: they have a channel of their own.
+class ControlChannelPool():
+    def __init__(self, logger, path="/tmp/uds_control", size=4, max_users=4, timeout=OPEN_TIMEOUT):
+        """
+        Args:
+            logger: logging.Logger instance
+            path: the path of the unix domain socket of the control module
+            size: the maximum amount of channels
+            max_users: the maximum amount of requests that can be in flight on one channel
+            timeout: seconds to wait for the control module to accept a new channel
+        """
+        ## logger instance
+        self.logger = logger
+        ## the path of the unix domain socket of the control module
+        self.path = path
+        ## the maximum amount of channels
+        self.size = size
+        ## the maximum amount of requests that can be in flight on one channel
+        self.max_users = max_users
+        ## seconds to wait for the control module to accept a new channel
+        self.timeout = timeout
+        ## the open ControlChannel instances
+        self.channels = []
+        ## condition that is notified every time a channel is released, opened or could not be opened
+        self.condition = threading.Condition()
+        ## how many channels are being opened, they count toward the size of the pool
+        self.pending_opens = 0
+        ## how many requests had to wait for a channel
+        self.waits = 0
+        ## how many requests were sent over a channel that was already open
+        self.reuses = 0
+        ## how many channels have been opened
+        self.opened = 0
+        ## the ControlChannel that is only used for priority requests
+        self.priority_channel = None
+        ## lock that protects self.priority_channel
+        self.priority_lock = threading.Lock()
+
+    def request(self, data):
+        """
+        Send a request to the control module over one of the channels
+
+        Args:
+            data: the message to send to the control module
+        Returns:
+            a tuple (status_code, fields), like parse_control_response
+        """
+        channel = self.acquire()
+        try:
+            return channel.request(data)
+        finally:
+            self.release(channel)
+
+    def priority_request(self, data):
+        """
+        Send a priority request over the channel that is reserved for them,
+        so it does not wait behind the requests that are in flight on the other channels
+
+        Args:
+            data: the message to send to the control module
+        Returns:
+            a tuple (status_code, fields), like parse_control_response
+        """
+        with self.priority_lock:
+            if self.priority_channel is None or not self.priority_channel.alive:
+                self.logger.debug("opening the priority channel to the control module")
+                self.priority_channel = ControlChannel(self.path, self.timeout)
+                self.opened += 1
+            channel = self.priority_channel
+        return channel.request(data)
+
+    def acquire(self):
+        """
+        Take the channel with the fewest users, open a new one or wait for one
+
+        Returns:
+            a ControlChannel, give it back with release()
+        """
+        with self.condition:
+            waited = False
+            while True:
+                self.channels = [channel for channel in self.channels if channel.alive]
+                channel = None
+                if self.channels:
+                    channel = min(self.channels, key=lambda c: c.users)
+                if channel is not None and channel.users < self.max_users and \
+                        (channel.users == 0 or len(self.channels) + self.pending_opens >= self.size):
+                    self.reuses += 1
+                    channel.users += 1
+                    return channel
+                if len(self.channels) + self.pending_opens < self.size:
+                    self.pending_opens += 1  # reserve the slot, the channel is opened without the lock
+                    break
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                self.condition.wait()
+
+        # opening a channel blocks until the control module answers, release() must not wait for that
+        self.logger.debug("opening a new channel to the control module")
+        try:
+            channel = ControlChannel(self.path, self.timeout)
+        except Exception:
+            with self.condition:
+                self.pending_opens -= 1
+                self.condition.notify()  # a waiting thread can try to open it
+            raise
+        with self.condition:
+            self.pending_opens -= 1
+            self.channels.append(channel)
+            self.opened += 1
+            channel.users += 1
+            self.condition.notify()  # the new channel can take more users
+        return channel
+
+    def release(self, channel):
+        with self.condition:
+            channel.users -= 1
+            self.condition.notify()
+
+    def stats(self):
+        """
+        Returns:
+            a dict with the current amount of channels ('size'), the requests in flight,
+            and how many requests had to wait for a channel or could reuse one
+        """
+        with self.condition:
+            channels = [channel for channel in self.channels if channel.alive]
+            return {'size': len(channels),
+                    'max_size': self.size,
+                    'in_flight': sum(channel.users for channel in channels),
+                    'waits': self.waits,
+                    'reuses': self.reuses,
+                    'opened': self.opened}
+
+    ## close all channels
+    def close(self):
+        with self.condition:
+            channels = self.channels
+            self.channels = []
+        with self.priority_lock:
+            if self.priority_channel is not None:
+                channels.append(self.priority_channel)
+            self.priority_channel = None
+        for channel in channels:
+            channel.close()
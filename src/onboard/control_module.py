@@ -1,19 +1,26 @@
 import os
 import sys
 import json
+import Queue
 import signal
 import struct
 import socket
 import getopt
 import logging
+import threading
 import dronekit
 from dronekit_solo import SoloVehicle
 
 from solo import Solo
+from job_dispatcher import JobDispatcher
 from navigation_handler import NavigationHandler, NavigationThread
 from settings_handler import SettingsHandler
 from status_handler import StatusHandler
-from global_classes import MessageCodes, WayPointQueue, logformat, dateformat, print_help
+from shared_telemetry import TelemetryWriter
+from events import event_frame, is_event_stream_request
+from control_channel import PRIORITY_MESSAGES, is_channel_request, is_priority_request
+from wire_format import detect, dumps, loads
+from global_classes import MessageCodes, WayPointQueue, logformat, dateformat, print_help, recv_exact
 
 
 ## @ingroup Onboard
@@ -25,7 +32,20 @@ from global_classes import MessageCodes, WayPointQueue, logformat, dateformat, p
 # Navigation messages will be handled by a NavigationHandler
 # Status messages will be handled by a StatusHandler
 # Settings messages will be handled by a SettingsHandler
+#
+# Navigation messages that take a long time, like 'start', are executed as a job by the JobDispatcher,
+# the request is acknowledged right away. When the request contains "job": true, the ID of the job is sent back,
+# the workstation can then follow the job with a 'job_status' status request.
+# An 'emergency' cancels the jobs that did not start yet. A 'stop' only holds the drone where it is:
+# the queued jobs still run, and the solo flies on after the next 'start'.
+#
+# The Server keeps a few channels open (see ControlChannel), every channel is served by a ChannelThread.
+# The requests of all channels are handled by a few ChannelWorker threads, so a slow request does not hold up
+# the requests behind it on the same channel.
 class ControlModule():
+    ## how many ChannelWorkers handle the requests of the channels
+    WORKER_COUNT = 8
+
     def __init__(self, logger, log_level, SIM, log_type='console', filename=''):
         """
         Initiate the control module
@@ -80,8 +100,29 @@ class ControlModule():
         self.stat_handler = None
         ## SettingsHandler instance
         self.setting_handler = None
+        ## JobDispatcher instance
+        self.job_dispatcher = None
         ## WayPointQueue instance. Here the waypoints the drone has to visit will come
         self.waypoint_queue = WayPointQueue()
+        ## a lock per message type, the handlers keep the request they are handling as attribute
+        self.handler_locks = {'navigation': threading.Lock(),
+                              'status': threading.Lock(),
+                              'settings': threading.Lock()}
+        ## the ChannelThread instances
+        self.channels = []
+        ## requests from the channels, waiting to be handled by a ChannelWorker
+        self.request_queue = Queue.Queue()
+        ## the ChannelWorker instances
+        self.channel_workers = []
+        ## TelemetryWriter instance, publishes the telemetry for the heartbeats of the Server
+        self.telemetry_writer = None
+        try:
+            self.telemetry_writer = TelemetryWriter()
+            self.publish_telemetry(self.solo.get_telemetry())
+            self.solo.add_telemetry_listener(self.publish_telemetry)
+        except (OSError, IOError), msg:  # the Server asks for every heartbeat over the socket instead
+            self.logger.warning("could not create the shared telemetry: {0}".format(msg))
+            self.telemetry_writer = None
         ## socket that will listen to connections from the Server
         self.unix_socket = socket.socket(socket.AF_UNIX,      # Unix Domain Socket
                                          socket.SOCK_STREAM)  # TCP
@@ -96,11 +137,18 @@ class ControlModule():
 
             self.nav_thread = NavigationThread(solo=self.solo, waypoint_queue=self.waypoint_queue, logging_level=self.log_level, log_type=log_type, filename=filename)
             self.nav_handler = NavigationHandler(self.solo, self.waypoint_queue, self.nav_thread, logging_level=self.log_level, log_type=log_type, filename=filename)
-            self.stat_handler = StatusHandler(self.solo, self.waypoint_queue, logging_level=self.log_level, log_type=log_type, filename=filename)
+            self.job_dispatcher = JobDispatcher(logging_level=self.log_level, log_type=log_type, filename=filename)
+            self.stat_handler = StatusHandler(self.solo, self.waypoint_queue, logging_level=self.log_level, log_type=log_type, filename=filename,
+                                              job_dispatcher=self.job_dispatcher)
             self.setting_handler = SettingsHandler(self.solo, logging_level=self.log_level, log_type=log_type, filename=filename)
 
             self.logger.info("starting the navigation thread")
             self.nav_thread.start()
+            self.job_dispatcher.start()
+            for i in range(self.WORKER_COUNT):
+                worker = ChannelWorker(self, self.request_queue)
+                worker.start()
+                self.channel_workers.append(worker)
         except socket.error, msg:
             self.logger.debug("could not bind to port: {0}, quitting".format(msg))
             self.close()
@@ -117,61 +165,142 @@ class ControlModule():
         while not self.quit:
             try:
                 client, address = self.unix_socket.accept()
-                length = client.recv(4)
+                client.settimeout(None)
+                length = recv_exact(client, 4)
                 if length is None:
                     self.logger.info("Length is None")
-                    raise ValueError
+                    client.close()
+                    continue
                 buffersize = struct.unpack(">I", length)[0]
-                raw = client.recv(buffersize)
-                packet = json.loads(raw)  # parse the Json we received
-                if 'message_type' not in packet:  # every packet should have a MessageType field
-                    self.logger.error("every packet should have a message_type field")
-                    raise ValueError("Packet has no message_type field")
-                if 'message' not in packet:  # every packet should have a Message field
-                    self.logger.error("every packet should have a message field")
-                    raise ValueError("Packet has no message field")
-
-                message_type = packet['message_type']  # the 'message type' attribute tells us to which class of packet this packet belongs
-                message = packet['message']           # the 'message' attribute tells what packet it is, within it's class
-                if (message_type == "navigation"):
-                    self.logger.info("received a navigation request")
-                    self.nav_handler.handle_packet(packet, message)
-                    client.send(struct.pack(">I", MessageCodes.ACK))
-                elif (message_type == "status"):
-                    self.logger.info("received a status request")
-                    response = self.stat_handler.handle_packet(packet, message)
-                    if response is None:
-                        client.send(struct.pack(">I", MessageCodes.ERR))  # something went wrong
-                    else:
-                        client.send(struct.pack(">I", MessageCodes.STATUS_RESPONSE))
-                        client.send(struct.pack(">I", len(response)))
-                        client.send(response)
-                elif (message_type == "settings"):
-                    self.logger.info("received a settings request")
-                    response = self.setting_handler.handle_packet(packet, message)
-                    # if we got a response, that means we need to start sending heartbeats
-                    if response is not None and isinstance(response, tuple):
-                        self.logger.info("settings heartbeat configuration")
-                        client.send(struct.pack(">I", MessageCodes.START_HEARTBEAT))
-                        client.send(struct.pack(">I", len(response[0])))
-                        client.send(response[0])
-                        client.send(struct.pack(">I", len(response[1])))
-                        client.send(response[1])
-                    else:
-                        self.logger.debug("returning ack")
-                        client.send(struct.pack(">I", MessageCodes.ACK))
-                else:
-                    raise ValueError
+                raw = recv_exact(client, buffersize)
+                if raw is None:
+                    client.close()
+                    continue
+                if is_channel_request(raw):
+                    self.open_channel(client)
+                    continue
+                stream_request = is_event_stream_request(raw)
+                if stream_request is not None:
+                    self.open_event_stream(client, stream_request.get('since', 0))
+                    continue
+                client.sendall(self.handle_request(raw))
+                client.close()
 
             except socket.error, msg:
                 pass
 
-            except ValueError, msg:
-                self.logger.debug("value error was raised: {0}".format(msg))
-                client.send(struct.pack(">I", MessageCodes.ERR))
-
+        for channel in self.channels:
+            channel.stop_thread()
         self.unix_socket.close()
 
+    def handle_request(self, raw):
+        """
+        Pass a request to the correct handler
+
+        Args:
+            raw: the request, in JSON or in the compact binary encoding
+        Returns:
+            the response for the Server: a status code, followed by the length-prefixed fields that belong to it
+        """
+        try:
+            packet = loads(raw)  # parse the Json (or msgpack) we received
+            encoding = detect(raw)  # and answer in the same encoding
+            if not isinstance(packet, dict):
+                raise ValueError("Packet is not an object")
+            if 'message_type' not in packet:  # every packet should have a MessageType field
+                self.logger.error("every packet should have a message_type field")
+                raise ValueError("Packet has no message_type field")
+            if 'message' not in packet:  # every packet should have a Message field
+                self.logger.error("every packet should have a message field")
+                raise ValueError("Packet has no message field")
+
+            message_type = packet['message_type']  # the 'message type' attribute tells us to which class of packet this packet belongs
+            message = packet['message']           # the 'message' attribute tells what packet it is, within it's class
+            if (message_type == "navigation"):
+                self.logger.info("received a navigation request")
+                if message in PRIORITY_MESSAGES:
+                    # don't wait for the navigation lock or the jobs, the solo interrupts whatever it is doing
+                    if message == "emergency":
+                        # the solo lands, the queued jobs should not make it take off again
+                        self.job_dispatcher.cancel_queued()
+                    self.nav_handler.handle_priority_packet(message)
+                    return struct.pack(">I", MessageCodes.ACK)
+                job_function = self.nav_handler.create_job(message, packet)
+                if job_function is not None:
+                    job = self.job_dispatcher.submit(message, job_function)
+                    if packet.get('job', False):  # the workstation wants to follow the job
+                        response = dumps({'message_type': 'job', 'job_id': job.job_id}, encoding)
+                        return struct.pack(">I", MessageCodes.JOB_ACCEPTED) + struct.pack(">I", len(response)) + response
+                    return struct.pack(">I", MessageCodes.ACK)
+                with self.handler_locks['navigation']:
+                    self.nav_handler.handle_packet(packet, message)
+                return struct.pack(">I", MessageCodes.ACK)
+            elif (message_type == "status"):
+                self.logger.info("received a status request")
+                with self.handler_locks['status']:
+                    response = self.stat_handler.handle_packet(packet, message, encoding)
+                if response is None:
+                    return struct.pack(">I", MessageCodes.ERR)  # something went wrong
+                return struct.pack(">I", MessageCodes.STATUS_RESPONSE) + struct.pack(">I", len(response)) + response
+            elif (message_type == "settings"):
+                self.logger.info("received a settings request")
+                with self.handler_locks['settings']:
+                    response = self.setting_handler.handle_packet(packet, message)
+                # if we got a response, that means we need to start sending heartbeats
+                if response is not None and isinstance(response, tuple):
+                    self.logger.info("settings heartbeat configuration")
+                    options = json.dumps(response[2])
+                    return struct.pack(">I", MessageCodes.START_HEARTBEAT) + \
+                        struct.pack(">I", len(response[0])) + response[0] + \
+                        struct.pack(">I", len(response[1])) + response[1] + \
+                        struct.pack(">I", len(options)) + options
+                if response == MessageCodes.HEARTBEAT_RESYNC:
+                    return struct.pack(">I", MessageCodes.HEARTBEAT_RESYNC)
+                if isinstance(response, dict):  # the Server pushes the subscribed fields
+                    subscription = json.dumps(response)
+                    return struct.pack(">I", MessageCodes.SUBSCRIBE) + \
+                        struct.pack(">I", len(subscription)) + subscription
+                self.logger.debug("returning ack")
+                return struct.pack(">I", MessageCodes.ACK)
+            else:
+                raise ValueError
+
+        except (ValueError, KeyError), msg:
+            self.logger.debug("value error was raised: {0}".format(msg))
+            return struct.pack(">I", MessageCodes.ERR)
+        except Exception, msg:
+            # e.g. a TypeError for valid JSON with the wrong types, it should not stop the ChannelThread
+            self.logger.error("handling the request failed: {0}".format(msg), exc_info=True)
+            return struct.pack(">I", MessageCodes.ERR)
+
+    ## publish the telemetry in the shared memory, together with the state of the waypoint queue
+    def publish_telemetry(self, telemetry):
+        self.telemetry_writer.publish(telemetry, self.waypoint_queue.last_waypoint_order)
+
+    ## acknowledge a channel request and start a ChannelThread for the connection
+    def open_channel(self, client):
+        self.logger.debug("opening a channel for the server")
+        client.sendall(struct.pack(">I", MessageCodes.ACK))
+        channel = ChannelThread(self, client, self.request_queue)
+        self.channels = [c for c in self.channels if c.is_alive()]
+        self.channels.append(channel)
+        channel.start()
+
+    def open_event_stream(self, client, since):
+        """
+        Acknowledge an event stream request and start an EventStreamThread for the connection
+
+        Args:
+            client: the connection with the Server
+            since: the sequence number of the last event the Server has seen
+        """
+        self.logger.debug("opening an event stream for the server")
+        client.sendall(struct.pack(">I", MessageCodes.ACK))
+        stream = EventStreamThread(self, client, since)
+        self.channels = [c for c in self.channels if c.is_alive()]
+        self.channels.append(stream)
+        stream.start()
+
     ## close the control module and the navigation thread
     def close(self):
         if not self.quit:
@@ -179,6 +308,10 @@ class ControlModule():
             self.quit = True
             if self.nav_thread is not None:
                 self.nav_thread.stop_thread()
+            if self.job_dispatcher is not None:
+                self.job_dispatcher.stop_thread()
+            for worker in self.channel_workers:
+                self.request_queue.put(None)  # every worker stops when it takes a None from the queue
             self.logger.debug("closing dronekit vehicle")
             self.vehicle.close()
 
@@ -201,6 +334,150 @@ class ControlModule():
             os.utime(cm_fail, None)
 
 
+## @ingroup Onboard
+# @brief This thread handles the requests that arrive over one channel with the Server
+#
+# Every request is preceded by its length and a request ID ('>II'),
+# every response by the request ID and the length of the response ('>II').
+# The requests are put on the request queue of the ControlModule, so the responses can be sent in any order.
+# Priority requests, like 'emergency', are handled right away instead, so they don't wait behind the queue.
+class ChannelThread (threading.Thread):
+    def __init__(self, control_module, client_socket, request_queue):
+        """
+        Initiate the thread
+
+        Args:
+            control_module: ControlModule instance
+            client_socket: Socket, the connection with the Server
+            request_queue: Queue.Queue where the requests are put for the ChannelWorkers
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        ## ControlModule instance
+        self.control_module = control_module
+        ## Socket to the Server
+        self.client_socket = client_socket
+        ## the queue on which the requests will be put
+        self.request_queue = request_queue
+        ## lock to make sure responses of different requests don't get interleaved
+        self.send_lock = threading.Lock()
+
+    def run(self):
+        while True:
+            try:
+                header = recv_exact(self.client_socket, 8)
+                if header is None:
+                    break
+                length, request_id = struct.unpack(">II", header)
+                raw = recv_exact(self.client_socket, length)
+                if raw is None:
+                    break
+            except socket.error, msg:
+                self.control_module.logger.debug("channel error: {0}".format(msg))
+                break
+            if is_priority_request(raw):
+                self.send_response(request_id, self.control_module.handle_request(raw))
+            else:
+                self.request_queue.put((raw, request_id, self))
+        self.client_socket.close()
+
+    def send_response(self, request_id, response):
+        """
+        Send the response to a request back to the Server
+
+        Args:
+            request_id: the ID of the request, as it was sent by the Server
+            response: the bytes that would have been sent over a one-shot connection
+        """
+        try:
+            with self.send_lock:
+                self.client_socket.sendall(struct.pack(">II", request_id, len(response)) + response)
+        except socket.error, msg:
+            self.control_module.logger.debug("could not send response {0}: {1}".format(request_id, msg))
+
+    ## stop the thread, this also unblocks a pending read
+    def stop_thread(self):
+        try:
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+
+## @ingroup Onboard
+# @brief This thread handles the requests of the channels
+#
+# The ControlModule starts a few of these, so no thread has to be created per request.
+class ChannelWorker (threading.Thread):
+    def __init__(self, control_module, request_queue):
+        """
+        Initiate the thread
+
+        Args:
+            control_module: ControlModule instance
+            request_queue: Queue.Queue with tuples of (raw request, request ID, ChannelThread)
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        ## ControlModule instance
+        self.control_module = control_module
+        ## the queue from which the requests are taken
+        self.request_queue = request_queue
+
+    def run(self):
+        while True:
+            item = self.request_queue.get()
+            if item is None:  # the control module is exiting
+                return
+            raw, request_id, channel = item
+            channel.send_response(request_id, self.control_module.handle_request(raw))
+
+
+## @ingroup Onboard
+# @brief This thread sends the mission events to the Server as they happen
+#
+# Every event is sent as its length ('>I') followed by the event in JSON, see events.event_frame
+class EventStreamThread (threading.Thread):
+    def __init__(self, control_module, client_socket, since=0):
+        """
+        Initiate the thread
+
+        Args:
+            control_module: ControlModule instance
+            client_socket: Socket, the connection with the Server
+            since: the sequence number of the last event the Server has seen, the events after it are sent first
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        ## ControlModule instance
+        self.control_module = control_module
+        ## Socket to the Server
+        self.client_socket = client_socket
+        ## the sequence number of the last event that was sent
+        self.sequence = since
+        ## boolean to indicate whether to stop the thread or not
+        self.quit = False
+
+    def run(self):
+        events = self.control_module.solo.events
+        while not self.quit:
+            try:
+                for event in events.wait(self.sequence, timeout=1.0):
+                    self.client_socket.sendall(event_frame(event))
+                    self.sequence = event['sequence']
+            except socket.error, msg:
+                self.control_module.logger.debug("event stream error: {0}".format(msg))
+                break
+        self.client_socket.close()
+
+    ## stop the thread
+    def stop_thread(self):
+        self.quit = True
+        try:
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+
 if __name__ == '__main__':
     # parse the command line arguments
     log_level = logging.CRITICAL
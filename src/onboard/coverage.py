@@ -0,0 +1,162 @@
+import math
+
+from geodesy import distance, from_enu, to_enu
+
+## @defgroup Coverage
+# @ingroup Onboard
+#
+# Patterns that cover an area with the camera, generated onboard instead of by the workstation.
+#
+# 'boustrophedon' sweeps a polygon back and forth along parallel lines, the lines are as far apart as the camera sees
+# wide, less the overlap. 'expanding_square' and 'sector' are the search patterns around a datum (the last known
+# position of what is searched for), they reach as far from the datum as the polygon does.
+#
+# Every pattern is a generator of (latitude, longitude) tuples: a waypoint is only computed when it is needed,
+# so the waypoints of a huge area never sit in memory all at once (see WayPointQueue.insert_lazily()).
+
+## the patterns that can be generated
+PATTERNS = ('boustrophedon', 'expanding_square', 'sector')
+## the horizontal field of view of the camera in degrees,
+## it sees the 0.0001 degree (11 m) 'vision_width' of the hello message at the default height of 4 m
+VISION_ANGLE = 108.5
+## the part of the vision width that neighbouring lines see both, by default
+OVERLAP = 0.2
+## the number of triangles in a sector search
+SECTORS = 3
+
+
+def vision_width(height, vision_angle=VISION_ANGLE):
+    """
+    Returns:
+        how many meters wide the camera sees on the ground, from 'height' meters high
+    """
+    return 2 * height * math.tan(math.radians(vision_angle) / 2)
+
+
+def track_spacing(height, overlap=OVERLAP):
+    """
+    Returns:
+        the meters between neighbouring lines of a pattern, so they overlap by this part of the vision width
+    """
+    return vision_width(height) * (1 - overlap)
+
+
+def centroid(polygon):
+    """
+    Args:
+        polygon: a list of (latitude, longitude) vertices
+    Returns:
+        the (latitude, longitude) of the center of the vertices
+    """
+    return (sum(vertex[0] for vertex in polygon) / len(polygon),
+            sum(vertex[1] for vertex in polygon) / len(polygon))
+
+
+def boustrophedon(polygon, spacing, sweep_angle=0.0):
+    """
+    Sweep a polygon back and forth along parallel lines
+
+    Args:
+        polygon: a list of (latitude, longitude) vertices
+        spacing: the meters between the lines
+        sweep_angle: the direction of the lines in degrees, clockwise from north
+    Yields:
+        the (latitude, longitude) of both ends of every part of a line that is inside the polygon
+    """
+    origin_latitude, origin_longitude = polygon[0]
+    theta = math.radians(sweep_angle)
+    # u is along the lines, v is to the right of them
+    points = []
+    for latitude, longitude in polygon:
+        east, north = to_enu(origin_latitude, origin_longitude, latitude, longitude)
+        points.append((east * math.sin(theta) + north * math.cos(theta),
+                       east * math.cos(theta) - north * math.sin(theta)))
+    v_min = min(point[1] for point in points)
+    v_max = max(point[1] for point in points)
+    count = max(1, int(math.ceil((v_max - v_min) / spacing - 1e-6)))  # not an extra line for a rounding error
+    first = v_min + (v_max - v_min - (count - 1) * spacing) / 2  # the lines are centered on the polygon
+    forward = True
+    for line in xrange(count):
+        v = first + line * spacing
+        crossings = []
+        for k in xrange(len(points)):
+            (u1, v1), (u2, v2) = points[k - 1], points[k]
+            if (v1 <= v) != (v2 <= v):  # the edge crosses the line, a vertex on the line only counts once
+                crossings.append(u1 + (v - v1) * (u2 - u1) / (v2 - v1))
+        crossings.sort()
+        if not forward:
+            crossings.reverse()
+        for u in crossings[:len(crossings) // 2 * 2]:  # pairs of crossings are the parts inside the polygon
+            yield from_enu(origin_latitude, origin_longitude,
+                           u * math.sin(theta) + v * math.cos(theta), u * math.cos(theta) - v * math.sin(theta))
+        if crossings:
+            forward = not forward
+
+
+def expanding_square(datum, spacing, radius, sweep_angle=0.0):
+    """
+    Fly squares of growing size around the datum: legs of 1, 1, 2, 2, 3, 3, ... times the spacing,
+    turning right after every leg
+
+    Args:
+        datum: the (latitude, longitude) where the search starts
+        spacing: the meters between the sides of neighbouring squares
+        radius: the meters from the datum the search should reach
+        sweep_angle: the direction of the first leg in degrees, clockwise from north
+    Yields:
+        the (latitude, longitude) of the datum and of every turn
+    """
+    yield datum
+    east, north = 0.0, 0.0
+    heading = math.radians(sweep_angle)
+    leg = 1
+    while (leg - 1) * spacing <= 2 * radius:
+        for side in range(2):
+            east += leg * spacing * math.sin(heading)
+            north += leg * spacing * math.cos(heading)
+            heading += math.pi / 2
+            yield from_enu(datum[0], datum[1], east, north)
+        leg += 1
+
+
+def sector(datum, radius, sweep_angle=0.0, sectors=SECTORS):
+    """
+    Fly equilateral triangles from the datum: out, across and back, every triangle turned a part of the circle further
+
+    Args:
+        datum: the (latitude, longitude) where the search starts
+        radius: the length in meters of the legs
+        sweep_angle: the direction of the first leg in degrees, clockwise from north
+        sectors: the number of triangles
+    Yields:
+        the (latitude, longitude) of the datum and of every turn
+    """
+    yield datum
+    for k in xrange(sectors):
+        for turn in (0.0, 60.0):
+            heading = math.radians(sweep_angle + k * 360.0 / sectors + turn)
+            yield from_enu(datum[0], datum[1], radius * math.sin(heading), radius * math.cos(heading))
+        yield datum
+
+
+def generate(pattern, polygon, spacing, sweep_angle=0.0, datum=None):
+    """
+    Args:
+        pattern: one of PATTERNS
+        polygon: a list of (latitude, longitude) vertices of the area
+        spacing: the meters between neighbouring lines
+        sweep_angle: the direction of the lines or of the first leg in degrees, clockwise from north
+        datum: the (latitude, longitude) a search starts from, the center of the polygon if it is None
+    Returns:
+        a generator of the (latitude, longitude) of the waypoints
+    """
+    if pattern == 'boustrophedon':
+        return boustrophedon(polygon, spacing, sweep_angle)
+    if datum is None:
+        datum = centroid(polygon)
+    radius = max(distance(datum[0], datum[1], latitude, longitude) for latitude, longitude in polygon)
+    if pattern == 'expanding_square':
+        return expanding_square(datum, spacing, radius, sweep_angle)
+    if pattern == 'sector':
+        return sector(datum, radius, sweep_angle)
+    raise ValueError("FormatError: the pattern should be one of " + ", ".join(PATTERNS))
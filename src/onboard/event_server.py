@@ -0,0 +1,907 @@
+import json
+import errno
+import heapq
+import select
+import signal
+import struct
+import socket
+
+from global_classes import MessageCodes, monotonic, recv_exact
+from scheduler import DeadlineScheduler
+from heartbeat import Backoff, DeltaEncoder, datagram_frame, stream_frame
+from shared_telemetry import TelemetryReader
+from subscriptions import SubscriptionSchedule, read_fields, subscription_message
+from events import event_stream_request, read_event
+import wire_format
+from server import BroadcastThread, is_session_request
+from control_channel import CHANNEL_OPEN, is_priority_request, parse_control_response
+
+
+## @ingroup Onboard
+# @brief Base class for everything the EventServer waits on
+#
+# A handler wraps one non-blocking socket.
+# The event loop asks every handler whether it wants to read or write and calls it when its socket is ready.
+class Handler():
+    def __init__(self, loop, sock):
+        """
+        Args:
+            loop: EventServer instance
+            sock: a non-blocking socket
+        """
+        ## EventServer instance
+        self.loop = loop
+        ## the socket of this handler
+        self.sock = sock
+        ## boolean to indicate whether the handler is closed
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def readable(self):
+        return False
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        pass
+
+    def handle_write(self):
+        pass
+
+    ## remove the handler from the event loop and close its socket
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.loop.remove_handler(self)
+            self.sock.close()
+
+
+## @ingroup Onboard
+# @brief Accepts new connections from the workstation
+class Listener(Handler):
+    def readable(self):
+        return True
+
+    def handle_read(self):
+        while True:
+            try:
+                client, address = self.sock.accept()
+            except socket.error, err:
+                if err.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.loop.logger.debug("could not accept connection: {0}".format(err))
+                return
+            client.setblocking(0)
+            self.loop.broadcaster.stop()
+            self.loop.add_handler(WorkstationConnection(self.loop, client))
+
+
+## @ingroup Onboard
+# @brief One connection with the workstation
+#
+# The first request decides whether this is a one-shot connection or a persistent session,
+# the framing is the same as for the threaded Server.
+class WorkstationConnection(Handler):
+    def __init__(self, loop, sock):
+        Handler.__init__(self, loop, sock)
+        ## bytes received from the workstation that have not been handled yet
+        self.inbuf = ''
+        ## bytes that still have to be sent to the workstation
+        self.outbuf = ''
+        ## boolean, True when the connection is a persistent session
+        self.session = False
+        ## boolean, True when a one-shot request is being handled
+        self.waiting = False
+        ## boolean, True when the connection should be closed once everything has been sent
+        self.close_when_done = False
+
+    def readable(self):
+        return not (self.waiting or self.close_when_done)
+
+    def writable(self):
+        return bool(self.outbuf)
+
+    def handle_read(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ''
+        if not data:
+            self.close()
+            return
+        self.inbuf += data
+        self.process_requests()
+
+    ## handle all complete requests in the input buffer
+    def process_requests(self):
+        while self.readable():
+            header_size = 8 if self.session else 4
+            if len(self.inbuf) < header_size:
+                return
+            if self.session:
+                length, request_id = struct.unpack(">II", self.inbuf[:8])
+            else:
+                length = struct.unpack(">I", self.inbuf[:4])[0]
+            if len(self.inbuf) < header_size + length:
+                return
+            raw = self.inbuf[header_size:header_size + length]
+            self.inbuf = self.inbuf[header_size + length:]
+            self.loop.logger.debug(raw)
+
+            if self.session:
+                self.loop.control_call(raw, self.session_callback(request_id))
+            elif is_session_request(raw):
+                self.loop.logger.info("opening a persistent session")
+                self.session = True
+                self.outbuf += struct.pack(">H", MessageCodes.ACK)
+            else:
+                self.waiting = True
+                self.loop.control_call(raw, self.one_shot_callback)
+
+    def one_shot_callback(self, status_code, fields):
+        self.waiting = False
+        self.close_when_done = True
+        self.send(self.loop.create_response(status_code, fields))
+
+    def session_callback(self, request_id):
+        def callback(status_code, fields):
+            self.send(struct.pack(">I", request_id) + self.loop.create_response(status_code, fields))
+        return callback
+
+    def send(self, data):
+        if not self.closed:
+            self.outbuf += data
+
+    def handle_write(self):
+        try:
+            sent = self.sock.send(self.outbuf)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.loop.logger.debug("Error in server: {0}".format(err))
+            self.close()
+            return
+        self.outbuf = self.outbuf[sent:]
+        if not self.outbuf and self.close_when_done:
+            self.close()
+
+
+## @ingroup Onboard
+# @brief A persistent channel with the control module
+#
+# All requests of the EventServer are multiplexed on this connection, see ControlChannel for the framing.
+# When the response to a request arrives, its callback is called with the status code and the fields of the response.
+class ControlChannelHandler(Handler):
+    def __init__(self, loop, path="/tmp/uds_control"):
+        """
+        Args:
+            loop: EventServer instance
+            path: the path of the unix domain socket of the control module
+        """
+        Handler.__init__(self, loop, None)
+        self.closed = True  # the channel is opened on the first request
+        ## the path of the unix domain socket of the control module
+        self.path = path
+        ## bytes that still have to be sent to the control module
+        self.outbuf = ''
+        ## bytes received from the control module
+        self.inbuf = ''
+        ## dict with request ID: callback of the requests waiting for a response
+        self.callbacks = {}
+        ## the ID of the next request
+        self.next_id = 0
+
+    ## open the channel, this blocks, but only happens once unless the control module restarts
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(2.0)
+        try:
+            sock.connect(self.path)
+            sock.sendall(struct.pack(">I", len(CHANNEL_OPEN)) + CHANNEL_OPEN)
+            raw_response = recv_exact(sock, 4)
+        except socket.error:
+            sock.close()
+            raise
+        if raw_response is None or struct.unpack(">I", raw_response)[0] != MessageCodes.ACK:
+            sock.close()
+            raise socket.error("the control module refused to open a channel")
+        sock.setblocking(0)
+        self.sock = sock
+        self.closed = False
+        self.loop.add_handler(self)
+
+    def request(self, data, callback):
+        """
+        Args:
+            data: the message to send to the control module
+            callback: function that takes the status code and a list of fields
+        """
+        if self.closed:
+            try:
+                self.connect()
+            except socket.error, msg:
+                self.loop.logger.debug("could not connect to the control module: {0}".format(msg))
+                callback(MessageCodes.ERR, [])
+                return
+        request_id = self.next_id
+        self.next_id = (self.next_id + 1) & 0xffffffff
+        self.callbacks[request_id] = callback
+        self.outbuf += struct.pack(">II", len(data), request_id) + data
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return bool(self.outbuf)
+
+    def handle_write(self):
+        try:
+            sent = self.sock.send(self.outbuf)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.close()
+            return
+        self.outbuf = self.outbuf[sent:]
+
+    def handle_read(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ''
+        if not data:
+            self.loop.logger.debug("the control module closed the channel")
+            self.close()
+            return
+        self.inbuf += data
+        while len(self.inbuf) >= 8:
+            request_id, length = struct.unpack(">II", self.inbuf[:8])
+            if len(self.inbuf) < 8 + length:
+                return
+            response = parse_control_response(self.inbuf[8:8 + length])
+            self.inbuf = self.inbuf[8 + length:]
+            callback = self.callbacks.pop(request_id, None)
+            if callback is not None and response is not None:
+                callback(*response)
+
+    ## close the channel, the requests that are still waiting get an error
+    def close(self):
+        Handler.close(self)
+        callbacks = self.callbacks.values()
+        self.callbacks = {}
+        self.outbuf = ''
+        self.inbuf = ''
+        for callback in callbacks:
+            callback(MessageCodes.ERR, [])
+
+
+## @ingroup Onboard
+# @brief The event stream of the control module, see EventThread
+#
+# Every mission event is sent to the workstation as soon as it arrives, over the transport of the heartbeats.
+# When the stream breaks, it is opened again from the last event that was received.
+class EventStreamHandler(Handler):
+    def __init__(self, loop, path="/tmp/uds_control"):
+        """
+        Args:
+            loop: EventServer instance
+            path: the path of the unix domain socket of the control module
+        """
+        Handler.__init__(self, loop, None)
+        self.closed = True
+        ## the path of the unix domain socket of the control module
+        self.path = path
+        ## bytes received from the control module
+        self.inbuf = ''
+        ## the sequence number of the last event that was received
+        self.sequence = 0
+        ## Backoff instance, decides when to connect to the control module again
+        self.backoff = Backoff(initial=0.5, maximum=5.0)
+
+    ## open the stream, this blocks like ControlChannelHandler.connect
+    def connect(self):
+        if self.loop.quit:
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(2.0)
+        try:
+            sock.connect(self.path)
+            request = event_stream_request(self.sequence)
+            sock.sendall(struct.pack(">I", len(request)) + request)
+            raw_response = recv_exact(sock, 4)
+            if raw_response is None or struct.unpack(">I", raw_response)[0] != MessageCodes.ACK:
+                raise socket.error("the control module refused to open an event stream")
+        except socket.error, msg:
+            sock.close()
+            self.loop.logger.debug("could not open the event stream: {0}".format(msg))
+            self.loop.call_later(self.backoff.failure(), self.connect)
+            return
+        self.backoff.success()
+        sock.setblocking(0)
+        self.sock = sock
+        self.closed = False
+        self.inbuf = ''
+        self.loop.add_handler(self)
+
+    def readable(self):
+        return True
+
+    def handle_read(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ''
+        if not data:
+            self.loop.logger.debug("the control module closed the event stream")
+            self.close()
+            self.loop.call_later(self.backoff.failure(), self.connect)
+            return
+        self.inbuf += data
+        while len(self.inbuf) >= 4:
+            length = struct.unpack(">I", self.inbuf[:4])[0]
+            if len(self.inbuf) < 4 + length:
+                return
+            data = self.inbuf[4:4 + length]
+            self.inbuf = self.inbuf[4 + length:]
+            self.loop.send_event(data)
+
+
+## @ingroup Onboard
+# @brief Sends heartbeats to the workstation over TCP
+#
+# With the 'connect' transport a sender is created for every heartbeat and closes after it was sent,
+# with the 'stream' transport one persistent sender carries all heartbeats.
+class HeartBeatSender(Handler):
+    ## when this many bytes are still waiting to be sent, new heartbeats are dropped
+    max_backlog = 65536
+
+    def __init__(self, loop, address, data, persistent=False):
+        """
+        Args:
+            loop: EventServer instance
+            address: tuple with the IP address and port of the workstation
+            data: the heartbeat, with the length prefixes
+            persistent: keep the connection open after the heartbeat was sent
+        """
+        Handler.__init__(self, loop, socket.socket(socket.AF_INET, socket.SOCK_STREAM))
+        self.sock.setblocking(0)
+        ## bytes that still have to be sent to the workstation
+        self.outbuf = data
+        ## boolean, keep the connection open after the heartbeat was sent
+        self.persistent = persistent
+        ## boolean, True when the connection has been set up
+        self.connected = False
+        err = self.sock.connect_ex(address)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.fail()
+
+    def readable(self):
+        return self.persistent and self.connected  # to notice that the workstation closed the connection
+
+    def writable(self):
+        return not self.connected or bool(self.outbuf)
+
+    def handle_read(self):
+        try:
+            data = self.sock.recv(4096)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ''
+        if not data:
+            self.fail()
+
+    def handle_write(self):
+        if not self.connected:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err != 0:
+                self.fail()
+                return
+            self.connected = True
+            self.loop.heartbeat_backoff.success()
+        try:
+            sent = self.sock.send(self.outbuf)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.fail()
+            return
+        self.outbuf = self.outbuf[sent:]
+        if not self.outbuf and not self.persistent:
+            self.close()
+
+    ## queue another heartbeat on a persistent connection
+    def send(self, data):
+        if len(self.outbuf) < self.max_backlog:
+            self.outbuf += data
+        elif self.loop.heartbeat_delta is not None:  # the workstation can't keep up, and it will miss this delta
+            self.loop.heartbeat_delta.request_keyframe()
+
+    def fail(self):
+        if self.loop.heartbeat_delta is not None:
+            self.loop.heartbeat_delta.request_keyframe()
+        delay = self.loop.heartbeat_backoff.failure()
+        self.loop.logger.debug("could not reach the workstation, trying again in {0}s".format(delay))
+        self.close()
+
+
+## @ingroup Onboard
+# @brief Broadcasts the 'hello' or 'fail' message until the workstation answers
+#
+# The BroadcastThread is only used for its configuration and messages, it is never started.
+class Broadcaster(Handler):
+    def __init__(self, loop, broadcast_thread):
+        """
+        Args:
+            loop: EventServer instance
+            broadcast_thread: BroadcastThread instance with the configuration of the drone
+        """
+        Handler.__init__(self, loop, None)
+        ## BroadcastThread instance
+        self.config = broadcast_thread
+        ## the message that is being broadcast
+        self.message = None
+        ## boolean to indicate whether to stop broadcasting or not
+        self.quit = False
+
+    def start(self):
+        self.loop.call_later(0, self.check_control_module)
+
+    ## poll the control module state until it is known, then start broadcasting
+    def check_control_module(self):
+        if self.quit:
+            return
+        state = self.config.control_module_state()
+        if state is None:
+            self.loop.call_later(2, self.check_control_module)
+            return
+        if state:
+            self.loop.logger.info("the control module is now ready")
+            self.message = self.config.create_message("hello")
+        else:
+            self.loop.logger.info("the control module has failed to start up properly")
+            self.message = self.config.create_message("fail")
+
+        self.sock = socket.socket(socket.AF_INET,        # Internet
+                                  socket.SOCK_DGRAM)     # UDP
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.setblocking(0)
+        self.sock.bind(('', 0))  # OS will select available port
+        self.loop.add_handler(self)
+        self.broadcast()
+
+    def broadcast(self):
+        if self.quit:
+            return
+        try:
+            self.sock.sendto(self.message, (self.config.broadcast_address, self.config.helloPort))
+            self.loop.logger.debug("broadcasting to " + str(self.config.broadcast_address) + ":" + str(self.config.helloPort))
+        except socket.error, msg:
+            self.loop.logger.debug("could not broadcast: {0}".format(msg))
+        self.loop.call_later(10, self.broadcast)
+
+    def readable(self):
+        return True
+
+    def handle_read(self):
+        try:
+            raw_response, address = self.sock.recvfrom(1024)
+            response = json.loads(raw_response)
+        except (socket.error, ValueError):
+            return
+        if isinstance(response, dict) and response.get('message_type') == 'hello':
+            self.loop.logger.debug("reply received, stopping broadcast")
+            self.stop()
+
+    def stop(self):
+        if not self.quit:
+            self.loop.logger.info("stopping the broadcast")
+            self.quit = True
+            if self.sock is not None:
+                self.close()
+
+
+## @ingroup Onboard
+# @brief Single-threaded alternative for the Server
+#
+# Instead of a thread per request, a HeartBeatThread and a BroadcastThread,
+# this server multiplexes the workstation connections, the calls to the control module,
+# the hello broadcast and the heartbeats on one select() loop.
+# The messages that are exchanged with the workstation and the control module are the same.
+class EventServer():
+    def __init__(self, logger, SIM):
+        """
+        Initiate the server
+
+        Args:
+            logger: logging.Logger instance
+            SIM: boolean, is this is a simulation or not
+        """
+        ## boolean, is this is a simulation or not
+        self.SIM = SIM
+        ## logger instance
+        self.logger = logger
+
+        # Drone specific fields
+        if SIM:
+            ## the IP address of the drone
+            self.HOST = "127.0.0.1"
+        else:
+            ## the IP address of the drone
+            self.HOST = "10.1.1.10"
+
+        ## the port on which the drone will listen to requests
+        self.PORT = 6330
+        ## boolean to indicate whether to stop the server or not
+        self.quit = False
+        ## the Handler instances the loop is waiting on
+        self.handlers = set()
+        ## heap with (deadline, counter, function) tuples, the deadlines are on the monotonic clock
+        self.timers = []
+        ## counter to keep the order of timers with the same deadline
+        self.timer_count = 0
+        ## ControlChannelHandler instance, all requests to the control module go over this channel
+        self.control_channel = ControlChannelHandler(self)
+        ## ControlChannelHandler instance that only carries priority requests, like 'emergency'
+        self.priority_channel = ControlChannelHandler(self)
+
+        ## the IP address of the workstation
+        self.workstation_ip = None
+        ## the port where the workstation listens for heartbeats
+        self.workstation_port = None
+        ## DeadlineScheduler instance that decides when the next heartbeat is sent
+        self.heartbeat_scheduler = DeadlineScheduler(period=1.0)
+        ## boolean, True while heartbeats are being sent
+        self.heartbeat_running = False
+        ## incremented every time the heartbeats are (re)started, so a timer of an older run does nothing
+        self.heartbeat_generation = 0
+        ## one of heartbeat.TRANSPORTS
+        self.heartbeat_transport = 'connect'
+        ## the persistent HeartBeatSender of the 'stream' transport
+        self.heartbeat_stream = None
+        ## the UDP socket of the 'udp' transport
+        self.heartbeat_socket = None
+        ## the sequence number of the next heartbeat datagram
+        self.heartbeat_sequence = 0
+        ## Backoff instance, decides when to try again after the workstation could not be reached
+        self.heartbeat_backoff = Backoff()
+        ## DeltaEncoder instance when the workstation asked for delta heartbeats, None otherwise
+        self.heartbeat_delta = None
+        ## the heartbeat request for the control module, in the encoding the workstation wants the heartbeats in
+        self.heartbeat_request = wire_format.dumps({'message_type': 'status', 'message': 'heartbeat'})
+        ## the encoding the workstation wants the heartbeats in
+        self.heartbeat_encoding = 'json'
+        ## TelemetryReader instance, the heartbeats are created from the telemetry the control module publishes
+        self.telemetry_reader = TelemetryReader()
+        ## SubscriptionSchedule instance of the fields the workstation subscribed to, None if there is no subscription
+        self.subscription = None
+        ## incremented every time the subscription changes, so a timer of an older subscription does nothing
+        self.subscription_generation = 0
+        ## EventStreamHandler instance, forwards the mission events
+        self.event_stream = EventStreamHandler(self)
+
+        ## handle signals to exit gracefully
+        signal.signal(signal.SIGTERM, self.signal_handler)
+        ## handle signals to exit gracefully
+        signal.signal(signal.SIGINT, self.signal_handler)
+
+        self.serversocket = socket.socket(socket.AF_INET,      # Internet
+                                          socket.SOCK_STREAM)  # TCP
+        self.serversocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        ## Broadcaster instance
+        self.broadcaster = Broadcaster(self, BroadcastThread(self.logger, self.HOST, self.SIM, self.PORT))
+        try:
+            self.serversocket.bind((self.HOST, self.PORT))
+            self.serversocket.listen(8)
+            self.serversocket.setblocking(0)
+            self.add_handler(Listener(self, self.serversocket))
+        except socket.error, msg:
+            self.logger.debug("Could not bind to port: {0}, quitting".format(msg))
+            self.close()
+
+    ## Intercept the signal that we should quit, so we can do it cleanly
+    def signal_handler(self, signal, frame):
+        self.close()
+        self.logger.debug("exiting the process")
+
+    ## Run the event loop until the server is closed
+    def run(self):
+        self.broadcaster.start()
+        self.call_later(0, self.event_stream.connect)
+        while not self.quit:
+            timeout = 2.0
+            if self.timers:
+                timeout = max(0.0, min(timeout, self.timers[0][0] - monotonic()))
+            readers = [handler for handler in self.handlers if handler.readable()]
+            writers = [handler for handler in self.handlers if handler.writable()]
+            try:
+                readable, writable, exceptional = select.select(readers, writers, [], timeout)
+            except select.error, err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+            for handler in readable:
+                if not handler.closed:
+                    handler.handle_read()
+            for handler in writable:
+                if not handler.closed:
+                    handler.handle_write()
+            self.run_timers()
+
+        for handler in list(self.handlers):
+            handler.close()
+        self.telemetry_reader.close()
+
+    def close(self):
+        self.quit = True
+        self.logger.info("the server is exiting")
+
+    def add_handler(self, handler):
+        self.handlers.add(handler)
+
+    def remove_handler(self, handler):
+        self.handlers.discard(handler)
+
+    def call_later(self, delay, function):
+        """
+        Call a function from the event loop after some time
+
+        Args:
+            delay: seconds to wait
+            function: function without arguments
+        """
+        self.timer_count += 1
+        heapq.heappush(self.timers, (monotonic() + delay, self.timer_count, function))
+
+    def run_timers(self):
+        now = monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            deadline, count, function = heapq.heappop(self.timers)
+            function()
+
+    def control_call(self, data, callback):
+        """
+        Send a message to the control module without blocking
+
+        Args:
+            data: the message to send to the control module
+            callback: function that takes the status code and a list of fields of the response
+        """
+        if is_priority_request(data):  # don't let it wait behind the requests on the other channel
+            self.priority_channel.request(data, callback)
+        else:
+            self.control_channel.request(data, callback)
+
+    def create_response(self, status_code, fields):
+        """
+        Create the bytes that will be sent to the workstation, from a response of the control module
+
+        Args:
+            status_code: the MessageCodes code the control module answered with
+            fields: the length-prefixed fields that followed the code
+        Returns:
+            the response for the workstation
+        """
+        self.logger.debug("response has statuscode {0}".format(status_code))
+        if status_code in (MessageCodes.STATUS_RESPONSE, MessageCodes.JOB_ACCEPTED):
+            response = fields[0]
+            return struct.pack(">H", status_code) + struct.pack(">H", len(response) + 4) + \
+                struct.pack(">I", len(response)) + response
+        if status_code == MessageCodes.START_HEARTBEAT:
+            try:
+                options = json.loads(fields[2])
+                self.configure_heartbeat(fields[0], int(fields[1]), options['rate'], options['transport'],
+                                         options['delta'], options['encoding'])
+            except (ValueError, KeyError):
+                return struct.pack(">H", MessageCodes.ERR)
+            return struct.pack(">H", MessageCodes.ACK)
+        if status_code == MessageCodes.HEARTBEAT_RESYNC:
+            if self.heartbeat_delta is not None:
+                self.heartbeat_delta.request_keyframe()
+            return struct.pack(">H", MessageCodes.ACK)
+        if status_code == MessageCodes.SUBSCRIBE:
+            try:
+                subscription = json.loads(fields[0])
+                self.configure_subscription(subscription['fields'], subscription['max_bandwidth'])
+            except (ValueError, KeyError):
+                return struct.pack(">H", MessageCodes.ERR)
+            return struct.pack(">H", MessageCodes.ACK)
+        return struct.pack(">H", status_code)
+
+    def configure_heartbeat(self, host, port, rate=1.0, transport='connect', delta=None, encoding='json'):
+        """
+        Start sending heartbeats to the workstation, or change where and how often they are sent
+
+        Args:
+            host: the IP address of the workstation
+            port: the port where the workstation listens for heartbeats
+            rate: how many heartbeats should be sent per second
+            transport: one of heartbeat.TRANSPORTS
+            delta: None to send full heartbeats, or a dict with the 'keyframe_interval' and 'thresholds'
+                   to send delta heartbeats
+            encoding: one of wire_format.ENCODINGS
+        """
+        self.close_heartbeat_transport()
+        self.workstation_ip = host
+        self.workstation_port = port
+        self.logger.debug("heartbeat IP address: {0}".format(self.workstation_ip))
+        self.logger.debug("heartbeat port: {0}".format(self.workstation_port))
+        self.logger.info("hearbeats are being sent to the workstation at {0} Hz over '{1}'".format(rate, transport))
+        self.heartbeat_transport = transport
+        self.heartbeat_delta = None
+        if delta is not None:
+            self.heartbeat_delta = DeltaEncoder(delta['keyframe_interval'], delta['thresholds'], encoding)
+        # the control module answers in the encoding of the request
+        self.heartbeat_request = wire_format.dumps({'message_type': 'status', 'message': 'heartbeat'}, encoding)
+        self.heartbeat_encoding = encoding
+        if transport == 'udp':
+            self.heartbeat_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.heartbeat_socket.setblocking(0)
+            self.heartbeat_sequence = 0
+        self.heartbeat_backoff.success()
+        self.heartbeat_scheduler.set_period(1.0 / rate)
+        self.heartbeat_running = True
+        self.heartbeat_generation += 1
+        self.heartbeat_scheduler.start()
+        generation = self.heartbeat_generation
+        self.call_later(0, lambda: self.heartbeat(generation))
+
+    def heartbeat(self, generation):
+        """
+        Send a heartbeat, created from the shared telemetry or requested from the control module,
+        and schedule the next one
+
+        Args:
+            generation: the heartbeat_generation this timer belongs to
+        """
+        if not self.heartbeat_running or generation != self.heartbeat_generation:
+            return
+        self.heartbeat_scheduler.tick()
+        if self.heartbeat_backoff.ready():  # else the workstation could not be reached a moment ago
+            response = self.telemetry_reader.heartbeat(self.heartbeat_encoding)
+            if response is not None:
+                self.send_heartbeat(MessageCodes.STATUS_RESPONSE, [response])
+            else:  # there is no recent telemetry in the shared memory
+                self.control_call(self.heartbeat_request, self.send_heartbeat)
+        self.call_later(self.heartbeat_scheduler.next_delay(), lambda: self.heartbeat(generation))
+
+    def send_heartbeat(self, status_code, fields):
+        if not self.heartbeat_running or status_code != MessageCodes.STATUS_RESPONSE:
+            return
+        response = fields[0]
+        self.logger.debug("heartbeat: {0}".format(response))
+        if self.heartbeat_delta is not None:
+            response = self.heartbeat_delta.encode(response)
+        self.send_to_workstation(response)
+
+    def send_event(self, data):
+        """
+        Args:
+            data: a mission event in JSON, as it was received from the control module
+        """
+        try:
+            event = read_event(data)
+        except ValueError, msg:  # the frame is dropped, the length prefix keeps the stream in sync
+            self.logger.warning("dropped a malformed event {0!r}: {1}".format(data, msg))
+            return
+        self.event_stream.sequence = event['sequence']
+        self.logger.debug("event: {0}".format(data))
+        if not self.heartbeat_running:
+            return  # the workstation can ask for the events it missed with a status request
+        if self.heartbeat_encoding != 'json':
+            data = wire_format.dumps(event, self.heartbeat_encoding)
+        self.send_to_workstation(data)
+
+    def send_to_workstation(self, payload):
+        """
+        Send a heartbeat or another message to the workstation, over the transport of the heartbeats
+
+        Args:
+            payload: the message
+        """
+        address = (self.workstation_ip, self.workstation_port)
+        if self.heartbeat_transport == 'udp':
+            try:
+                self.heartbeat_socket.sendto(datagram_frame(self.heartbeat_sequence, payload), address)
+            except socket.error, msg:
+                self.logger.debug("could not send to the workstation: {0}".format(msg))
+            self.heartbeat_sequence += 1
+        elif self.heartbeat_transport == 'stream':
+            if self.heartbeat_stream is None or self.heartbeat_stream.closed:
+                self.heartbeat_stream = HeartBeatSender(self, address, stream_frame(payload), persistent=True)
+                if not self.heartbeat_stream.closed:
+                    self.add_handler(self.heartbeat_stream)
+            else:
+                self.heartbeat_stream.send(stream_frame(payload))
+        else:
+            sender = HeartBeatSender(self, address, stream_frame(payload))
+            if not sender.closed:
+                self.add_handler(sender)
+
+    def configure_subscription(self, fields, max_bandwidth):
+        """
+        Push fields to the workstation at their own rate, over the transport of the heartbeats
+
+        Args:
+            fields: dict with the rate per field in Hz, an empty dict stops the subscription
+            max_bandwidth: the bytes per second all pushes together may use
+        """
+        if not self.heartbeat_running:
+            raise ValueError("the workstation should send its configuration before subscribing")
+        if self.subscription is not None:
+            self.logger.debug("subscription statistics: {0}".format(self.subscription.stats()))
+        self.subscription_generation += 1
+        if not fields:
+            self.logger.info("stopping the subscription")
+            self.subscription = None
+            return
+        self.logger.info("pushing {0} within {1} bytes per second".format(fields, max_bandwidth))
+        self.subscription = SubscriptionSchedule(fields, max_bandwidth)
+        generation = self.subscription_generation
+        self.call_later(0, lambda: self.push_subscription(generation))
+
+    def push_subscription(self, generation):
+        """
+        Push the subscribed fields that are due and schedule the next push
+
+        Args:
+            generation: the subscription_generation this timer belongs to
+        """
+        if self.subscription is None or generation != self.subscription_generation:
+            return
+        fields = self.subscription.due(monotonic())
+        if fields and self.heartbeat_backoff.ready():  # else the workstation could not be reached a moment ago
+            latest = self.telemetry_reader.latest()
+            if latest is None:  # ask the control module for all fields at once
+                request = json.dumps({'message_type': 'status', 'message': [{'key': field} for field in fields]})
+                self.control_call(request, lambda status_code, response:
+                                  self.subscription_response(generation, fields, status_code, response))
+                return  # the next push is scheduled when the control module answers
+            self.send_subscription(fields, subscription_message(read_fields(latest[0], latest[1], fields),
+                                                                self.heartbeat_encoding))
+        self.schedule_subscription(generation)
+
+    def subscription_response(self, generation, fields, status_code, response):
+        if self.subscription is None or generation != self.subscription_generation:
+            return
+        if status_code == MessageCodes.STATUS_RESPONSE:
+            values = json.loads(response[0])
+            self.send_subscription(fields, subscription_message(dict((field, values.get(field)) for field in fields),
+                                                                self.heartbeat_encoding))
+        self.schedule_subscription(generation)
+
+    def schedule_subscription(self, generation):
+        delay = self.subscription.next_delay(monotonic())
+        if delay <= 0:  # the fields are still due because they could not be sent, try again a bit later
+            delay = 0.1
+        self.call_later(delay, lambda: self.push_subscription(generation))
+
+    def send_subscription(self, fields, message):
+        if self.subscription.admit(fields, len(message), monotonic()):
+            self.send_to_workstation(message)
+
+    ## close the connection or socket of the heartbeat transport
+    def close_heartbeat_transport(self):
+        if self.heartbeat_stream is not None:
+            self.heartbeat_stream.close()
+            self.heartbeat_stream = None
+        if self.heartbeat_socket is not None:
+            self.heartbeat_socket.close()
+            self.heartbeat_socket = None
+
+    ## stop sending heartbeats
+    def stop_heartbeats(self):
+        if self.heartbeat_running:
+            self.logger.info("stopping the heartbeats")
+            self.logger.debug("heartbeat statistics: {0}".format(self.heartbeat_scheduler.stats()))
+            self.heartbeat_running = False
+            self.close_heartbeat_transport()
@@ -0,0 +1,153 @@
+import json
+import struct
+import threading
+from collections import deque
+
+import wire_format
+from global_classes import create_timestamp, monotonic
+
+## the types of mission events
+WAYPOINT_REACHED = 'waypoint_reached'
+TAKEOFF_COMPLETE = 'takeoff_complete'
+MODE_CHANGED = 'mode_changed'
+HALTED = 'halted'
+RTH_STARTED = 'rth_started'
+LANDED = 'landed'
+LOW_BATTERY = 'low_battery'
+PATH_OPTIMIZED = 'path_optimized'
+PATTERN_FAILED = 'pattern_failed'
+EVENT_TYPES = (WAYPOINT_REACHED, TAKEOFF_COMPLETE, MODE_CHANGED, HALTED, RTH_STARTED, LANDED, LOW_BATTERY,
+               PATH_OPTIMIZED, PATTERN_FAILED)
+
+## the battery level (in %) below which a LOW_BATTERY event is sent
+LOW_BATTERY_LEVEL = 20
+## the battery level has to rise this much above LOW_BATTERY_LEVEL before another LOW_BATTERY event can be sent
+LOW_BATTERY_HYSTERESIS = 5
+
+
+def event_stream_request(since=0):
+    """
+    Args:
+        since: the sequence number of the last event the Server has seen
+    Returns:
+        the request that turns a new connection with the control module into an event stream
+    """
+    return json.dumps({'message_type': 'events', 'message': 'stream', 'since': since})
+
+
+def is_event_stream_request(raw):
+    """
+    Check whether a request asks to open an event stream
+
+    Args:
+        raw: the first request that was received on a new connection
+    Returns:
+        the packet if the connection should be kept open as an event stream, None otherwise
+    """
+    if 'events' not in raw:  # cheap check, so we don't parse every request twice
+        return None
+    try:
+        packet = wire_format.loads(raw)
+    except ValueError:
+        return None
+    if isinstance(packet, dict) and packet.get('message_type') == 'events' and packet.get('message') == 'stream':
+        return packet
+    return None
+
+
+def event_frame(event):
+    """
+    Frame an event for the event stream between the control module and the Server
+
+    Args:
+        event: dict with the event
+    Returns:
+        the length of the event ('>I') and the event in JSON
+    """
+    data = json.dumps(event)
+    return struct.pack(">I", len(data)) + data
+
+
+def read_event(data):
+    """
+    Parse an event of the event stream, the inverse of event_frame() without the length
+
+    Args:
+        data: the event in JSON
+    Returns:
+        dict with the event
+    Raises:
+        ValueError: if data is not an event with a sequence number
+    """
+    event = json.loads(data)
+    if not isinstance(event, dict) or not isinstance(event.get('sequence'), (int, long)):
+        raise ValueError("an event should be an object with a sequence number")
+    return event
+
+
+## @ingroup Onboard
+# @brief Keeps the latest mission events and wakes up whoever waits for a new one
+#
+# Every event gets a sequence number, a 'monotonic' timestamp (to measure the time between events)
+# and a 'timestamp' like every other message for the workstation.
+# The Solo and the NavigationThread emit the events, an event stream sends them to the Server as they happen,
+# and a workstation that missed some can ask for them with a 'events' status request.
+class EventLog():
+    def __init__(self, size=256):
+        """
+        Args:
+            size: the amount of events that are kept
+        """
+        ## the latest events, the oldest ones are dropped
+        self.events = deque(maxlen=size)
+        ## the sequence number of the last event
+        self.sequence = 0
+        ## condition that is notified on every new event
+        self.condition = threading.Condition()
+
+    def emit(self, event_type, **details):
+        """
+        Args:
+            event_type: one of EVENT_TYPES
+            details: fields that are added to the event, e.g. waypoint_order=3
+        Returns:
+            dict with the event
+        """
+        event = dict(details)
+        with self.condition:
+            self.sequence += 1
+            event.update({'message_type': 'event', 'event': event_type, 'sequence': self.sequence,
+                          'monotonic': monotonic(), 'timestamp': create_timestamp()})
+            self.events.append(event)
+            self.condition.notify_all()
+        return event
+
+    def since(self, sequence):
+        """
+        Args:
+            sequence: the sequence number of the last event that was seen, a number larger than the
+                      last sequence number (e.g. from before a restart of the control module) counts as 0
+        Returns:
+            list with the events after it that are still kept
+        """
+        with self.condition:
+            if sequence > self.sequence:
+                sequence = 0
+            return [event for event in self.events if event['sequence'] > sequence]
+
+    def wait(self, sequence, timeout=None):
+        """
+        Wait until there are events after 'sequence'
+
+        Args:
+            sequence: the sequence number of the last event that was seen
+            timeout: the most seconds to wait
+        Returns:
+            list with the new events, empty if the timeout expired
+        """
+        with self.condition:
+            if sequence > self.sequence:
+                sequence = 0
+            if self.sequence == sequence:
+                self.condition.wait(timeout)
+            return [event for event in self.events if event['sequence'] > sequence]
@@ -0,0 +1,178 @@
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:  # the batch functions work on lists without NumPy, only slower
+    numpy = None
+
+## @defgroup Geodesy
+# @ingroup Onboard
+#
+# Distances, bearings and offsets between latitudes and longitudes (in degrees) on a spherical earth.
+# The sphere is off by at most 0.5% from the WGS84 ellipsoid, much less than the GPS error over the distances we fly.
+#
+# to_enu() projects a location onto the local east-north plane of an origin, like the autopilot does for its
+# local position. A difference in longitude is shorter than the same difference in latitude by cos(latitude),
+# at our sites near 51 degrees north an east-west degree is only 0.63 times a north-south degree.
+#
+# Every function has a batch_ version that takes sequences of locations (a list, an array.array or a NumPy array),
+# it returns NumPy arrays when NumPy is installed and lists otherwise.
+
+## the mean radius of the earth in meters
+EARTH_RADIUS = 6371008.8
+## the meters in a degree of latitude
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+
+def distance(latitude1, longitude1, latitude2, longitude2):
+    """
+    Returns:
+        the great-circle distance in meters between the two locations
+    """
+    phi1 = math.radians(latitude1)
+    phi2 = math.radians(latitude2)
+    sin_dphi = math.sin((phi2 - phi1) / 2)
+    sin_dlambda = math.sin(math.radians(longitude2 - longitude1) / 2)
+    a = sin_dphi * sin_dphi + math.cos(phi1) * math.cos(phi2) * sin_dlambda * sin_dlambda
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(1.0, a)))
+
+
+def bearing(latitude1, longitude1, latitude2, longitude2):
+    """
+    Returns:
+        the initial bearing in degrees from the first location to the second one, clockwise from north in [0, 360)
+    """
+    phi1 = math.radians(latitude1)
+    phi2 = math.radians(latitude2)
+    dlambda = math.radians(longitude2 - longitude1)
+    y = math.sin(dlambda) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlambda)
+    return math.degrees(math.atan2(y, x)) % 360.0
+
+
+def offset(latitude, longitude, meters, heading):
+    """
+    Args:
+        meters: the distance to travel
+        heading: the bearing in degrees to travel in, clockwise from north
+    Returns:
+        the (latitude, longitude) that is reached from the location along the great circle
+    """
+    phi1 = math.radians(latitude)
+    delta = meters / EARTH_RADIUS
+    theta = math.radians(heading)
+    sin_phi2 = math.sin(phi1) * math.cos(delta) + math.cos(phi1) * math.sin(delta) * math.cos(theta)
+    phi2 = math.asin(max(-1.0, min(1.0, sin_phi2)))
+    dlambda = math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi1),
+                         math.cos(delta) - math.sin(phi1) * sin_phi2)
+    return math.degrees(phi2), (longitude + math.degrees(dlambda) + 540.0) % 360.0 - 180.0
+
+
+def to_enu(origin_latitude, origin_longitude, latitude, longitude):
+    """
+    Project a location onto the local plane of an origin, for locations within a few kilometers of it
+
+    Returns:
+        tuple with the meters (east, north) of the location from the origin
+    """
+    north = (latitude - origin_latitude) * METERS_PER_DEGREE
+    east = (longitude - origin_longitude) * METERS_PER_DEGREE * math.cos(math.radians(origin_latitude))
+    return east, north
+
+
+def from_enu(origin_latitude, origin_longitude, east, north):
+    """
+    The inverse of to_enu()
+
+    Returns:
+        the (latitude, longitude) that is 'east' and 'north' meters from the origin
+    """
+    latitude = origin_latitude + north / METERS_PER_DEGREE
+    longitude = origin_longitude + east / (METERS_PER_DEGREE * math.cos(math.radians(origin_latitude)))
+    return latitude, longitude
+
+
+def as_array(values):
+    """
+    Returns:
+        a NumPy array of floats with the values, an array.array of doubles (e.g. a WayPointQueue column) is shared
+    """
+    if isinstance(values, array) and values.typecode == 'd':
+        return numpy.frombuffer(values, dtype=float)
+    return numpy.asarray(values, dtype=float)
+
+
+def batch_distance(latitude, longitude, latitudes, longitudes):
+    """
+    Returns:
+        the great-circle distance in meters from the location to each of the locations
+    """
+    if numpy is None:
+        return [distance(latitude, longitude, lat, lon) for lat, lon in zip(latitudes, longitudes)]
+    phi1 = math.radians(latitude)
+    phi2 = numpy.radians(as_array(latitudes))
+    sin_dphi = numpy.sin((phi2 - phi1) / 2)
+    sin_dlambda = numpy.sin(numpy.radians(as_array(longitudes) - longitude) / 2)
+    a = sin_dphi * sin_dphi + math.cos(phi1) * numpy.cos(phi2) * sin_dlambda * sin_dlambda
+    return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(1.0, a)))
+
+
+def batch_bearing(latitude, longitude, latitudes, longitudes):
+    """
+    Returns:
+        the initial bearing in degrees from the location to each of the locations
+    """
+    if numpy is None:
+        return [bearing(latitude, longitude, lat, lon) for lat, lon in zip(latitudes, longitudes)]
+    phi1 = math.radians(latitude)
+    phi2 = numpy.radians(as_array(latitudes))
+    dlambda = numpy.radians(as_array(longitudes) - longitude)
+    y = numpy.sin(dlambda) * numpy.cos(phi2)
+    x = math.cos(phi1) * numpy.sin(phi2) - math.sin(phi1) * numpy.cos(phi2) * numpy.cos(dlambda)
+    return numpy.degrees(numpy.arctan2(y, x)) % 360.0
+
+
+def batch_offset(latitude, longitude, meters, headings):
+    """
+    Args:
+        meters: a sequence with the distance to travel for every location
+        headings: a sequence with the bearing to travel in for every location
+    Returns:
+        a tuple with the latitudes and the longitudes that are reached from the location
+    """
+    if numpy is None:
+        locations = [offset(latitude, longitude, m, heading) for m, heading in zip(meters, headings)]
+        return [location[0] for location in locations], [location[1] for location in locations]
+    phi1 = math.radians(latitude)
+    delta = as_array(meters) / EARTH_RADIUS
+    theta = numpy.radians(as_array(headings))
+    sin_phi2 = math.sin(phi1) * numpy.cos(delta) + math.cos(phi1) * numpy.sin(delta) * numpy.cos(theta)
+    phi2 = numpy.arcsin(numpy.clip(sin_phi2, -1.0, 1.0))
+    dlambda = numpy.arctan2(numpy.sin(theta) * numpy.sin(delta) * math.cos(phi1),
+                            numpy.cos(delta) - math.sin(phi1) * sin_phi2)
+    return numpy.degrees(phi2), (longitude + numpy.degrees(dlambda) + 540.0) % 360.0 - 180.0
+
+
+def batch_to_enu(origin_latitude, origin_longitude, latitudes, longitudes):
+    """
+    Returns:
+        a tuple with the meters east and the meters north of each of the locations from the origin
+    """
+    if numpy is None:
+        scale = METERS_PER_DEGREE * math.cos(math.radians(origin_latitude))
+        return ([(lon - origin_longitude) * scale for lon in longitudes],
+                [(lat - origin_latitude) * METERS_PER_DEGREE for lat in latitudes])
+    return to_enu(origin_latitude, origin_longitude, as_array(latitudes), as_array(longitudes))
+
+
+def batch_from_enu(origin_latitude, origin_longitude, easts, norths):
+    """
+    Returns:
+        a tuple with the latitudes and the longitudes of the locations 'easts' and 'norths' meters from the origin
+    """
+    if numpy is None:
+        scale = METERS_PER_DEGREE * math.cos(math.radians(origin_latitude))
+        return ([origin_latitude + north / METERS_PER_DEGREE for north in norths],
+                [origin_longitude + east / scale for east in easts])
+    return from_enu(origin_latitude, origin_longitude, as_array(easts), as_array(norths))
@@ -1,5 +1,11 @@
+import time
+import ctypes
+import ctypes.util
 from json import JSONEncoder
-from threading import RLock
+from threading import RLock, Condition
+from array import array
+from collections import namedtuple, deque
+from itertools import islice
 
 ## @defgroup Global_classes
 # @ingroup Onboard
@@ -25,18 +31,82 @@ def print_help(filename):
           '\t\t\t   \'file\', which prints the logs to a file, a filename needs to be specified'
     print '  -f --file: \t\t Specify the name of the logfile'
     print '  -s --simulate: \t Indicate that a simulated vehicle is used'
+    if filename == 'server.py':
+        print '  -e --event-loop: \t Handle all connections on a single-threaded event loop'
     print '  -h --help: \t\t Display this information'
 
 
+def recv_exact(sock, length):
+    """
+    Receive exactly 'length' bytes from a stream socket
+
+    Args:
+        sock: the socket to read from
+        length: the amount of bytes that should be read
+    Returns:
+        the received bytes, or None if the connection was closed before all bytes arrived
+    """
+    data = ''
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+## the clock_gettime() id of the monotonic clock on Linux
+CLOCK_MONOTONIC = 1
+
+
+## struct timespec, as used by clock_gettime()
+class Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+try:
+    clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c')).clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+except (OSError, AttributeError, TypeError):
+    clock_gettime = None  # not on Linux, monotonic() falls back to time.time()
+
+
+def monotonic():
+    """
+    Read a clock that only moves forward, unlike time.time() it does not jump when the system clock is set
+
+    Returns:
+        the time in seconds since some unspecified starting point
+    """
+    if clock_gettime is not None:
+        now = Timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(now)) == 0:
+            return now.tv_sec + now.tv_nsec * 1e-9
+    return time.time()
+
+
+def create_timestamp():
+    """
+    Returns:
+        the current time as it is put in the packets for the workstation, e.g. '01012017120000000'
+    """
+    now = time.time()
+    localtime = time.localtime(now)
+    milliseconds = '%03d' % int((now - int(now)) * 1000)
+    return time.strftime('%d%m%Y%H%M%S', localtime) + milliseconds
+
+
 ## @ingroup Global_classes
 # @brief Codes to tell the workstation what to expect
 #
 # When sending a message to the workstation, the message will be preceded by one of these codes
 class MessageCodes():
     ACK = 200
+    JOB_ACCEPTED = 202
     STATUS_RESPONSE = 300
     HEARTBEAT_REQUEST = 400
     START_HEARTBEAT = 404
+    HEARTBEAT_RESYNC = 405
+    SUBSCRIBE = 406
     ERR = 500
 
 
@@ -67,6 +137,24 @@ class Location():
         self.latitude = latitude
 
 
+## @ingroup Global_classes
+# @brief An immutable copy of the telemetry of the drone, as it was at 'timestamp'
+#
+# The Solo replaces its snapshot every time DroneKit reports a new value,
+# so a reader gets a consistent view of the drone by reading the snapshot once, without taking any lock.
+class TelemetrySnapshot(namedtuple('TelemetrySnapshot', ['timestamp', 'latitude', 'longitude', 'height',
+                                                         'orientation', 'battery_level', 'gps_signal',
+                                                         'speed', 'velocity', 'mode', 'armed'])):
+    __slots__ = ()
+
+    def location(self):
+        """
+        Returns:
+            the Location of the drone in this snapshot
+        """
+        return Location(longitude=self.longitude, latitude=self.latitude)
+
+
 ## @ingroup Global_classes
 # @brief Parses the Location class to JSON
 class LocationEncoder(JSONEncoder):
@@ -100,46 +188,514 @@ class WayPointEncoder(JSONEncoder):
         return res
 
 
+## @ingroup Global_classes
+# @brief An immutable copy of the WayPointQueue, as it was at 'version'
+#
+# The snapshot shares the columns of the queue, the queue copies a column before it changes it (copy-on-write),
+# so a reader can go through the waypoints without taking the lock of the queue and without copying them.
+# Like in the queue, the columns are sorted from the back to the front.
+class WayPointSnapshot(namedtuple('WayPointSnapshot', ['version', 'insertions', 'orders', 'ranks', 'ids',
+                                                       'latitudes', 'longitudes'])):
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.orders)
+
+    def waypoint(self, index):
+        """
+        Returns:
+            a new WayPoint with the values of the waypoint at this index
+        """
+        return WayPoint(location=Location(longitude=self.longitudes[index], latitude=self.latitudes[index]),
+                        order=self.orders[index])
+
+    def to_dicts(self, ids=False, inserted_after=None):
+        """
+        Args:
+            ids: add the id of every waypoint, the id of a waypoint does not change while it is in the queue
+            inserted_after: only the waypoints that were inserted after this number of insertions
+        Returns:
+            a list with a dict per waypoint, like the WayPointEncoder makes, from the front to the back of the queue
+        """
+        indices = reversed(xrange(len(self.orders)))
+        if inserted_after is not None:
+            indices = [index for index, waypoint_id in enumerate(self.ids) if waypoint_id > inserted_after]
+            indices.reverse()
+        result = []
+        for index in indices:
+            waypoint = {'order': self.orders[index],
+                        'location': {'latitude': self.latitudes[index], 'longitude': self.longitudes[index]}}
+            if ids:
+                waypoint['id'] = self.ids[index]
+            result.append(waypoint)
+        return result
+
+
 ## @ingroup Global_classes
 # @brief Class to hold a series of object from the WayPoint class
 #
 # This class holds a lock in order to provide some protection against concurrent modification.
-# Also provides functionality to sort Waypoints based on their order
+# The waypoints are always sorted on their order, waypoints with the same order stay in the order they were inserted.
+#
+# Survey paths can have 100k waypoints, so the queue does not keep a WayPoint (and a Location) per waypoint:
+# the orders, latitudes and longitudes are columns in typed arrays, 32 bytes per waypoint with the rank and the id.
+# A WayPoint is only created when a waypoint is removed or looked at.
+# The columns are sorted from the back of the queue to the front: the front is the end of the arrays,
+# so removing the next waypoint is O(1), and a waypoint is inserted in order with a binary search.
+#
+# Every change of the queue increases its version. Readers get an immutable WayPointSnapshot from snapshot(),
+# and changes_since() tells which waypoints were inserted and removed after an earlier version.
+# A thread can wait_for() the queue: it is woken up by every change and by wake(), instead of polling it.
+#
+# The waypoints of a generated pattern (see coverage) can be inserted lazily: the queue takes FEED_BATCH of them
+# at a time, and the next batch when the drone gets to the last FEED_LOW waypoints of the batch.
 class WayPointQueue():
+    ## the number of changes that are remembered for changes_since()
+    CHANGE_LOG_SIZE = 1000
+    ## the number of waypoints that are taken from a lazy source at a time, see insert_lazily()
+    FEED_BATCH = 500
+    ## the next batch is taken when this many waypoints of the last batch are left
+    FEED_LOW = 100
+
     def __init__(self):
         self.queue_lock = RLock()  # this lock will be used when accessing the waypoint queue
-        self.queue = []
+        ## condition that is notified on every change of the queue and by wake()
+        self.condition = Condition(self.queue_lock)
+        ## the order of every waypoint, sorted from the back to the front of the queue, see key()
+        self.orders = array('i')
+        ## the rank of every waypoint among the waypoints with the same order, see key()
+        self.ranks = array('d')
+        ## the id of every waypoint, the number of insertions when it was inserted
+        self.ids = array('i')
+        ## the latitude of every waypoint
+        self.latitudes = array('d')
+        ## the longitude of every waypoint
+        self.longitudes = array('d')
+        ## counts the insertions, so waypoints with the same order keep the order in which they were inserted
+        self.insertions = 0
+        ## increases with every change of the queue
+        self.version = 0
+        ## the latest snapshot, it shares the columns of the queue as long as the version does not change
+        self.published = None
+        ## True if the columns are shared with a snapshot, they are copied before they change
+        self.shared = False
+        ## a (version, insertions before the change, ids of the removed waypoints) tuple for every recent change
+        self.changes = deque(maxlen=self.CHANGE_LOG_SIZE)
+        ## the oldest version that changes_since() can answer
+        self.oldest_version = 0
+        ## a [iterator, id] list for every lazy source, its next batch is taken when the waypoint with this id
+        ## (or a later one) is removed
+        self.sources = []
         self.current_waypoint = None
         self.last_waypoint_order = -1
         self.home = None
 
+    def changed(self, insertions, removed=()):
+        """
+        Start a new version, called with the lock held after every change
+
+        Args:
+            insertions: the number of insertions before the change
+            removed: the ids of the waypoints that were removed by the change
+        """
+        if len(self.changes) == self.changes.maxlen:
+            self.oldest_version = self.changes[0][0]
+        self.version += 1
+        self.changes.append((self.version, insertions, removed))
+        self.condition.notify_all()
+
+    def wake(self):
+        """
+        Wake up the threads in wait_for(), e.g. when something else they wait for changed
+        """
+        with self.condition:
+            self.condition.notify_all()
+
+    def wait_for(self, predicate):
+        """
+        Wait until predicate() is True, it is called with the lock held after every change of the queue and wake()
+
+        Args:
+            predicate: a function without arguments
+        """
+        with self.condition:
+            while not predicate():
+                self.condition.wait()
+
+    def detach(self):
+        """
+        Copy the columns if a snapshot shares them, called with the lock held before a column changes
+        """
+        if self.shared:
+            self.orders = self.orders[:]
+            self.ranks = self.ranks[:]
+            self.ids = self.ids[:]
+            self.latitudes = self.latitudes[:]
+            self.longitudes = self.longitudes[:]
+            self.shared = False
+
+    def snapshot(self):
+        """
+        Returns:
+            a WayPointSnapshot of the current version, only the first snapshot of a version takes the lock
+        """
+        published = self.published
+        if published is not None and published.version == self.version:
+            return published
+        self.queue_lock.acquire()
+        if self.published is None or self.published.version != self.version:
+            self.published = WayPointSnapshot(self.version, self.insertions, self.orders, self.ranks, self.ids,
+                                              self.latitudes, self.longitudes)
+            self.shared = True
+        published = self.published
+        self.queue_lock.release()
+        return published
+
+    def changes_since(self, version):
+        """
+        Args:
+            version: a version of the queue the reader knows, e.g. from an earlier next_waypoints_since status
+        Returns:
+            the current WayPointSnapshot, the number of insertions at 'version'
+            and a list with the ids of the waypoints that were in the queue at 'version' but have been removed since,
+            or None instead of the number of insertions and the ids if the changes since 'version' are not known
+        """
+        self.queue_lock.acquire()
+        snapshot = self.snapshot()
+        if not self.oldest_version <= version <= self.version:
+            self.queue_lock.release()
+            return snapshot, None, None
+        changes = list(self.changes)[len(self.changes) - (self.version - version):] if version < self.version else []
+        self.queue_lock.release()
+        if not changes:
+            return snapshot, snapshot.insertions, []
+        insertions = changes[0][1]
+        # a waypoint that was inserted and removed after 'version' is not in the answer
+        removed = [waypoint_id for change in changes for waypoint_id in change[2] if waypoint_id <= insertions]
+        return snapshot, insertions, removed
+
+    def key(self, index):
+        """
+        Returns:
+            the key of the waypoint at this index, the keys increase towards the front of the queue
+        """
+        return -self.orders[index], self.ranks[index]
+
+    def search(self, key, low, high):
+        """
+        Binary search between two indices, called with the lock held
+
+        Returns:
+            the index of the first waypoint with a larger key than 'key', or 'high' if there is none
+        """
+        while low < high:
+            middle = (low + high) // 2
+            if key < self.key(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def rank(self, side='back'):
+        """
+        Args:
+            side: 'front' to go before the waypoints with the same order, 'back' to go after them
+        Returns:
+            the rank of a new waypoint
+        """
+        self.insertions += 1
+        if side == 'front':
+            return self.insertions
+        return -self.insertions
+
+    def waypoint(self, index):
+        """
+        Returns:
+            a new WayPoint with the values of the waypoint at this index
+        """
+        return WayPoint(location=Location(longitude=self.longitudes[index], latitude=self.latitudes[index]),
+                        order=self.orders[index])
+
+    @property
+    def queue(self):
+        """
+        Returns:
+            a list with the waypoints, from the front to the back of the queue
+        """
+        return self.waypoints()
+
+    def waypoints(self):
+        """
+        Returns:
+            a list with the waypoints, from the front to the back of the queue
+        """
+        snapshot = self.snapshot()
+        return [snapshot.waypoint(index) for index in reversed(xrange(len(snapshot)))]
+
+    def columns(self):
+        """
+        Copy the waypoints without creating a WayPoint for every one of them
+
+        Returns:
+            a tuple with a list of the orders, of the latitudes and of the longitudes, from the front to the back
+        """
+        snapshot = self.snapshot()
+        return snapshot.orders[::-1].tolist(), snapshot.latitudes[::-1].tolist(), snapshot.longitudes[::-1].tolist()
+
     def insert_waypoint(self, waypoint, side='back'):
         """
         Args:
             waypoint: a WayPoint
-            side: specifies whether to insert the waypoint in the front or the back of the queue
+            side: specifies whether to insert the waypoint in front of or behind the waypoints with the same order
         """
         self.queue_lock.acquire()
-        if side == 'front':
-            self.queue = [waypoint] + self.queue
+        self.detach()
+        insertions = self.insertions
+        rank = self.rank(side)
+        key = (-waypoint.order, rank)
+        high = len(self.orders)
+        if high and key >= self.key(high - 1):
+            low = high  # the new front, e.g. a waypoint that is visited again
         else:
-            self.queue.append(waypoint)
+            low = self.search(key, 0, high)
+        self.orders.insert(low, waypoint.order)
+        self.ranks.insert(low, rank)
+        self.ids.insert(low, self.insertions)
+        self.latitudes.insert(low, waypoint.location.latitude)
+        self.longitudes.insert(low, waypoint.location.longitude)
+        self.changed(insertions)
         self.queue_lock.release()
 
+    def insert_waypoints(self, waypoints):
+        """
+        Insert many waypoints at once
+
+        Args:
+            waypoints: an iterable of WayPoint
+        """
+        self.insert_records((waypoint.order, waypoint.location.latitude, waypoint.location.longitude)
+                            for waypoint in waypoints)
+
+    def insert_records(self, records):
+        """
+        Insert many waypoints at once, e.g. the waypoints of a path message, without creating a WayPoint for them
+
+        Args:
+            records: an iterable of (order, latitude, longitude) tuples
+        """
+        self.queue_lock.acquire()
+        try:
+            self.detach()
+            size = len(self.orders)
+            insertions = self.insertions
+            try:
+                for order, latitude, longitude in records:
+                    self.orders.append(order)
+                    self.ranks.append(self.rank())
+                    self.ids.append(self.insertions)
+                    self.latitudes.append(latitude)
+                    self.longitudes.append(longitude)
+            except (TypeError, OverflowError):
+                # e.g. an order that is not an integer, the queue is left as it was
+                for column in (self.orders, self.ranks, self.ids, self.latitudes, self.longitudes):
+                    del column[size:]
+                self.insertions = insertions
+                raise ValueError("FormatError: the order of a waypoint should be an integer")
+            if len(self.orders) == size:
+                return
+            # only the new waypoints are sorted, a binary search finds where each of them goes in the queue,
+            # then the runs of the queue between those places are copied as slices
+            new = sorted(xrange(size, len(self.orders)), key=self.key)
+            positions = []
+            low = 0
+            for index in new:
+                low = self.search(self.key(index), low, size)
+                positions.append(low)
+            for name in ('orders', 'ranks', 'ids', 'latitudes', 'longitudes'):
+                column = getattr(self, name)
+                merged = array(column.typecode)
+                start = 0
+                for position, index in zip(positions, new):
+                    merged.extend(column[start:position])
+                    merged.append(column[index])
+                    start = position
+                merged.extend(column[start:size])
+                setattr(self, name, merged)
+            self.changed(insertions)
+        finally:
+            self.queue_lock.release()
+
+    def insert_at(self, position, latitude, longitude, version, order=0):
+        """
+        Insert a waypoint at a position in the queue instead of in order, e.g. where it makes the route the shortest.
+
+        The waypoint takes the order of the waypoint before it, and a rank between that of its neighbours,
+        so the queue stays sorted and later waypoints are still inserted in order.
+
+        Args:
+            position: the number of waypoints in front of the new one, len(snapshot) puts it at the back
+            latitude: the latitude of the waypoint
+            longitude: the longitude of the waypoint
+            version: the version of the snapshot the position was chosen in
+            order: the order of the waypoint if the queue is empty
+        Returns:
+            False if the queue changed since 'version', the position should then be chosen again
+        """
+        self.queue_lock.acquire()
+        try:
+            if version != self.version:
+                return False
+            size = len(self.orders)
+            index = size - position  # the columns go from the back to the front
+            insertions = self.insertions
+            if index == size:
+                order = self.orders[index - 1] if size else order
+                rank = self.rank('front')
+            else:
+                order = self.orders[index]  # the waypoint before the new one
+                if index == 0:
+                    rank = self.rank('back')
+                else:
+                    rank = self.rank_between(index - 1, index)
+            self.detach()
+            self.orders.insert(index, order)
+            self.ranks.insert(index, rank)
+            self.ids.insert(index, self.insertions)
+            self.latitudes.insert(index, latitude)
+            self.longitudes.insert(index, longitude)
+            self.changed(insertions)
+            return True
+        finally:
+            self.queue_lock.release()
+
+    def rank_between(self, behind, ahead):
+        """
+        Start an insertion between two neighbouring waypoints, with the order of the one ahead
+
+        Args:
+            behind: the index of the waypoint that is visited after the new one
+            ahead: the index of the waypoint that is visited before the new one, behind + 1
+        Returns:
+            the rank of the new waypoint
+        """
+        self.insertions += 1
+        order = self.orders[ahead]
+        # waypoints that are inserted later at the back of this order get a rank of -(insertions + 1) or lower
+        low = self.ranks[behind] if self.orders[behind] == order else -(self.insertions + 1)
+        rank = (low + self.ranks[ahead]) / 2.0
+        if not low < rank < self.ranks[ahead]:
+            # many insertions at the same place used up the precision, spread the ranks of this order again
+            self.detach()
+            first = last = ahead
+            while first > 0 and self.orders[first - 1] == order:
+                first -= 1
+            while last + 1 < len(self.orders) and self.orders[last + 1] == order:
+                last += 1
+            step = 2.0 * (self.insertions + 1) / (last - first + 2)
+            for index in xrange(first, last + 1):
+                self.ranks[index] = -(self.insertions + 1) + step * (index - first + 1)
+            low = self.ranks[behind] if self.orders[behind] == order else -(self.insertions + 1)
+            rank = (low + self.ranks[ahead]) / 2.0
+        return rank
+
+    def insert_lazily(self, records):
+        """
+        Insert the waypoints of a long iterable a batch at a time, only when the drone gets to them
+
+        Args:
+            records: an iterable of (order, latitude, longitude) tuples, e.g. a generator
+        """
+        self.queue_lock.acquire()
+        try:
+            source = [iter(records), 0]
+            self.sources.append(source)
+            self.feed(source)
+        finally:
+            self.queue_lock.release()
+
+    def feed(self, source):
+        """
+        Insert the next batch of a lazy source, called with the lock held
+
+        Args:
+            source: an [iterator, id] list from self.sources
+        """
+        try:
+            batch = list(islice(source[0], self.FEED_BATCH))  # islice stops at the end of the source
+        except Exception:
+            self.sources.remove(source)  # a source that failed is not asked for another batch
+            raise
+        if len(batch) < self.FEED_BATCH:  # the source is exhausted
+            self.sources.remove(source)
+        if batch:
+            insertions = self.insertions
+            self.insert_records(batch)
+            # the ids of the batch are insertions + 1 up to insertions + len(batch)
+            source[1] = max(insertions + 1, insertions + len(batch) - self.FEED_LOW)
+
     def remove_waypoint(self, side='front'):
         """
         Args:
             side: specifies whether to remove the waypoint from the front or the back of the queue
+        Returns:
+            the WayPoint that was removed, an IndexError is raised if the queue is empty
         """
         self.queue_lock.acquire()
-        if side == 'back':
-            waypoint = self.queue.pop()
-        else:
-            waypoint = self.queue[0]
-            self.queue = self.queue[1:]
+        try:
+            return self.remove_index(0 if side == 'back' else len(self.orders) - 1)
+        finally:
+            self.queue_lock.release()
+
+    def take_waypoint(self, waypoint_id):
+        """
+        Remove the waypoint with this id, wherever it is in the queue, e.g. the next waypoint of a mission
+
+        Args:
+            waypoint_id: the id of the waypoint, see WayPointSnapshot.ids
+        Returns:
+            the WayPoint that was removed, None if it is not in the queue anymore
+        """
+        self.queue_lock.acquire()
+        try:
+            if self.ids and self.ids[-1] == waypoint_id:
+                index = len(self.ids) - 1  # usually it is the front
+            else:
+                try:
+                    index = self.ids.index(waypoint_id)
+                except ValueError:
+                    return None
+            return self.remove_index(index)
+        finally:
+            self.queue_lock.release()
+
+    def remove_index(self, index):
+        """
+        Remove the waypoint at this index, called with the lock held
+
+        Returns:
+            the WayPoint that was removed, it becomes the current waypoint
+        """
+        waypoint = self.waypoint(index)
+        self.detach()
+        waypoint_id = self.ids[index]
+        for column in (self.orders, self.ranks, self.ids, self.latitudes, self.longitudes):
+            column.pop(index)
+        self.changed(self.insertions, (waypoint_id,))
         if self.current_waypoint is not None:
             self.last_waypoint_order = self.current_waypoint.order
         self.current_waypoint = waypoint
+        # last, so the waypoint is removed even if a source raises
+        for source in [source for source in self.sources if waypoint_id >= source[1]]:
+            self.feed(source)
+        return waypoint
+
+    def peek_waypoint(self):
+        """
+        Returns:
+            the waypoint in the front of the queue without removing it, None if the queue is empty
+        """
+        self.queue_lock.acquire()
+        waypoint = self.waypoint(len(self.orders) - 1) if self.orders else None
         self.queue_lock.release()
         return waypoint
 
@@ -147,23 +703,9 @@ class WayPointQueue():
         """
         Sort the waypoints in the queue.
 
-        This function uses BubbleSort which is not efficient for large lists,
-        but we only have a limited number of waypoints in the queue, so this shouldn't be a bottleneck.
+        The waypoints are kept sorted when they are inserted, so there is nothing left to do.
         """
-        self.queue_lock.acquire()
-        wp_ord = 0
-        for j in range(0, len(self.queue)):
-            last_wp_ord = -1
-            for i in range(0, len(self.queue) - j):
-                waypoint = self.queue[i]
-                if not isinstance(waypoint, WayPoint):
-                    return  # this should not be happening
-                wp_ord = self.queue[i].order
-                if wp_ord < last_wp_ord:
-                    self.queue[i], self.queue[i - 1] = self.queue[i - 1], self.queue[i]
-                else:
-                    last_wp_ord = wp_ord
-        self.queue_lock.release()
+        return
 
     def is_empty(self):
         """
@@ -171,7 +713,7 @@ class WayPointQueue():
             a boolean telling whether the queue is empty or not
         """
         self.queue_lock.acquire()
-        result = not self.queue
+        result = not self.orders
         if result is False and self.last_waypoint_order != -1:
             self.last_waypoint_order = -2
         self.queue_lock.release()
@@ -182,5 +724,15 @@ class WayPointQueue():
         Remove all items from the queue
         """
         self.queue_lock.acquire()
-        self.queue = []
+        self.orders = array('i')
+        self.ranks = array('d')
+        self.ids = array('i')
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.shared = False
+        self.sources = []
+        # the waypoints a reader knows are all gone, changes_since() can only answer from this version on
+        self.changed(self.insertions)
+        self.changes.clear()
+        self.oldest_version = self.version
         self.queue_lock.release()
@@ -0,0 +1,268 @@
+import struct
+import socket
+
+import wire_format
+from global_classes import monotonic
+
+## the transports a workstation can choose from for its heartbeats
+# 'connect': a new TCP connection for every heartbeat, this is the default
+# 'stream': one TCP connection that is kept open, the heartbeats follow each other on the stream
+# 'udp': one datagram per heartbeat, preceded by a sequence number so the workstation can detect loss and reordering
+TRANSPORTS = ('connect', 'stream', 'udp')
+
+
+## how much a field of a heartbeat has to change before it is sent in a delta, fields that are not in here
+# are sent whenever they change at all. 'current_location' is compared per coordinate, in degrees (1e-6 is about 0.1m)
+DEFAULT_THRESHOLDS = {'current_location': 1e-6,
+                      'height': 0.1,
+                      'orientation': 0.01,
+                      'battery_level': 1}
+## the fields that are in every heartbeat, also in a delta
+ALWAYS_SENT = ('message_type', 'heartbeat', 'timestamp')
+
+
+def stream_frame(payload):
+    """
+    Frame a heartbeat for a TCP connection, like a status response but without the status code
+
+    Args:
+        payload: the heartbeat
+    Returns:
+        the length of the frame ('>H'), the length of the heartbeat ('>I') and the heartbeat
+    """
+    return struct.pack(">H", len(payload) + 4) + struct.pack(">I", len(payload)) + payload
+
+
+def datagram_frame(sequence, payload):
+    """
+    Frame a heartbeat for a datagram
+
+    Args:
+        sequence: the sequence number of the heartbeat, it wraps around after 2^32
+        payload: the heartbeat
+    Returns:
+        the sequence number ('>I'), the length of the heartbeat ('>I') and the heartbeat
+    """
+    return struct.pack(">II", sequence & 0xffffffff, len(payload)) + payload
+
+
+## @ingroup Onboard
+# @brief Decides how long to wait before the workstation is contacted again after a failure
+#
+# The delay doubles after every failure, up to a maximum, and is reset after a success.
+class Backoff():
+    def __init__(self, initial=0.5, maximum=30.0):
+        """
+        Args:
+            initial: seconds to wait after the first failure
+            maximum: the longest delay, in seconds
+        """
+        ## seconds to wait after the first failure
+        self.initial = initial
+        ## the longest delay, in seconds
+        self.maximum = maximum
+        ## the delay after the next failure
+        self.delay = initial
+        ## the monotonic time before which the workstation should not be contacted
+        self.retry_at = 0.0
+        ## how many failures there have been since the last success
+        self.failures = 0
+
+    def ready(self):
+        """
+        Returns:
+            True if the workstation can be contacted again
+        """
+        return monotonic() >= self.retry_at
+
+    def failure(self):
+        """
+        Returns:
+            the seconds to wait before trying again
+        """
+        delay = self.delay
+        self.retry_at = monotonic() + delay
+        self.delay = min(self.maximum, self.delay * 2)
+        self.failures += 1
+        return delay
+
+    def success(self):
+        self.delay = self.initial
+        self.retry_at = 0.0
+        self.failures = 0
+
+
+## @ingroup Onboard
+# @brief Sends every heartbeat over a new TCP connection, like the workstation always expected
+class ConnectTransport():
+    def __init__(self, address, timeout=1.0):
+        """
+        Args:
+            address: tuple with the IP address and port of the workstation
+            timeout: seconds to wait for the connection with the workstation
+        """
+        ## tuple with the IP address and port of the workstation
+        self.address = address
+        ## seconds to wait for the connection with the workstation
+        self.timeout = timeout
+
+    ## send one heartbeat, this raises socket.error when the workstation can not be reached
+    def send(self, payload):
+        workstation_socket = socket.create_connection(self.address, self.timeout)
+        try:
+            workstation_socket.sendall(stream_frame(payload))
+        finally:
+            workstation_socket.close()
+
+    def close(self):
+        pass
+
+
+## @ingroup Onboard
+# @brief Sends the heartbeats over one TCP connection that is kept open
+class StreamTransport():
+    def __init__(self, address, timeout=1.0):
+        """
+        Args:
+            address: tuple with the IP address and port of the workstation
+            timeout: seconds to wait for the connection with the workstation, and for a heartbeat to be sent
+        """
+        ## tuple with the IP address and port of the workstation
+        self.address = address
+        ## seconds to wait for the connection with the workstation, and for a heartbeat to be sent
+        self.timeout = timeout
+        ## the connection with the workstation, None until the first heartbeat or after a failure
+        self.sock = None
+
+    ## send one heartbeat, this raises socket.error when the workstation can not be reached
+    def send(self, payload):
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address, self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self.sock.sendall(stream_frame(payload))
+        except socket.error:
+            self.close()  # the next heartbeat reconnects
+            raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+## @ingroup Onboard
+# @brief Sends every heartbeat as a UDP datagram with a sequence number
+class DatagramTransport():
+    def __init__(self, address):
+        """
+        Args:
+            address: tuple with the IP address and port of the workstation
+        """
+        ## tuple with the IP address and port of the workstation
+        self.address = address
+        ## the sequence number of the next heartbeat
+        self.sequence = 0
+        ## UDP socket
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    ## send one heartbeat, this only raises socket.error when e.g. the network is down
+    def send(self, payload):
+        self.sock.sendto(datagram_frame(self.sequence, payload), self.address)
+        self.sequence += 1
+
+    def close(self):
+        self.sock.close()
+
+
+## @ingroup Onboard
+# @brief Turns full heartbeats into keyframes and deltas
+#
+# Every heartbeat gets a sequence number. A keyframe contains every field and has 'keyframe' set to True,
+# a delta only contains the fields that changed more than their threshold since they were last sent.
+# A delta applies on top of the heartbeat with the previous sequence number, so when the workstation
+# notices a gap, it either waits for the next keyframe or asks for one with a 'heartbeat_resync' settings message.
+class DeltaEncoder():
+    def __init__(self, keyframe_interval=10, thresholds=None, encoding='json'):
+        """
+        Args:
+            keyframe_interval: every how many heartbeats a keyframe is sent
+            thresholds: dict with field: threshold, these replace the DEFAULT_THRESHOLDS of the same fields
+            encoding: one of wire_format.ENCODINGS, the encoding of the keyframes and deltas
+        """
+        ## the encoding of the keyframes and deltas
+        self.encoding = encoding
+        ## every how many heartbeats a keyframe is sent
+        self.keyframe_interval = keyframe_interval
+        ## dict with field: how much it has to change before it is sent in a delta
+        self.thresholds = dict(DEFAULT_THRESHOLDS)
+        if thresholds is not None:
+            self.thresholds.update(thresholds)
+        ## the sequence number of the next heartbeat
+        self.sequence = 0
+        ## the sequence number of the next keyframe
+        self.next_keyframe = 0
+        ## dict with the values of the fields as the workstation knows them
+        self.sent = {}
+
+    ## send a keyframe as the next heartbeat, e.g. because the workstation missed a delta
+    def request_keyframe(self):
+        self.next_keyframe = self.sequence
+
+    def encode(self, heartbeat):
+        """
+        Args:
+            heartbeat: the full heartbeat, as the control module created it
+        Returns:
+            the encoded keyframe or delta
+        """
+        fields = wire_format.loads(heartbeat)
+        if self.sequence >= self.next_keyframe:
+            message = dict(fields)
+            message['keyframe'] = True
+            self.sent = fields
+            self.next_keyframe = self.sequence + self.keyframe_interval
+        else:
+            message = {'keyframe': False}
+            for key, value in fields.items():
+                if key in ALWAYS_SENT or self.changed(key, self.sent.get(key), value):
+                    message[key] = value
+                    self.sent[key] = value
+        message['sequence'] = self.sequence
+        self.sequence += 1
+        return wire_format.dumps(message, self.encoding)
+
+    def changed(self, key, old, new):
+        """
+        Returns:
+            True if the field changed more than its threshold
+        """
+        threshold = self.thresholds.get(key)
+        if threshold is None or old is None or new is None:
+            return old != new
+        if isinstance(new, dict):  # e.g. a location, compare every component
+            return set(old) != set(new) or any(self.exceeds(old[k], new[k], threshold) for k in new)
+        return self.exceeds(old, new, threshold)
+
+    @staticmethod
+    def exceeds(old, new, threshold):
+        if isinstance(old, (int, long, float)) and isinstance(new, (int, long, float)):
+            return abs(new - old) >= threshold
+        return old != new
+
+
+def create_transport(transport, address):
+    """
+    Args:
+        transport: one of TRANSPORTS
+        address: tuple with the IP address and port of the workstation
+    Returns:
+        the transport instance that sends heartbeats to the workstation
+    """
+    if transport == 'stream':
+        return StreamTransport(address)
+    elif transport == 'udp':
+        return DatagramTransport(address)
+    elif transport == 'connect':
+        return ConnectTransport(address)
+    raise ValueError("unknown heartbeat transport: {0}".format(transport))
@@ -0,0 +1,191 @@
+import sys
+import time
+import Queue
+import logging
+import threading
+
+from global_classes import logformat, dateformat
+
+
+## @ingroup Onboard
+# @brief A command that is executed in the background by the JobDispatcher
+class Job():
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, job_id, message, function):
+        """
+        Args:
+            job_id: the ID of the job, this is sent to the workstation
+            message: the message that created the job, e.g. 'start'
+            function: the function without arguments that executes the command
+        """
+        ## the ID of the job
+        self.job_id = job_id
+        ## the message that created the job
+        self.message = message
+        ## the function that executes the command
+        self.function = function
+        ## the state of the job, one of the constants above
+        self.state = Job.QUEUED
+        ## what the function returned
+        self.result = None
+        ## the error message if the job failed
+        self.error = None
+        ## when the job was submitted
+        self.submitted = time.time()
+        ## when the job started running
+        self.started = None
+        ## when the job finished
+        self.finished = None
+
+    def is_finished(self):
+        return self.state in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    def to_dict(self):
+        """
+        Returns:
+            a dict with the state of the job, that can be sent to the workstation
+        """
+        return {'job_id': self.job_id,
+                'job_message': self.message,
+                'state': self.state,
+                'result': self.result,
+                'error': self.error,
+                'submitted': self.submitted,
+                'started': self.started,
+                'finished': self.finished}
+
+
+## @ingroup Onboard
+# @brief This thread executes long-running commands one after the other
+#
+# Commands like 'start' take tens of seconds, the ControlModule submits them here
+# so it can acknowledge the request right away and keep answering other requests.
+class JobDispatcher(threading.Thread):
+    def __init__(self, logging_level, log_type='console', filename='', history=32):
+        """
+        Initiate the thread
+
+        Args:
+            logging_level: the level that should be used for logging, e.g. DEBUG
+            log_type: log to stdout ('console') or to a file ('file')
+            filename: the name of the file if log_type is 'file'
+            history: how many finished jobs are remembered for 'job_status' requests
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        ## the jobs that still have to be executed
+        self.job_queue = Queue.Queue()
+        ## dict with job ID: Job, of the jobs that are queued, running or recently finished
+        self.jobs = {}
+        ## lock that protects self.jobs and self.next_id
+        self.jobs_lock = threading.Lock()
+        ## the ID the next job will get
+        self.next_id = 1
+        ## how many finished jobs are remembered
+        self.history = history
+        ## the Job that is being executed
+        self.current_job = None
+        ## boolean to indicate whether to stop the thread or not
+        self.quit = False
+
+        # set up logging
+        ## logger instance
+        self.logger = logging.getLogger("Job Dispatcher")
+        formatter = logging.Formatter(logformat, datefmt=dateformat)
+        if log_type == 'console':
+            handler = logging.StreamHandler(stream=sys.stdout)
+        elif log_type == 'file':
+            handler = logging.FileHandler(filename=filename)
+        handler.setFormatter(formatter)
+        handler.setLevel(logging_level)
+        self.logger.addHandler(handler)
+        self.logger.setLevel(logging_level)
+
+    def submit(self, message, function):
+        """
+        Queue a command to be executed in the background
+
+        Args:
+            message: the message that created the job, e.g. 'start'
+            function: the function without arguments that executes the command
+        Returns:
+            the Job instance
+        """
+        with self.jobs_lock:
+            job = Job(self.next_id, message, function)
+            self.next_id += 1
+            self.jobs[job.job_id] = job
+            self.forget_old_jobs()
+        self.logger.info("job {0} ({1}) was submitted".format(job.job_id, message))
+        self.job_queue.put(job)
+        return job
+
+    def get_job(self, job_id):
+        """
+        Returns:
+            the Job with this ID, or None if there is no such job
+        """
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def cancel_queued(self):
+        """
+        Cancel the jobs that did not start yet, e.g. because an emergency landing was requested
+
+        Returns:
+            the amount of jobs that were cancelled
+        """
+        cancelled = 0
+        with self.jobs_lock:
+            for job in self.jobs.values():
+                if job.state == Job.QUEUED:
+                    job.state = Job.CANCELLED
+                    job.finished = time.time()
+                    cancelled += 1
+        if cancelled > 0:
+            self.logger.info("cancelled {0} queued job(s)".format(cancelled))
+        return cancelled
+
+    ## only remember the last finished jobs, the lock should be held when calling this
+    def forget_old_jobs(self):
+        finished = sorted(job_id for job_id, job in self.jobs.items() if job.is_finished())
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    ## execute the jobs in the order they were submitted
+    def run(self):
+        while True:
+            job = self.job_queue.get()
+            if job is None or self.quit:  # the control module is exiting
+                return
+            with self.jobs_lock:  # so cancel_queued() can not cancel the job after it was checked here
+                if job.state != Job.QUEUED:
+                    continue  # it was cancelled
+                job.state = Job.RUNNING
+                job.started = time.time()
+                self.current_job = job
+            self.logger.debug("running job {0} ({1})".format(job.job_id, job.message))
+            try:
+                result = job.function()
+                state, error = Job.DONE, None
+            except Exception, msg:
+                self.logger.error("job {0} ({1}) failed: {2}".format(job.job_id, job.message, msg))
+                result, state, error = None, Job.FAILED, str(msg)
+            with self.jobs_lock:
+                job.result = result
+                job.error = error
+                job.state = state
+                job.finished = time.time()
+                self.current_job = None
+            self.logger.info("job {0} ({1}) is {2}".format(job.job_id, job.message, job.state))
+
+    ## stop the thread, jobs that are still queued will not be executed
+    def stop_thread(self):
+        self.logger.info("stopping the job dispatcher")
+        self.quit = True
+        self.job_queue.put(None)
@@ -3,7 +3,11 @@ import logging
 import threading
 from dronekit import time
 
+import coverage
+import wire_format
 from solo import Solo
+from events import PATH_OPTIMIZED, PATTERN_FAILED, RTH_STARTED, WAYPOINT_REACHED
+from path_planner import TIME_BUDGET, cheapest_position, optimize_route, route_length
 from global_classes import Location, WayPoint, WayPointEncoder, WayPointQueue, logformat, dateformat
 
 
@@ -53,8 +57,12 @@ class NavigationHandler():
         if (self.message == "path"):
             self.logger.debug("Handling path message")
             self.handle_path_packet()
+        elif (self.message == "area"):
+            self.logger.debug("Handling area message")
+            self.handle_area_packet()
         elif (self.message == "start"):
             self.logger.debug("Handling start message")
+            self.solo.resume()  # see create_job()
             self.handle_start_packet()
         elif (self.message == "stop"):
             self.logger.debug("Handling stop message")
@@ -68,21 +76,213 @@ class NavigationHandler():
         else:
             raise ValueError  # if we get to this point, something went wrong
 
-    def handle_path_packet(self):
-        if 'waypoints' not in self.packet:
+    def handle_priority_packet(self, message):
+        """
+        Handle a message from PRIORITY_MESSAGES, this can run while another navigation message is being handled
+
+        Args:
+            message: Message component from the request
+        """
+        if (message == "stop"):
+            self.logger.debug("Handling priority stop message")
+            self.handle_stop_packet()
+        elif (message == "emergency"):
+            self.logger.debug("Handling priority emergency message")
+            self.handle_emergency_packet()
+        else:
             raise ValueError
 
-        waypoints = self.packet['waypoints']
-        for json_waypoint in waypoints:
-            json_location = json_waypoint['location']
-            location = Location(longitude=float(json_location['longitude']), latitude=float(json_location['latitude']))
-            waypoint = WayPoint(location=location, order=json_waypoint['order'])
+    def create_job(self, message, packet=None):
+        """
+        Some messages take a long time to handle, these are executed as a job by the JobDispatcher
+
+        Args:
+            message: Message component from the request
+            packet: the entire request
+        Returns:
+            a function without arguments that handles the message, or None if the message should be handled right away
+        """
+        if (message == "start"):
+            # a new flight, a previous stop or emergency no longer applies. This happens when the start is accepted,
+            # not in the job: an emergency after this should still stop the start, also when the job already runs
+            self.solo.resume()
+            return self.handle_start_packet
+        if (message == "path") and packet is not None and packet.get('insert', False):
+            # the job gets its own packet, the handler can handle other messages while the waypoints are inserted
+            return lambda: self.handle_inserted_path_packet(packet)
+        if (message == "path") and packet is not None and packet.get('optimize', False):
+            # the job gets its own packet, the handler can handle other messages while the path is optimized
+            return lambda: self.handle_optimized_path_packet(packet)
+        return None
+
+    def read_path(self, packet):
+        """
+        Args:
+            packet: a path message
+        Returns:
+            list with an (order, latitude, longitude) tuple for every waypoint
+        """
+        if 'packed_waypoints' in packet:  # a long path, packed as fixed-size records (see wire_format)
+            return wire_format.unpack_waypoints(packet['packed_waypoints'])
+        elif 'waypoints' in packet:
+            records = []
+            for json_waypoint in packet['waypoints']:
+                json_location = json_waypoint['location']
+                records.append((json_waypoint['order'], float(json_location['latitude']),
+                                float(json_location['longitude'])))
+            return records
+        raise ValueError
+
+    def handle_path_packet(self):
+        records = self.read_path(self.packet)
+        # the queue keeps the waypoints sorted on order, they are inserted all at once
+        self.waypoint_queue.insert_records(records)
+        self.logger.info("Added {0} waypoints...".format(len(records)))
+
+    def handle_area_packet(self):
+        """
+        Cover an area with a pattern that is generated onboard (see coverage), instead of a path with every waypoint.
+        The lines of the pattern are as far apart as the camera sees wide from the target height, less the overlap.
+        The waypoints are generated and inserted lazily, while the drone flies them.
+
+        The message has the 'polygon' (a list of locations) and optionally the 'pattern' (coverage.PATTERNS),
+        the 'sweep_angle' in degrees clockwise from north, the 'overlap' (0 up to 1), the 'datum' (a location)
+        where a search starts, and the 'order' of the waypoints (by default, after the waypoints in the queue).
+        """
+        polygon = self.packet.get('polygon')
+        if not isinstance(polygon, list) or len(polygon) < 3:
+            raise ValueError("FormatError: polygon should be a list of at least 3 locations")
+        polygon = [self.read_location(location) for location in polygon]
+        datum = self.packet.get('datum')
+        if datum is not None:
+            datum = self.read_location(datum)
+        pattern = self.packet.get('pattern', 'boustrophedon')
+        if pattern not in coverage.PATTERNS:
+            raise ValueError("FormatError: pattern should be one of " + ", ".join(coverage.PATTERNS))
+        sweep_angle = self.packet.get('sweep_angle', 0.0)
+        if not isinstance(sweep_angle, (int, long, float)):
+            raise ValueError("FormatError: sweep_angle should be a number of degrees")
+        overlap = self.packet.get('overlap', coverage.OVERLAP)
+        if not isinstance(overlap, (int, long, float)) or not 0 <= overlap < 1:
+            raise ValueError("FormatError: overlap should be a number from 0 up to 1")
+        order = self.packet.get('order')
+        if order is None:
+            orders = self.waypoint_queue.snapshot().orders
+            order = orders[0] if orders else 0  # the back of the queue
+        if not isinstance(order, (int, long)):
+            raise ValueError("FormatError: the order of a waypoint should be an integer")
+        spacing = coverage.track_spacing(self.solo.get_target_height(), overlap)
+        if not spacing > 0:  # the lines would not get any further, e.g. at a target height of 0
+            raise ValueError("FormatError: the lines of a pattern can not be {0} m apart".format(spacing))
+        waypoints = coverage.generate(pattern, polygon, spacing, sweep_angle, datum)
+        self.waypoint_queue.insert_lazily(self.pattern_records(pattern, order, waypoints))
+        self.logger.info("Added a {0} pattern with {1:.1f} m between its lines".format(pattern, spacing))
+
+    def pattern_records(self, pattern, order, waypoints):
+        """
+        The records of a pattern for WayPointQueue.insert_lazily(), the later batches are generated by the
+        NavigationThread. If the pattern fails, it ends there and the workstation gets a PATTERN_FAILED event.
+
+        Args:
+            pattern: one of coverage.PATTERNS
+            order: the order of the waypoints
+            waypoints: generator of the (latitude, longitude) of the waypoints
+        Yields:
+            (order, latitude, longitude) tuples
+        """
+        count = 0
+        try:
+            for latitude, longitude in waypoints:
+                yield (order, latitude, longitude)
+                count += 1
+        except Exception, msg:
+            self.logger.error("the {0} pattern failed after {1} waypoints: {2}".format(pattern, count, msg),
+                              exc_info=True)
+            self.solo.events.emit(PATTERN_FAILED, pattern=pattern, waypoints=count, error=str(msg))
+
+    def read_location(self, json_location):
+        """
+        Args:
+            json_location: a dict with the 'latitude' and the 'longitude'
+        Returns:
+            a (latitude, longitude) tuple
+        """
+        try:
+            return float(json_location['latitude']), float(json_location['longitude'])
+        except (TypeError, KeyError, ValueError):
+            raise ValueError("FormatError: a location should have a latitude and a longitude")
+
+    def handle_optimized_path_packet(self, packet):
+        """
+        Reorder the waypoints of a path message to the shortest route from the current location that we can find
+        within the time budget, and add them to the queue. The orders of the path are given to the waypoints
+        in the new route, so the path is still flown before or after the other waypoints in the queue.
+
+        Args:
+            packet: a path message with 'optimize' set, and optionally the 'time_budget' in seconds
+        Returns:
+            dict with the number of 'waypoints', the planned 'distance_before' and 'distance_after' in meters
+            and whether the optimization was 'complete' before the time budget ran out
+        """
+        time_budget = packet.get('time_budget', TIME_BUDGET)
+        if not isinstance(time_budget, (int, long, float)) or time_budget <= 0:
+            raise ValueError("FormatError: time_budget should be a positive number of seconds")
+        records = sorted(self.read_path(packet), key=lambda record: record[0])
+        start = self.solo.get_location()
+        if start.latitude is None and records:  # no GPS fix yet, the route starts at the first waypoint
+            start = Location(latitude=records[0][1], longitude=records[0][2])
+        plan = optimize_route(start, [record[1] for record in records], [record[2] for record in records],
+                              time_budget)
+        orders = [record[0] for record in records]
+        self.waypoint_queue.insert_records((orders[k], records[index][1], records[index][2])
+                                           for k, index in enumerate(plan.order))
+        self.logger.info("Added {0} optimized waypoints, {1:.0f} m instead of {2:.0f} m"
+                         .format(len(records), plan.distance_after, plan.distance_before))
+        result = {'waypoints': len(records), 'distance_before': plan.distance_before,
+                  'distance_after': plan.distance_after, 'complete': plan.complete}
+        self.solo.events.emit(PATH_OPTIMIZED, **result)
+        return result
+
+    def handle_inserted_path_packet(self, packet):
+        """
+        Insert every waypoint of a path message where it adds the least to the remaining route, e.g. to retask
+        the drone during a mission. The waypoint that is being flown to is not in the queue anymore, so it stays
+        the next one. Every waypoint takes O(n) in the length of the queue, and the NavigationThread can keep
+        taking waypoints from the queue meanwhile.
 
-            self.logger.info("Adding waypoint...")
-            self.waypoint_queue.insert_waypoint(waypoint)
-        # sort waypoints on order
-        self.waypoint_queue.sort_waypoints()
-        self.logger.info("Sorted the waypoints...")
+        Args:
+            packet: a path message with 'insert' set, the orders of its waypoints are only used when the queue is empty
+        Returns:
+            dict with the number of 'waypoints', and the planned 'distance_before' and 'distance_after' in meters
+            of the remaining route
+        """
+        records = sorted(self.read_path(packet), key=lambda record: record[0])
+        if not all(isinstance(record[0], (int, long)) for record in records):
+            raise ValueError("FormatError: the order of a waypoint should be an integer")
+        current_waypoint = self.waypoint_queue.current_waypoint
+        if current_waypoint is not None:
+            start = current_waypoint.location
+        else:
+            start = self.solo.get_location()
+        if start.latitude is None and records:  # no GPS fix yet, the route starts at the first waypoint
+            start = Location(latitude=records[0][1], longitude=records[0][2])
+        before = None
+        added = 0.0
+        for order, latitude, longitude in records:
+            inserted = False
+            while not inserted:  # until the queue did not change while the position was chosen
+                snapshot = self.waypoint_queue.snapshot()
+                latitudes, longitudes = snapshot.latitudes[::-1], snapshot.longitudes[::-1]
+                if before is None:
+                    before = route_length(start, latitudes, longitudes)
+                position, cost = cheapest_position(start, latitudes, longitudes, latitude, longitude)
+                inserted = self.waypoint_queue.insert_at(position, latitude, longitude, snapshot.version, order)
+            added += cost
+        before = before or 0.0
+        self.logger.info("Inserted {0} waypoints, the route is {1:.0f} m longer".format(len(records), added))
+        result = {'waypoints': len(records), 'distance_before': before, 'distance_after': before + added}
+        self.solo.events.emit(PATH_OPTIMIZED, **result)
+        return result
 
     def handle_start_packet(self):
         home_location = self.solo.get_location()
@@ -90,15 +290,20 @@ class NavigationHandler():
         self.waypoint_queue.home = home_location
         self.waypoint_queue.queue_lock.release()
 
+        if self.solo.interrupted.is_set():
+            self.logger.info("the start was interrupted before the takeoff")
+            return
         self.logger.info("preparing the solo for takeoff")
+        self.navigation_thread.wake()  # after a stop the solo is still armed, it can go on right away
         self.solo.arm()
         retval = self.solo.takeoff()
-        if retval == -1:
+        if retval == -1 and not self.solo.interrupted.is_set():
             # takeoff failed
             # we will try one more time
             self.logger.info("retrying takeoff")
             self.solo.arm()
             retval = self.solo.takeoff()
+        self.navigation_thread.wake()  # the solo is armed, it can fly to the waypoints
 
     def handle_stop_packet(self):
         self.solo.brake()
@@ -119,6 +324,19 @@ class NavigationHandler():
 
 ## @ingroup Onboard
 # @brief This class will run in another thread and fly to the waypoints in the waypoint queue
+#
+# By default the solo stops at every waypoint. When an acceptance radius is set (see Solo.set_acceptance_radius),
+# the next waypoint is sent as soon as the solo is within that radius, so it keeps its speed along the path
+# and cuts the corners by at most the radius. It still stops at the last waypoint in the queue.
+#
+# In the 'mission' navigation mode (see Solo.set_navigation_mode), the waypoints in the queue are uploaded
+# as one mission that the autopilot flies in AUTO mode, so there is no work per waypoint on the drone.
+# A waypoint is removed from the queue when the autopilot starts flying to it, like in GUIDED mode,
+# so the next waypoints, the waypoint order and stopping and resuming work the same in both modes.
+#
+# While there is nothing to fly to, the thread waits for the waypoint queue (see WayPointQueue.wait_for):
+# a path message wakes it up right away, and so do a start, a return to home and a stop of the thread.
+# The solo only flies to the waypoints while it is armed, a path that is sent before the start waits for it.
 class NavigationThread (threading.Thread):
     def __init__(self, solo, waypoint_queue, logging_level, log_type='console', filename=''):
         """
@@ -154,36 +372,108 @@ class NavigationThread (threading.Thread):
         self.logger.addHandler(handler)
         self.logger.setLevel(logging_level)
 
+    ## True if the thread should stop waiting: it should quit, or there is a waypoint and the solo may fly to it
+    #
+    # This is checked on every wake-up of the queue, so it only reads: is_empty() also updates the waypoint order.
+    def ready(self):
+        if self.quit:
+            return True
+        # before a start and after landing the solo is not armed, the waypoints are kept for the next flight
+        return not (len(self.waypoint_queue.orders) == 0 or self.solo.interrupted.is_set()
+                    or not self.solo.get_telemetry().armed)
+
+    ## wake up the thread if it waits for a waypoint, e.g. after the solo was resumed
+    def wake(self):
+        self.waypoint_queue.wake()
+
     ## run the NavigationThread and start visiting waypoints
     def run(self):
         while not self.quit:
-            if self.waypoint_queue.is_empty():
-                time.sleep(1)
+            if not self.ready():
+                self.waypoint_queue.wait_for(self.ready)
             else:
+                if self.waypoint_queue.is_empty():
+                    continue  # e.g. cleared by a return to home since ready()
+                if self.solo.get_navigation_mode() == 'mission':
+                    self.fly_mission()
+                    continue
                 self.logger.debug("getting waypoint")
                 waypoint = self.waypoint_queue.remove_waypoint()
 
                 self.logger.info("the solo is flying to a new waypoint")
-                self.solo.visit_waypoint(waypoint)
+                radius = self.solo.get_acceptance_radius()
+                if radius is not None and self.waypoint_queue.peek_waypoint() is None:
+                    radius = None  # the last waypoint, the solo should stop on it
+                arrived = self.solo.visit_waypoint(waypoint, radius)
+                if self.solo.interrupted.is_set():
+                    # the solo was stopped on its way, it should go to this waypoint again when it resumes
+                    self.waypoint_queue.insert_waypoint(waypoint, side='front')
+                    continue
+                if not arrived:
+                    continue
                 self.logger.info("the solo arrived at the waypoint")
-                time.sleep(0.1)
+                self.solo.events.emit(WAYPOINT_REACHED, waypoint_order=waypoint.order,
+                                      latitude=waypoint.location.latitude, longitude=waypoint.location.longitude)
+                if radius is None:
+                    time.sleep(0.1)
 
         if self.rth and not self.waypoint_queue.is_empty():
             home = self.waypoint_queue.remove_waypoint()
             self.logger.info("the solo is returning to his launch location")
+            self.solo.events.emit(RTH_STARTED, latitude=home.location.latitude, longitude=home.location.longitude)
+            self.solo.is_halted = False  # the halt of return_to_home() was meant for the previous waypoint
             self.solo.visit_waypoint(home)
             self.solo.land()
 
+    ## upload the waypoints in the queue as a mission, and remove them from the queue while the autopilot flies it
+    #
+    # The queue can change during the mission, e.g. by a new path or a return to home, so the waypoints of the
+    # mission are removed by their id. When one of them is not in the queue anymore, the mission is halted.
+    def fly_mission(self):
+        snapshot = self.waypoint_queue.snapshot()
+        indices = range(len(snapshot) - 1, -1, -1)  # from the front to the back
+        waypoints = [snapshot.waypoint(index) for index in indices]
+        ids = [snapshot.ids[index] for index in indices]
+        if not ids:
+            return
+        current = [self.waypoint_queue.take_waypoint(ids[0])]  # the solo flies to the first waypoint
+        if current[0] is None:
+            return  # the queue changed since the snapshot
+        reached = []
+
+        def on_reached(waypoint):
+            self.logger.info("the solo reached a waypoint of the mission")
+            self.solo.events.emit(WAYPOINT_REACHED, waypoint_order=waypoint.order,
+                                  latitude=waypoint.location.latitude, longitude=waypoint.location.longitude)
+            reached.append(waypoint)
+            current[0] = None
+            if len(reached) < len(ids):
+                current[0] = self.waypoint_queue.take_waypoint(ids[len(reached)])
+                if current[0] is None:
+                    self.logger.warning("the next waypoint of the mission was removed from the queue, "
+                                        "the mission is halted")
+                    self.solo.halt()
+
+        self.logger.info("the solo is flying a mission of {0} waypoints".format(len(waypoints)))
+        self.solo.fly_mission(waypoints, on_reached)
+        if self.solo.interrupted.is_set() and current[0] is not None:
+            # the solo was stopped on its way, it should go to this waypoint again when it resumes
+            self.waypoint_queue.insert_waypoint(current[0], side='front')
+
     ## Return to drone to his home location
     def return_to_home(self):
         self.logger.debug("returning to home")
-        self.solo.halt()
-        self.quit = True
+        # quit before the halt, so the thread does not take the home location for the next waypoint
         self.rth = True
+        self.quit = True
+        self.solo.halt()
+        self.solo.resume()  # returning to home should also work after a stop
+        self.wake()
 
     ## Stop the NavigationThread
     def stop_thread(self):
         self.logger.info("stopping the navigation-thread")
-        self.solo.halt()
-        self.quit = True
         self.rth = False
+        self.quit = True
+        self.solo.halt()
+        self.wake()
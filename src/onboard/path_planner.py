@@ -0,0 +1,341 @@
+import math
+import time
+from collections import namedtuple
+
+from geodesy import batch_to_enu, numpy, to_enu
+
+## the seconds the optimizer may take by default, it runs on the onboard CPU
+TIME_BUDGET = 2.0
+## the distances between all the waypoints are kept in a matrix up to this many waypoints, 8 bytes per pair
+MATRIX_LIMIT = 2000
+## Or-opt moves runs of up to this many waypoints
+OR_OPT_LENGTH = 3
+## a move has to shorten the route by more than this many meters, so rounding errors can not make it loop
+EPSILON = 1e-6
+
+
+## @ingroup Onboard
+# @brief The result of optimize_route()
+#
+# 'order' has the indices of the waypoints in the order they should be visited,
+# 'distance_before' and 'distance_after' are the meters from the start along the waypoints in the given order
+# and in the new one, and 'complete' is False if the time budget ran out before the route could not be improved
+# any further.
+class RoutePlan(namedtuple('RoutePlan', ['order', 'distance_before', 'distance_after', 'complete'])):
+    __slots__ = ()
+
+
+def optimize_route(start, latitudes, longitudes, time_budget=TIME_BUDGET):
+    """
+    Find a short route from the start along all the waypoints, it does not return to the start
+
+    Args:
+        start: the Location where the route starts, e.g. the current location of the drone
+        latitudes: the latitudes of the waypoints
+        longitudes: the longitudes of the waypoints
+        time_budget: the most seconds the optimization may take
+    Returns:
+        a RoutePlan, its route is never longer than the waypoints in the given order
+    """
+    deadline = time.time() + time_budget
+    easts, norths = batch_to_enu(start.latitude, start.longitude,
+                                 [start.latitude] + list(latitudes), [start.longitude] + list(longitudes))
+    optimizer = RouteOptimizer(easts, norths, deadline)
+    given = range(len(easts))
+    before = optimizer.length(given)
+    route = optimizer.nearest_neighbour()
+    improved = True
+    while improved and not optimizer.expired():
+        route, two_opt_moves = optimizer.two_opt(route)
+        route, or_opt_moves = optimizer.or_opt(route)
+        improved = two_opt_moves + or_opt_moves > 0
+    after = optimizer.length(route)
+    if after > before:  # e.g. the time ran out during the nearest neighbour search
+        route, after = given, before
+    return RoutePlan(order=[node - 1 for node in route[1:]], distance_before=before, distance_after=after,
+                     complete=not improved and not optimizer.expired())
+
+
+def cheapest_position(start, latitudes, longitudes, latitude, longitude):
+    """
+    Find where a new waypoint adds the least to the route from the start along the waypoints, in O(n)
+
+    Args:
+        start: the Location where the route starts, it stays the first point, e.g. the waypoint that is being flown to
+        latitudes: the latitudes of the waypoints, in the order they are visited
+        longitudes: the longitudes of the waypoints
+        latitude: the latitude of the new waypoint
+        longitude: the longitude of the new waypoint
+    Returns:
+        the number of waypoints that should be visited before the new one, and how many meters longer the route becomes
+    """
+    # the new waypoint is the origin, so the distance to it is the length of a point
+    start_east, start_north = to_enu(latitude, longitude, start.latitude, start.longitude)
+    easts, norths = batch_to_enu(latitude, longitude, latitudes, longitudes)
+    if numpy is not None:
+        # the waypoint before every position: the start, and every waypoint for the position after it
+        previous_easts = numpy.concatenate(([start_east], easts))
+        previous_norths = numpy.concatenate(([start_north], norths))
+        costs = numpy.hypot(previous_easts, previous_norths)  # after the last waypoint, only the edge to it counts
+        costs[:-1] += numpy.hypot(easts, norths) - numpy.hypot(easts - previous_easts[:-1],
+                                                               norths - previous_norths[:-1])
+        position = int(numpy.argmin(costs))
+        return position, float(costs[position])
+    best = (0, float('inf'))
+    previous_east, previous_north = start_east, start_north
+    for position in xrange(len(easts) + 1):
+        cost = math.hypot(previous_east, previous_north)
+        if position < len(easts):
+            east, north = easts[position], norths[position]
+            cost += math.hypot(east, north) - math.hypot(east - previous_east, north - previous_north)
+            previous_east, previous_north = east, north
+        if cost < best[1]:
+            best = (position, cost)
+    return best
+
+
+def route_length(start, latitudes, longitudes):
+    """
+    Returns:
+        the meters from the start along the waypoints, in the order they are given
+    """
+    easts, norths = batch_to_enu(start.latitude, start.longitude, latitudes, longitudes)
+    if numpy is not None:
+        if not len(easts):
+            return 0.0
+        return float(numpy.hypot(easts[0], norths[0]) + numpy.hypot(numpy.diff(easts), numpy.diff(norths)).sum())
+    points = [(0.0, 0.0)] + zip(easts, norths)
+    return sum(math.hypot(points[k + 1][0] - points[k][0], points[k + 1][1] - points[k][1])
+               for k in xrange(len(points) - 1))
+
+
+## @ingroup Onboard
+# @brief Shortens a route along points in a plane, within a deadline
+#
+# The route is built with a nearest neighbour search, and improved with 2-opt (reversing a part of the route)
+# and Or-opt (moving a run of up to OR_OPT_LENGTH points elsewhere, possibly reversed) until neither finds a
+# shorter route or the deadline passes. The route is open: it starts at point 0 and ends at any point.
+#
+# With NumPy every step compares all the candidate moves at once, over a distance matrix for up to MATRIX_LIMIT
+# points and from the coordinates for more. Without NumPy the moves are compared one by one, which is a lot slower,
+# the deadline keeps it bounded.
+class RouteOptimizer():
+    def __init__(self, xs, ys, deadline):
+        """
+        Args:
+            xs: the x coordinates (meters) of the points, point 0 is the start
+            ys: the y coordinates (meters) of the points
+            deadline: the time.time() at which the optimizer stops improving
+        """
+        ## the x coordinates of the points
+        self.xs = xs
+        ## the y coordinates of the points
+        self.ys = ys
+        ## the number of points, including the start
+        self.size = len(xs)
+        ## the time.time() at which the optimizer stops improving
+        self.deadline = deadline
+        ## NumPy array with the distance between every two points, None if there are too many points or no NumPy
+        self.matrix = None
+        if numpy is not None:
+            self.xs = numpy.asarray(xs, dtype=float)
+            self.ys = numpy.asarray(ys, dtype=float)
+            if self.size <= MATRIX_LIMIT:
+                self.matrix = numpy.hypot(self.xs[:, None] - self.xs[None, :], self.ys[:, None] - self.ys[None, :])
+
+    def expired(self):
+        return time.time() > self.deadline
+
+    def distance(self, a, b):
+        """
+        Returns:
+            the distance between points a and b
+        """
+        return math.hypot(self.xs[a] - self.xs[b], self.ys[a] - self.ys[b])
+
+    def distances(self, a, points):
+        """
+        Only with NumPy
+
+        Args:
+            a: a point
+            points: NumPy array of points
+        Returns:
+            NumPy array with the distance from point a to each of the points
+        """
+        if self.matrix is not None:
+            return self.matrix[a, points]
+        return numpy.hypot(self.xs[points] - self.xs[a], self.ys[points] - self.ys[a])
+
+    def pair_distances(self, points1, points2):
+        """
+        Only with NumPy
+
+        Returns:
+            NumPy array with the distance between every point in points1 and the point at the same index in points2
+        """
+        if self.matrix is not None:
+            return self.matrix[points1, points2]
+        return numpy.hypot(self.xs[points1] - self.xs[points2], self.ys[points1] - self.ys[points2])
+
+    def length(self, route):
+        """
+        Returns:
+            the length of the route, a sequence of points
+        """
+        if numpy is not None:
+            route = numpy.asarray(route)
+            return float(self.pair_distances(route[:-1], route[1:]).sum())
+        return sum(self.distance(route[k], route[k + 1]) for k in xrange(len(route) - 1))
+
+    def nearest_neighbour(self):
+        """
+        Returns:
+            a list with a route from point 0 that always goes to the nearest point that was not visited yet,
+            when the deadline passes the points that are left follow in their own order
+        """
+        route = [0]
+        if numpy is not None:
+            unvisited = numpy.ones(self.size, dtype=bool)
+            unvisited[0] = False
+            everything = numpy.arange(self.size)
+            while len(route) < self.size and not self.expired():
+                nearest = int(numpy.argmin(numpy.where(unvisited, self.distances(route[-1], everything), numpy.inf)))
+                unvisited[nearest] = False
+                route.append(nearest)
+            return route + numpy.flatnonzero(unvisited).tolist()
+        unvisited = range(1, self.size)
+        while unvisited and not self.expired():
+            current = route[-1]
+            nearest = min(xrange(len(unvisited)), key=lambda k: self.distance(current, unvisited[k]))
+            route.append(unvisited.pop(nearest))
+        return route + unvisited
+
+    def two_opt(self, route):
+        """
+        Reverse parts of the route as long as that makes it shorter, until the deadline
+
+        Args:
+            route: list of points, starting with point 0
+        Returns:
+            the new route and the number of moves that were made
+        """
+        moves = 0
+        improved = True
+        while improved and not self.expired():
+            improved = False
+            if numpy is not None:
+                route = numpy.asarray(route)
+            for i in xrange(len(route) - 2):
+                if self.expired():
+                    break
+                # replace the edges (a, b) and (c, e) by (a, c) and (b, e), for every c after b
+                a, b = route[i], route[i + 1]
+                if numpy is not None:
+                    c = route[i + 2:]
+                    e = route[i + 3:]
+                    gains = self.distances(a, c) - self.distance(a, b)
+                    gains[:-1] += self.distances(b, e) - self.pair_distances(c[:-1], e)  # the last c has no e
+                    best = int(numpy.argmin(gains))
+                    if gains[best] < -EPSILON:
+                        j = i + 2 + best
+                        route[i + 1:j + 1] = route[i + 1:j + 1][::-1].copy()
+                        moves += 1
+                        improved = True
+                    continue
+                ab = self.distance(a, b)
+                for j in xrange(i + 2, len(route)):
+                    c = route[j]
+                    gain = self.distance(a, c) - ab
+                    if j + 1 < len(route):
+                        e = route[j + 1]
+                        gain += self.distance(b, e) - self.distance(c, e)
+                    if gain < -EPSILON:
+                        route[i + 1:j + 1] = route[i + 1:j + 1][::-1]
+                        b = route[i + 1]
+                        ab = self.distance(a, b)
+                        moves += 1
+                        improved = True
+        return list(route), moves
+
+    def or_opt(self, route):
+        """
+        Move runs of up to OR_OPT_LENGTH points elsewhere in the route as long as that makes it shorter,
+        until the deadline
+
+        Args:
+            route: list of points, starting with point 0
+        Returns:
+            the new route and the number of moves that were made
+        """
+        route = list(route)
+        moves = 0
+        improved = True
+        while improved and not self.expired():
+            improved = False
+            for length in xrange(1, OR_OPT_LENGTH + 1):
+                i = 1
+                while i + length <= len(route) and len(route) > length + 1:
+                    if self.expired():
+                        return route, moves
+                    run = route[i:i + length]
+                    rest = route[:i] + route[i + length:]
+                    # what taking the run out of the route saves
+                    saved = self.distance(route[i - 1], run[0])
+                    if i + length < len(route):
+                        saved += self.distance(run[-1], route[i + length]) - \
+                            self.distance(route[i - 1], route[i + length])
+                    position, reverse, cost = self.cheapest_insertion(rest, run[0], run[-1], skip=i - 1)
+                    if cost - saved < -EPSILON:
+                        if reverse:
+                            run.reverse()
+                        route = rest[:position + 1] + run + rest[position + 1:]
+                        moves += 1
+                        improved = True
+                    else:
+                        i += 1
+        return route, moves
+
+    def cheapest_insertion(self, route, first, last, skip=None):
+        """
+        Find where a run of points from 'first' to 'last' adds the least to the length of the route
+
+        Args:
+            route: list of points, starting with point 0
+            first: the first point of the run
+            last: the last point of the run, the same as first for a single point
+            skip: an index after which the run should not be inserted, e.g. the place it was taken from
+        Returns:
+            the index in the route after which to insert the run, whether to insert it reversed,
+            and how much longer the route becomes
+        """
+        if numpy is not None:
+            points = numpy.asarray(route)
+            edges = self.pair_distances(points[:-1], points[1:])
+            forward = self.distances(first, points)  # after the last point of the route, only the edge to it counts
+            forward[:-1] += self.distances(last, points[1:]) - edges
+            backward = forward
+            if first != last:
+                backward = self.distances(last, points)
+                backward[:-1] += self.distances(first, points[1:]) - edges
+            if skip is not None:
+                forward[skip] = backward[skip] = numpy.inf
+            position = int(numpy.argmin(forward))
+            reverse_position = int(numpy.argmin(backward))
+            if backward[reverse_position] < forward[position]:
+                return reverse_position, True, float(backward[reverse_position])
+            return position, False, float(forward[position])
+        best = (None, False, float('inf'))
+        for k in xrange(len(route)):
+            if k == skip:
+                continue
+            u = route[k]
+            for reverse, (head, tail) in ((False, (first, last)), (True, (last, first))):
+                cost = self.distance(u, head)
+                if k + 1 < len(route):
+                    cost += self.distance(tail, route[k + 1]) - self.distance(u, route[k + 1])
+                if cost < best[2]:
+                    best = (k, reverse, cost)
+                if first == last:
+                    break
+        return best
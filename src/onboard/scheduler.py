@@ -0,0 +1,98 @@
+from global_classes import monotonic
+
+
+## @ingroup Onboard
+# @brief Keeps a periodic task on a fixed grid of deadlines
+#
+# Sleeping for the period after the work is done makes the period drift by however long the work takes.
+# Instead, the deadlines are a fixed period apart on the monotonic clock and the caller sleeps until the next one.
+# When the work takes longer than a period (an overrun), the deadlines that were missed are skipped
+# instead of being caught up in a burst.
+#
+# Usage:
+#     scheduler.start()
+#     while running:
+#         scheduler.tick()
+#         do_work()
+#         sleep(scheduler.next_delay())
+class DeadlineScheduler():
+    def __init__(self, period, clock=monotonic):
+        """
+        Args:
+            period: seconds between two deadlines
+            clock: function without arguments that returns the monotonic time in seconds
+        """
+        ## seconds between two deadlines
+        self.period = period
+        ## the monotonic clock
+        self.clock = clock
+        ## the monotonic time of the next deadline
+        self.deadline = None
+        ## how many times the task was run
+        self.ticks = 0
+        ## how many times the task took longer than a period
+        self.overruns = 0
+        ## how many deadlines were skipped because of overruns
+        self.skipped = 0
+        ## the sum of the jitter of all ticks, to calculate the mean
+        self.total_jitter = 0.0
+        ## the largest jitter of a tick
+        self.max_jitter = 0.0
+
+    ## start with a deadline right now, this also resets the statistics
+    def start(self):
+        self.deadline = self.clock()
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+
+    def set_period(self, period):
+        """
+        Change the period, the next deadline is moved so it is one new period after the previous one
+
+        Args:
+            period: seconds between two deadlines
+        """
+        if self.deadline is not None:
+            self.deadline += period - self.period
+        self.period = period
+
+    ## call this when the task starts running, it records how late it is compared to its deadline
+    def tick(self):
+        jitter = max(0.0, self.clock() - self.deadline)
+        self.ticks += 1
+        self.total_jitter += jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+
+    def next_delay(self):
+        """
+        Move on to the next deadline, call this when the task is done
+
+        Returns:
+            the seconds to wait before the task should run again
+        """
+        now = self.clock()
+        self.deadline += self.period
+        if now > self.deadline:  # the task took longer than a period
+            self.overruns += 1
+            missed = int((now - self.deadline) / self.period) + 1
+            self.skipped += missed
+            self.deadline += missed * self.period
+        return max(0.0, self.deadline - now)
+
+    def stats(self):
+        """
+        Returns:
+            a dict with the period, the amount of ticks and overruns, and the mean and maximal jitter in seconds
+        """
+        mean_jitter = 0.0
+        if self.ticks > 0:
+            mean_jitter = self.total_jitter / self.ticks
+        return {'period': self.period,
+                'ticks': self.ticks,
+                'overruns': self.overruns,
+                'skipped': self.skipped,
+                'mean_jitter': mean_jitter,
+                'max_jitter': self.max_jitter}
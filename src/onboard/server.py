@@ -2,6 +2,7 @@ import os
 import sys
 import time
 import json
+import Queue
 import signal
 import struct
 import socket
@@ -9,7 +10,14 @@ import getopt
 import logging
 import threading
 
-from global_classes import MessageCodes, logformat, dateformat, print_help
+from global_classes import MessageCodes, monotonic, logformat, dateformat, print_help, recv_exact
+from control_channel import ControlChannelPool, is_priority_request
+from scheduler import DeadlineScheduler
+from heartbeat import Backoff, DeltaEncoder, create_transport
+from shared_telemetry import TelemetryReader
+from subscriptions import SubscriptionSchedule, read_fields, subscription_message
+from events import event_stream_request, read_event
+import wire_format
 
 
 ## @ingroup Onboard
@@ -19,6 +27,9 @@ from global_classes import MessageCodes, logformat, dateformat, print_help
 # Then start sending hello message until an answer is received
 # It will then continuously listen for requests
 # And create a ControlThread per request to handle the request
+#
+# A workstation can also open a persistent session by sending a session 'open' message as its first request.
+# The connection is then kept open and handled by a SessionThread, which can carry many requests at once.
 class Server():
     def __init__(self, logger, SIM):
         """
@@ -43,8 +54,18 @@ class Server():
 
         ## the port on which the drone will listen to requests
         self.PORT = 6330
+        ## how many RequestWorkers handle the requests of persistent sessions
+        self.worker_count = 4
         ## boolean to indicate whether to stop the server or not
         self.quit = False
+        ## requests from persistent sessions, waiting to be handled by a RequestWorker
+        self.request_queue = Queue.Queue()
+        ## the RequestWorker instances
+        self.request_workers = []
+        ## the SessionThread instances of the persistent sessions
+        self.sessions = []
+        ## ControlChannelPool instance, all requests to the control module go over these channels
+        self.control_pool = ControlChannelPool(self.logger)
 
         self.serversocket = socket.socket(socket.AF_INET,      # Internet
                                           socket.SOCK_STREAM)  # TCP
@@ -58,15 +79,18 @@ class Server():
         # Initiate to None in order to be able to compare to None later
         ## HeartBeatThread instance
         self.heartbeat_thread = None
+        ## EventThread instance
+        self.event_thread = None
         ## BroadcastThread instance
         self.broadcast_thread = None
         try:
             self.serversocket.bind((self.HOST, self.PORT))
-            self.serversocket.listen(1)  # become a server socket, only 1 connection allowed
+            self.serversocket.listen(8)  # become a server socket, queue a few connections
 
             self.serversocket.settimeout(2.0)
 
-            self.heartbeat_thread = HeartBeatThread(self.logger)
+            self.heartbeat_thread = HeartBeatThread(self.logger, self.control_pool)
+            self.event_thread = EventThread(self.logger, self.heartbeat_thread)
             self.broadcast_thread = BroadcastThread(self.logger, self.HOST, self.SIM, self.PORT)
         except socket.error, msg:
             self.logger.debug("Could not bind to port: {0}, quitting".format(msg))
@@ -80,19 +104,35 @@ class Server():
     ## Run the server and create a ControlThread when receiving a request
     def run(self):
         self.broadcast_thread.start()
+        self.heartbeat_thread.start()  # it waits until the workstation configures the heartbeats
+        self.event_thread.start()
+        for i in range(self.worker_count):
+            worker = RequestWorker(self.request_queue, control_pool=self.control_pool,
+                                   heartbeat_thread=self.heartbeat_thread, logger=self.logger)
+            worker.start()
+            self.request_workers.append(worker)
+
         while not self.quit:
             try:
                 # self.logger.debug("Waiting for connection in server")
                 client, address = self.serversocket.accept()
+                client.settimeout(None)
                 self.broadcast_thread.stop_thread()
-                length = client.recv(4)
-                if length is not None:
-                    buffersize = struct.unpack(">I", length)[0]
-                raw = client.recv(buffersize)
+                length = recv_exact(client, 4)
+                if length is None:
+                    client.close()
+                    continue
+                buffersize = struct.unpack(">I", length)[0]
+                raw = recv_exact(client, buffersize)
+                if raw is None:
+                    client.close()
+                    continue
                 self.logger.info("the server received a message")
                 self.logger.debug(raw)
-                control_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                control_thread = ControlThread(raw, control_socket=control_socket, client_socket=client,
+                if is_session_request(raw):
+                    self.open_session(client)
+                    continue
+                control_thread = ControlThread(raw, client_socket=client, control_pool=self.control_pool,
                                                heartbeat_thread=self.heartbeat_thread, logger=self.logger)
                 control_thread.start()
             except socket.error:
@@ -100,13 +140,104 @@ class Server():
                 pass
         self.serversocket.close()
 
+    ## acknowledge a session request and start a SessionThread for the connection
+    def open_session(self, client):
+        self.logger.info("opening a persistent session")
+        try:
+            client.sendall(struct.pack(">H", MessageCodes.ACK))
+        except socket.error, msg:
+            self.logger.debug("could not open session: {0}".format(msg))
+            client.close()
+            return
+        session = SessionThread(client, self.request_queue, control_pool=self.control_pool,
+                                heartbeat_thread=self.heartbeat_thread, logger=self.logger)
+        self.sessions = [s for s in self.sessions if s.is_alive()]
+        self.sessions.append(session)
+        session.start()
+
     def close(self):
         self.quit = True
         self.logger.info("the server is exiting")
         if self.heartbeat_thread is not None:
             self.heartbeat_thread.stop_thread()
+        if self.event_thread is not None:
+            self.event_thread.stop_thread()
         if self.broadcast_thread is not None:
             self.broadcast_thread.stop_thread()
+        for session in self.sessions:
+            session.stop_thread()
+        for worker in self.request_workers:
+            self.request_queue.put(None)  # every worker stops when it takes a None from the queue
+        self.logger.debug("control channel statistics: {0}".format(self.control_pool.stats()))
+        self.control_pool.close()
+
+
+def is_session_request(raw):
+    """
+    Check whether a request asks to open a persistent session
+
+    Args:
+        raw: the first request that was received on a new connection
+    Returns:
+        True if the connection should be kept open as a persistent session
+    """
+    if 'session' not in raw:  # cheap check, so we don't parse every one-shot request twice
+        return False
+    try:
+        packet = wire_format.loads(raw)
+    except ValueError:
+        return False
+    return isinstance(packet, dict) and packet.get('message_type') == 'session' and packet.get('message') == 'open'
+
+
+def process_request(data, control_pool, heartbeat_thread, logger):
+    """
+    Pass a request to the control module and build the response for the workstation
+
+    Args:
+        data: the message to send to the control module
+        control_pool: ControlChannelPool instance
+        heartbeat_thread: HeartBeatThread instance
+        logger: logging.Logger instance
+    Returns:
+        the bytes that should be sent to the workstation
+    """
+    try:
+        if is_priority_request(data):  # e.g. an emergency, this should not wait for the other requests
+            logger.info("sending a priority request")
+            status_code, fields = control_pool.priority_request(data)
+        else:
+            status_code, fields = control_pool.request(data)
+        logger.info("the message was processed")
+        logger.debug("response has statuscode {0}".format(status_code))
+
+        if status_code in (MessageCodes.STATUS_RESPONSE, MessageCodes.JOB_ACCEPTED):  # send the response to the client
+            response = fields[0]
+            return struct.pack(">H", status_code) + struct.pack(">H", len(response) + 4) + \
+                struct.pack(">I", len(response)) + response
+
+        if status_code == MessageCodes.START_HEARTBEAT:
+            host = fields[0]
+            port = int(fields[1])
+            options = json.loads(fields[2])
+            heartbeat_thread.configure(host, port, rate=options['rate'], transport=options['transport'],
+                                       delta=options['delta'], encoding=options['encoding'])
+            return struct.pack(">H", MessageCodes.ACK)
+
+        if status_code == MessageCodes.HEARTBEAT_RESYNC:
+            heartbeat_thread.request_keyframe()
+            return struct.pack(">H", MessageCodes.ACK)
+
+        if status_code == MessageCodes.SUBSCRIBE:
+            subscription = json.loads(fields[0])
+            heartbeat_thread.subscribe(subscription['fields'], subscription['max_bandwidth'])
+            return struct.pack(">H", MessageCodes.ACK)
+
+        # let the client know if request succeeded or failed
+        return struct.pack(">H", status_code)
+    except (socket.error, ValueError, KeyError), msg:
+        logger.debug("Error while contacting the control module: {0}".format(msg))
+        return struct.pack(">H", MessageCodes.ERR)
 
 
 ## @ingroup Onboard
@@ -115,24 +246,24 @@ class Server():
 # It is created by the Server class and passes the data to the control module
 # Then it waits for a response and sends it to the workstation
 class ControlThread (threading.Thread):
-    def __init__(self, data, control_socket, client_socket, heartbeat_thread, logger):
+    def __init__(self, data, client_socket, control_pool, heartbeat_thread, logger):
         """
         Initiate the thread
 
         Args:
             data: the message to send to the control module
-            control_socket: Socket
             client_socket: Socket
+            control_pool: ControlChannelPool instance
             heartbeat_thread: HeartBeatThread instance
             logger: logging.Logger instance
         """
         threading.Thread.__init__(self)
         ## The request from the workstation
         self.data = data
-        ## Socket to the control module
-        self.control_socket = control_socket
         ## Socket to the workstation
         self.client_socket = client_socket
+        ## ControlChannelPool instance
+        self.control_pool = control_pool
         ## HeartBeatThread instance
         self.heartbeat_thread = heartbeat_thread
         ## logger instance
@@ -140,133 +271,512 @@ class ControlThread (threading.Thread):
 
     def run(self):
         self.logger.info("running a control-thread to process a message")
-        self.control_socket.connect("/tmp/uds_control")
-        self.control_socket.send(struct.pack(">I", len(self.data)))
-        self.control_socket.send(self.data)
-
-        raw_response = self.control_socket.recv(4)
-        status_code = struct.unpack(">I", raw_response)[0]
-        self.logger.info("the message was processed")
-        self.logger.debug("response has statuscode {0}".format(status_code))
-        if status_code == MessageCodes.ACK or status_code == MessageCodes.ERR:  # let the client know if request succeeded or failed
-            response = bytearray(raw_response)
-            try:
-                self.client_socket.send(struct.pack(">H", status_code))
-            except socket.error, msg:
-                self.logger.debug("Error in server thread: {0}".format(msg))
+        response = process_request(self.data, self.control_pool, self.heartbeat_thread, self.logger)
+        try:
+            self.client_socket.sendall(response)
+        except socket.error, msg:
+            self.logger.debug("Error in server thread: {0}".format(msg))
 
-        if status_code == MessageCodes.STATUS_RESPONSE:  # send the response to the client
-            raw_length = self.control_socket.recv(4)
-            response_length = struct.unpack(">I", raw_length)[0]
-            response = self.control_socket.recv(response_length)
-            try:
-                self.client_socket.send(struct.pack(">H", status_code))
-                self.client_socket.send(struct.pack(">H", response_length + 4))
-                self.client_socket.send(bytearray(raw_length) + response)
-            except socket.error, msg:
-                self.logger.debug("Error in server thread: {0}".format(msg))
+        self.logger.debug("closing controlthread")
+        self.client_socket.close()
 
-        if status_code == MessageCodes.START_HEARTBEAT:
-            raw_length = self.control_socket.recv(4)
-            response_length = struct.unpack(">I", raw_length)[0]
-            host = self.control_socket.recv(response_length)
 
-            raw_length = self.control_socket.recv(4)
-            response_length = struct.unpack(">I", raw_length)[0]
-            port = self.control_socket.recv(response_length)
-            port = int(port)
+## @ingroup Onboard
+# @brief This thread reads the requests of one persistent session with a workstation
+#
+# Every request in a session is preceded by its length and a request ID, both as '>I'.
+# The requests are put on the request queue of the Server, so several requests can be in flight at the same time.
+# Priority requests, like 'emergency', are handled right away instead, so they don't wait behind the queue.
+# Every response is preceded by the request ID, followed by the same bytes a one-shot request would get.
+class SessionThread (threading.Thread):
+    def __init__(self, client_socket, request_queue, control_pool, heartbeat_thread, logger):
+        """
+        Initiate the thread
+
+        Args:
+            client_socket: Socket, the connection with the workstation
+            request_queue: Queue.Queue where the requests are put for the RequestWorkers
+            control_pool: ControlChannelPool instance, used for the priority requests
+            heartbeat_thread: HeartBeatThread instance
+            logger: logging.Logger instance
+        """
+        threading.Thread.__init__(self)
+        ## Socket to the workstation
+        self.client_socket = client_socket
+        ## the queue on which the requests will be put
+        self.request_queue = request_queue
+        ## ControlChannelPool instance
+        self.control_pool = control_pool
+        ## HeartBeatThread instance
+        self.heartbeat_thread = heartbeat_thread
+        ## lock to make sure responses of different requests don't get interleaved
+        self.send_lock = threading.Lock()
+        ## boolean to indicate whether to stop the thread or not
+        self.quit = False
+        ## logger instance
+        self.logger = logger
 
-            self.heartbeat_thread.configure(host, port)
-            self.heartbeat_thread.start()
+    def run(self):
+        while not self.quit:
             try:
-                self.client_socket.send(struct.pack(">H", MessageCodes.ACK))
+                header = recv_exact(self.client_socket, 8)
+                if header is None:
+                    break
+                length, request_id = struct.unpack(">II", header)
+                data = recv_exact(self.client_socket, length)
+                if data is None:
+                    break
             except socket.error, msg:
-                self.logger.debug("Error in server thread: {0}".format(msg))
+                self.logger.debug("session error: {0}".format(msg))
+                break
+            self.logger.debug("session request {0}: {1}".format(request_id, data))
+            if is_priority_request(data):
+                response = process_request(data, self.control_pool, self.heartbeat_thread, self.logger)
+                self.send_response(request_id, response)
+            else:
+                self.request_queue.put((data, request_id, self))
 
-        self.logger.debug("closing controlthread")
-        self.control_socket.close()
+        self.logger.info("closing persistent session")
+        self.quit = True
         self.client_socket.close()
 
+    def send_response(self, request_id, response):
+        """
+        Send the response to a request back to the workstation
+
+        Args:
+            request_id: the ID of the request, as it was sent by the workstation
+            response: the bytes that would have been sent for a one-shot request
+        """
+        try:
+            with self.send_lock:
+                self.client_socket.sendall(struct.pack(">I", request_id) + response)
+        except socket.error, msg:
+            self.logger.debug("could not send response {0}: {1}".format(request_id, msg))
+
+    ## stop the session, this also unblocks a pending read
+    def stop_thread(self):
+        self.quit = True
+        try:
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+
+## @ingroup Onboard
+# @brief This thread handles requests of persistent sessions
+#
+# The Server starts a few of these, so no thread has to be created per request.
+class RequestWorker (threading.Thread):
+    def __init__(self, request_queue, control_pool, heartbeat_thread, logger):
+        """
+        Initiate the thread
+
+        Args:
+            request_queue: Queue.Queue with tuples of (data, request ID, SessionThread)
+            control_pool: ControlChannelPool instance
+            heartbeat_thread: HeartBeatThread instance
+            logger: logging.Logger instance
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        ## the queue from which the requests are taken
+        self.request_queue = request_queue
+        ## ControlChannelPool instance
+        self.control_pool = control_pool
+        ## HeartBeatThread instance
+        self.heartbeat_thread = heartbeat_thread
+        ## logger instance
+        self.logger = logger
+
+    def run(self):
+        while True:
+            item = self.request_queue.get()
+            if item is None:  # the server is exiting
+                return
+            data, request_id, session = item
+            response = process_request(data, self.control_pool, self.heartbeat_thread, self.logger)
+            session.send_response(request_id, response)
+
 
 ## @ingroup Onboard
 # @brief This thread sends regular heartbeats to the workstation containing information about the drone
 #
-# It is initiated by a ControlThread after a specific message with the settings of the workstation has been received
+# It is started by the Server and waits until a specific message with the settings of the workstation has been received
 # The heartbeats contain information like location of the drone and battery status
+# They are sent at the rate the workstation asked for, on the deadlines of a DeadlineScheduler,
+# so the time it takes to get and send a heartbeat does not make the rate drift.
+# The workstation also chooses the transport, see heartbeat.TRANSPORTS.
+# When it can't be reached, the heartbeats are skipped for a while, with an exponential backoff.
 class HeartBeatThread (threading.Thread):
-    def __init__(self, logger):
+    def __init__(self, logger, control_pool):
         """
         Initiate the thread
 
         Args:
             logger: logging.Logger instance
+            control_pool: ControlChannelPool instance
         """
         threading.Thread.__init__(self)
+        self.daemon = True
         ## boolean to indicate whether to stop the thread or not
         self.quit = False
+        ## boolean, True while heartbeats should be sent
+        self.active = False
         ## the IP address of the workstation
         self.workstation_ip = None
         ## the port where the workstation listens for heartbeats
         self.workstation_port = None
+        ## the transport instance that sends the heartbeats, see heartbeat.create_transport
+        self.transport = None
+        ## lock that protects self.transport, it is replaced while the thread is running
+        self.transport_lock = threading.RLock()
+        ## Backoff instance, decides when to try again after the workstation could not be reached
+        self.backoff = Backoff()
+        ## DeltaEncoder instance when the workstation asked for delta heartbeats, None otherwise
+        self.delta_encoder = None
+        ## the encoding the workstation wants the heartbeats in
+        self.encoding = 'json'
+        ## the heartbeat request for the control module, in the encoding the workstation wants the heartbeats in
+        self.hb_req_message = wire_format.dumps({'message_type': 'status', 'message': 'heartbeat'})
+        ## TelemetryReader instance, the heartbeats are created from the telemetry the control module publishes
+        self.telemetry_reader = TelemetryReader()
+        ## DeadlineScheduler instance that decides when the next heartbeat is sent
+        self.scheduler = DeadlineScheduler(period=1.0)
+        ## event to wake up the thread when it is configured or stopped
+        self.wakeup = threading.Event()
+        ## ControlChannelPool instance
+        self.control_pool = control_pool
+        ## SubscriptionThread instance, it is started with the first subscription
+        self.subscription_thread = SubscriptionThread(logger, control_pool, self)
         ## logger instance
         self.logger = logger
 
     def run(self):
-        if self.workstation_ip is None or self.workstation_port is None:
-            return
-
-        self.logger.debug("heartbeat IP address: {0}".format(self.workstation_ip))
-        self.logger.debug("heartbeat port: {0}".format(self.workstation_port))
-        self.logger.info("hearbeats are being sent to the workstation")
-
         while not self.quit:
-            workstation_socket = socket.socket(socket.AF_INET,      # Internet
-                                               socket.SOCK_STREAM)  # TCP
+            if not self.active:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                self.scheduler.start()
+                continue
+
+            self.scheduler.tick()
+            self.send_heartbeat(self.hb_req_message)
+            self.wakeup.wait(self.scheduler.next_delay())
+            if self.wakeup.is_set():
+                self.wakeup.clear()
+                self.scheduler.start()  # the configuration changed, send the next heartbeat right away
+        self.logger.debug("heartbeat statistics: {0}".format(self.scheduler.stats()))
+        self.telemetry_reader.close()
+        with self.transport_lock:
+            if self.transport is not None:
+                self.transport.close()
+
+    def send_heartbeat(self, hb_req_message):
+        """
+        Create a heartbeat from the shared telemetry, or get one from the control module,
+        and send it to the workstation
 
-            control_socket = socket.socket(socket.AF_UNIX,      # Unix Domain Socket
-                                           socket.SOCK_STREAM)  # TCP
+        Args:
+            hb_req_message: the heartbeat request for the control module
+        """
+        if not self.backoff.ready():  # the workstation could not be reached a moment ago
+            return
+        response = self.telemetry_reader.heartbeat(self.encoding)
+        if response is None:  # there is no recent telemetry in the shared memory
             try:
-                control_socket.connect("/tmp/uds_control")
-                hb_req = {'message_type': 'status', 'message': 'heartbeat'}
-                hb_req_message = json.dumps(hb_req)
-                control_socket.send(struct.pack(">I", len(hb_req_message)) + hb_req_message)
-
-                raw_response = control_socket.recv(4)
-                status_code = struct.unpack(">I", raw_response)[0]
-
-                if status_code == MessageCodes.STATUS_RESPONSE:  # send the heartbeat to the client
-                    raw_length = control_socket.recv(4)
-                    response_length = struct.unpack(">I", raw_length)[0]
-                    response = control_socket.recv(response_length)
-                    response_length = bytearray(raw_length)
-                    self.logger.debug("heartbeat: {0}".format(response))
-
-                    try:
-                        workstation_socket.connect((self.workstation_ip, self.workstation_port))
-                        workstation_socket.send(struct.pack(">H", len(response) + 4))
-                        workstation_socket.send(response_length + response)
-                    except socket.error:
-                        self.logger.debug("could not connect to the workstation")
-                        self.stop_thread()
-
-                # close the connection
-                control_socket.close()
-                workstation_socket.close()
+                status_code, fields = self.control_pool.request(hb_req_message)
             except socket.error, msg:
                 self.logger.debug("socket error: {0}".format(msg))
+                return
+            if status_code != MessageCodes.STATUS_RESPONSE:
+                return
+            response = fields[0]
+
+        self.logger.debug("heartbeat: {0}".format(response))
+        with self.transport_lock:
+            if self.delta_encoder is not None:
+                response = self.delta_encoder.encode(response)
+            if not self.send(response) and self.delta_encoder is not None:
+                self.delta_encoder.request_keyframe()  # the workstation missed this one
+
+    def send(self, payload):
+        """
+        Send a heartbeat or another message to the workstation, over the transport of the heartbeats
 
-            # sleep 500ms before requesting another heartbeat
-            time.sleep(1)
+        Args:
+            payload: the message
+        Returns:
+            True if it was sent, False if the workstation could not be reached
+        """
+        with self.transport_lock:
+            if self.transport is None or not self.backoff.ready():
+                return False
+            try:
+                self.transport.send(payload)
+                self.backoff.success()
+                return True
+            except socket.error, msg:
+                delay = self.backoff.failure()
+                self.logger.debug("could not reach the workstation ({0}), trying again in {1}s".format(msg, delay))
+                return False
 
-    ## method to configure the heartbeat thread with workstation information
-    def configure(self, host, port):
+    def subscribe(self, fields, max_bandwidth):
+        """
+        Push fields to the workstation at their own rate, over the transport of the heartbeats
+
+        Args:
+            fields: dict with the rate per field in Hz, an empty dict stops the subscription
+            max_bandwidth: the bytes per second all pushes together may use
+        """
+        if self.transport is None:
+            raise ValueError("the workstation should send its configuration before subscribing")
+        if not self.subscription_thread.is_alive():
+            self.subscription_thread.start()
+        self.subscription_thread.configure(fields, max_bandwidth)
+
+    def configure(self, host, port, rate=1.0, transport='connect', delta=None, encoding='json'):
+        """
+        Configure the heartbeat thread with workstation information, heartbeats are sent from now on
+
+        Args:
+            host: the IP address of the workstation
+            port: the port where the workstation listens for heartbeats
+            rate: how many heartbeats should be sent per second
+            transport: one of heartbeat.TRANSPORTS
+            delta: None to send full heartbeats, or a dict with the 'keyframe_interval' and 'thresholds'
+                   to send delta heartbeats
+            encoding: one of wire_format.ENCODINGS
+        """
+        self.logger.debug("heartbeat IP address: {0}".format(host))
+        self.logger.debug("heartbeat port: {0}".format(port))
+        self.logger.info("hearbeats are being sent to the workstation at {0} Hz over '{1}'".format(rate, transport))
+        new_transport = create_transport(transport, (host, port))
+        with self.transport_lock:
+            if self.transport is not None:
+                self.transport.close()
+            self.transport = new_transport
+            self.backoff.success()
+            self.delta_encoder = None
+            if delta is not None:
+                self.delta_encoder = DeltaEncoder(delta['keyframe_interval'], delta['thresholds'], encoding)
+            # the control module answers in the encoding of the request
+            self.hb_req_message = wire_format.dumps({'message_type': 'status', 'message': 'heartbeat'}, encoding)
+            self.encoding = encoding
         self.workstation_ip = host
         self.workstation_port = port
+        self.scheduler.set_period(1.0 / rate)
+        self.active = True
+        self.wakeup.set()
 
-    ## stop sending heartbeats
+    ## send a keyframe as the next heartbeat, if delta heartbeats are used
+    def request_keyframe(self):
+        with self.transport_lock:
+            if self.delta_encoder is not None:
+                self.delta_encoder.request_keyframe()
+
+    ## stop the thread
     def stop_thread(self):
         self.logger.info("stopping the heartbeat-thread")
         self.quit = True
+        self.wakeup.set()
+        self.subscription_thread.stop_thread()
+
+
+## @ingroup Onboard
+# @brief This thread pushes the fields a workstation subscribed to, each at its own rate
+#
+# The fields that are due together are sent in one message, over the transport of the heartbeats
+# and in their encoding. A SubscriptionSchedule keeps the pushes within the bandwidth the workstation allowed.
+class SubscriptionThread(threading.Thread):
+    def __init__(self, logger, control_pool, heartbeat_thread):
+        """
+        Initiate the thread
+
+        Args:
+            logger: logging.Logger instance
+            control_pool: ControlChannelPool instance, to ask for the fields when the shared telemetry is not recent
+            heartbeat_thread: HeartBeatThread instance, its transport is used
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        ## boolean to indicate whether to stop the thread or not
+        self.quit = False
+        ## SubscriptionSchedule instance, None while there is no subscription
+        self.schedule = None
+        ## lock that protects self.schedule
+        self.schedule_lock = threading.Lock()
+        ## event to wake up the thread when the subscription changes or the thread is stopped
+        self.wakeup = threading.Event()
+        ## TelemetryReader instance
+        self.telemetry_reader = TelemetryReader()
+        ## ControlChannelPool instance
+        self.control_pool = control_pool
+        ## HeartBeatThread instance
+        self.heartbeat_thread = heartbeat_thread
+        ## logger instance
+        self.logger = logger
+
+    def run(self):
+        while not self.quit:
+            delay = self.push()
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+        self.telemetry_reader.close()
+
+    def push(self):
+        """
+        Push the fields that are due
+
+        Returns:
+            the seconds to wait before the next push, None if there is no subscription
+        """
+        with self.schedule_lock:
+            schedule = self.schedule
+        if schedule is None:
+            return None
+        fields = schedule.due(monotonic())
+        if fields and self.heartbeat_thread.backoff.ready():  # else the workstation could not be reached a moment ago
+            message = self.create_message(fields)
+            if message is not None and schedule.admit(fields, len(message), monotonic()):
+                self.heartbeat_thread.send(message)
+        delay = schedule.next_delay(monotonic())
+        if delay <= 0:  # the fields are still due because they could not be sent, try again a bit later
+            delay = 0.1
+        return delay
+
+    def create_message(self, fields):
+        """
+        Args:
+            fields: the fields that are due
+        Returns:
+            the encoded message, or None if the fields could not be read
+        """
+        encoding = self.heartbeat_thread.encoding
+        latest = self.telemetry_reader.latest()
+        if latest is not None:
+            return subscription_message(read_fields(latest[0], latest[1], fields), encoding)
+        # ask the control module for all fields at once
+        request = json.dumps({'message_type': 'status', 'message': [{'key': field} for field in fields]})
+        try:
+            status_code, response = self.control_pool.request(request)
+        except socket.error, msg:
+            self.logger.debug("socket error: {0}".format(msg))
+            return None
+        if status_code != MessageCodes.STATUS_RESPONSE:
+            return None
+        values = json.loads(response[0])
+        return subscription_message(dict((field, values.get(field)) for field in fields), encoding)
+
+    def configure(self, fields, max_bandwidth):
+        """
+        Args:
+            fields: dict with the rate per field in Hz, an empty dict stops the subscription
+            max_bandwidth: the bytes per second all pushes together may use
+        """
+        with self.schedule_lock:
+            if self.schedule is not None:
+                self.logger.debug("subscription statistics: {0}".format(self.schedule.stats()))
+            if fields:
+                self.logger.info("pushing {0} within {1} bytes per second".format(fields, max_bandwidth))
+                self.schedule = SubscriptionSchedule(fields, max_bandwidth)
+            else:
+                self.logger.info("stopping the subscription")
+                self.schedule = None
+        self.wakeup.set()
+
+    ## stop the thread
+    def stop_thread(self):
+        self.quit = True
+        self.wakeup.set()
+
+
+## @ingroup Onboard
+# @brief This thread forwards the mission events of the control module to the workstation
+#
+# It keeps an event stream open with the control module (see events.py), so an event reaches the workstation
+# as soon as it happens, over the transport of the heartbeats and in their encoding.
+# When the stream breaks, it is opened again from the last event that was received.
+class EventThread(threading.Thread):
+    def __init__(self, logger, heartbeat_thread, path="/tmp/uds_control"):
+        """
+        Initiate the thread
+
+        Args:
+            logger: logging.Logger instance
+            heartbeat_thread: HeartBeatThread instance, its transport is used
+            path: the path of the unix domain socket of the control module
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        ## boolean to indicate whether to stop the thread or not
+        self.quit = False
+        ## the path of the unix domain socket of the control module
+        self.path = path
+        ## the connection with the control module, None while there is none
+        self.sock = None
+        ## the sequence number of the last event that was received
+        self.sequence = 0
+        ## Backoff instance, decides when to connect to the control module again
+        self.backoff = Backoff(initial=0.5, maximum=5.0)
+        ## HeartBeatThread instance
+        self.heartbeat_thread = heartbeat_thread
+        ## logger instance
+        self.logger = logger
+
+    def run(self):
+        while not self.quit:
+            try:
+                self.open_stream()
+                self.backoff.success()
+                self.forward_events()
+            except socket.error, msg:
+                self.logger.debug("event stream error: {0}".format(msg))
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+            if not self.quit:
+                time.sleep(self.backoff.failure())
+
+    def open_stream(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+        request = event_stream_request(self.sequence)
+        self.sock.sendall(struct.pack(">I", len(request)) + request)
+        response = recv_exact(self.sock, 4)
+        if response is None or struct.unpack(">I", response)[0] != MessageCodes.ACK:
+            raise socket.error("the control module refused to open an event stream")
+
+    ## forward every event to the workstation, until the stream is closed
+    def forward_events(self):
+        while not self.quit:
+            length = recv_exact(self.sock, 4)
+            if length is None:
+                return
+            data = recv_exact(self.sock, struct.unpack(">I", length)[0])
+            if data is None:
+                return
+            try:
+                event = read_event(data)
+            except ValueError, msg:  # the frame is dropped, the length prefix keeps the stream in sync
+                self.logger.warning("dropped a malformed event {0!r}: {1}".format(data, msg))
+                continue
+            self.sequence = event['sequence']
+            self.logger.debug("event: {0}".format(data))
+            encoding = self.heartbeat_thread.encoding
+            if encoding != 'json':
+                data = wire_format.dumps(event, encoding)
+            self.heartbeat_thread.send(data)
+
+    ## stop the thread, this also unblocks a pending read
+    def stop_thread(self):
+        self.quit = True
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
 
 
 ## @ingroup Onboard
@@ -335,36 +845,59 @@ class BroadcastThread(threading.Thread):
     # When the control module is ready, it will change the modification time of a file.
     # Here we poll these files until one is modified.
     def wait_for_control_module(self):
+        while not self.quit:
+            state = self.control_module_state()
+            if state is True:
+                self.logger.info("the control module is now ready")
+                return True
+            if state is False:
+                self.logger.info("the control module has failed to start up properly")
+                return False
+            time.sleep(2)
+
+    def control_module_state(self):
+        """
+        Check the files the control module modifies when it has started up
+
+        Returns:
+            True if the control module is ready, False if it failed to start and None if we don't know yet
+        """
         home_dir = os.path.expanduser('~')
         cm_rdy = os.path.join(home_dir, '.shae', 'cm_ready')
         cm_fail = os.path.join(home_dir, '.shae', 'cm_fail')
-        while not (os.path.exists(cm_rdy) or os.path.exists(cm_fail)):
-            time.sleep(2)
+        curr_time = time.time()
+        if os.path.exists(cm_rdy):
+            cm_rdy_mod_time = os.path.getmtime(cm_rdy)
+            if (curr_time - cm_rdy_mod_time < 5):
+                return True
+        if os.path.exists(cm_fail):
+            cm_fail_mod_time = os.path.getmtime(cm_fail)
+            if (curr_time - cm_fail_mod_time < 5):
+                return False
+        return None
+
+    def create_message(self, message_type):
+        """
+        Create the message that is broadcast to the workstation
 
-        while not self.quit:
-            curr_time = time.time()
-            if os.path.exists(cm_rdy):
-                cm_rdy_mod_time = os.path.getmtime(cm_rdy)
-                if (curr_time - cm_rdy_mod_time < 5):
-                    self.logger.info("the control module is now ready")
-                    return True
-            if os.path.exists(cm_fail):
-                cm_fail_mod_time = os.path.getmtime(cm_fail)
-                if (curr_time - cm_fail_mod_time < 5):
-                    self.logger.info("the control module has failed to start up properly")
-                    return False
-            time.sleep(2)
+        Args:
+            message_type: 'hello' or 'fail'
+        Returns:
+            the message in JSON format
+        """
+        message = {"message_type": message_type,
+                   "ip_drone": self.HOST,
+                   "ip_controller": self.controllerIp,
+                   "port_stream": self.streamPort,
+                   "port_commands": self.commandPort,
+                   "stream_file": self.streamFile,
+                   "vision_width": self.visionWidth,
+                   "encodings": list(wire_format.ENCODINGS)}
+        return json.dumps(message)
 
     ## start broadcasting hello messages
     def broadcast_hello_message(self):
-        hello = {"message_type": "hello",
-                 "ip_drone": self.HOST,
-                 "ip_controller": self.controllerIp,
-                 "port_stream": self.streamPort,
-                 "port_commands": self.commandPort,
-                 "stream_file": self.streamFile,
-                 "vision_width": self.visionWidth}
-        hello_json = json.dumps(hello)
+        hello_json = self.create_message("hello")
 
         bcsocket = socket.socket(socket.AF_INET,        # Internet
                                  socket.SOCK_DGRAM)     # UDP
@@ -389,14 +922,7 @@ class BroadcastThread(threading.Thread):
 
     ## start broadcasting fail messages
     def broadcast_fail_message(self):
-        fail = {"message_type": "fail",
-                "ip_drone": self.HOST,
-                "ip_controller": self.controllerIp,
-                "port_stream": self.streamPort,
-                "port_commands": self.commandPort,
-                "stream_file": self.streamFile,
-                "vision_width": self.visionWidth}
-        fail_json = json.dumps(fail)
+        fail_json = self.create_message("fail")
 
         bcsocket = socket.socket(socket.AF_INET,        # Internet
                                  socket.SOCK_DGRAM)     # UDP
@@ -430,9 +956,10 @@ if __name__ == '__main__':
     log_type = 'console'
     log_file = None
     is_simulation = False
+    use_event_loop = False
     try:
         argv = sys.argv[1:]  # only keep the actual arguments
-        opts, args = getopt.getopt(argv, "l:t:f:sh", ["level=", "type=", "file=", "simulate", "help"])
+        opts, args = getopt.getopt(argv, "l:t:f:seh", ["level=", "type=", "file=", "simulate", "event-loop", "help"])
     except getopt.GetoptError:
         print_help('server.py')
         sys.exit(-1)
@@ -457,6 +984,8 @@ if __name__ == '__main__':
             log_file = arg
         elif opt in ("-s", "--simulate"):
             is_simulation = True
+        elif opt in ("-e", "--event-loop"):
+            use_event_loop = True
         elif opt in ("-h", "--help"):
             print_help('server.py')
             sys.exit(0)
@@ -474,5 +1003,9 @@ if __name__ == '__main__':
     server_logger.setLevel(log_level)
 
     # set up server
-    server = Server(logger=server_logger, SIM=is_simulation)
+    if use_event_loop:
+        from event_server import EventServer
+        server = EventServer(logger=server_logger, SIM=is_simulation)
+    else:
+        server = Server(logger=server_logger, SIM=is_simulation)
     server.run()
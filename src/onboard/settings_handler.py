@@ -2,7 +2,18 @@ import sys
 import logging
 
 from solo import Solo
-from global_classes import logformat, dateformat
+from heartbeat import TRANSPORTS
+from wire_format import ENCODINGS
+from subscriptions import DEFAULT_SUBSCRIPTION_BANDWIDTH, MAX_FIELD_RATE, MAX_SUBSCRIPTION_BANDWIDTH, \
+    SUBSCRIBABLE_FIELDS
+from global_classes import MessageCodes, logformat, dateformat
+
+## heartbeats per second when the workstation configuration does not specify a rate
+DEFAULT_HEARTBEAT_RATE = 1.0
+## the highest heartbeat rate a workstation can ask for
+MAX_HEARTBEAT_RATE = 50.0
+## every how many heartbeats a keyframe is sent when delta heartbeats are used
+DEFAULT_KEYFRAME_INTERVAL = 10
 
 
 ## @ingroup Onboard
@@ -44,11 +55,41 @@ class SettingsHandler():
         if (self.message == "workstation_config"):  # set the workstation configuration and start sending heartbeats
             self.settings_logger.info("the drone will be configured to send heartbeats to the workstation")
             config = self.packet['configuration']
-            ip = config['ip_address']
-            port = config['port']  # keep the port as string for now
+            ip = str(config['ip_address'])  # json gives unicode, which can't be joined with the packed status code
+            port = str(config['port'])  # keep the port as string for now
+            # the workstation can ask for faster heartbeats, e.g. to update its map more often
+            rate = float(config.get('heartbeat_rate', DEFAULT_HEARTBEAT_RATE))
+            if not 0 < rate <= MAX_HEARTBEAT_RATE:
+                raise ValueError("the heartbeat rate should be between 0 and {0} Hz".format(MAX_HEARTBEAT_RATE))
+            # and for a transport that doesn't need a new connection for every heartbeat
+            transport = config.get('heartbeat_transport', 'connect')
+            if transport not in TRANSPORTS:
+                raise ValueError("the heartbeat transport should be one of {0}".format(TRANSPORTS))
+            # a workstation that understands the compact binary encoding gets its heartbeats in it
+            encoding = config.get('encoding', 'json')
+            if encoding not in ENCODINGS:
+                raise ValueError("the encoding should be one of {0}".format(ENCODINGS))
             self.settings_logger.debug("parsed IP: {0}".format(ip))
             self.settings_logger.debug("parsed port: {0}".format(port))
-            return (ip, port)
+            self.settings_logger.debug("parsed heartbeat rate: {0}".format(rate))
+            self.settings_logger.debug("parsed heartbeat transport: {0}".format(transport))
+            self.settings_logger.debug("parsed encoding: {0}".format(encoding))
+            options = {'rate': rate, 'transport': transport, 'delta': None, 'encoding': str(encoding)}
+            # on a busy link, the workstation can ask for keyframes with only the changes in between
+            if config.get('heartbeat_delta', False):
+                options['delta'] = self.parse_delta_config(config)
+                self.settings_logger.debug("parsed heartbeat delta configuration: {0}".format(options['delta']))
+            return (ip, port, options)
+        elif (self.message == "heartbeat_resync"):  # the workstation missed a delta heartbeat
+            self.settings_logger.info("the next heartbeat will be a keyframe")
+            return MessageCodes.HEARTBEAT_RESYNC
+        elif (self.message == "subscribe"):  # push some fields at their own rate, instead of polling them
+            subscription = self.parse_subscription(self.packet.get('configuration', {}))
+            self.settings_logger.info("subscribing to {0}".format(subscription['fields']))
+            return subscription
+        elif (self.message == "unsubscribe"):
+            self.settings_logger.info("stopping the subscription")
+            return {'fields': {}, 'max_bandwidth': DEFAULT_SUBSCRIPTION_BANDWIDTH}
         else:                                       # this is an array with the attributes that were required
             if not isinstance(self.message, list):  # if it is not a list, something went wrong
                 self.settings_logger.error("the message should be a list")
@@ -63,6 +104,12 @@ class SettingsHandler():
                 elif (setting_request['key'] == "distance_threshold"):
                     value = setting_request['value']
                     self.solo.set_distance_threshold(value)
+                elif (setting_request['key'] == "navigation_mode"):  # 'guided' or 'mission', see NavigationThread
+                    value = setting_request['value']
+                    self.solo.set_navigation_mode(value)
+                elif (setting_request['key'] == "acceptance_radius"):  # fly through the waypoints, see NavigationThread
+                    value = setting_request['value']
+                    self.solo.set_acceptance_radius(value)
                 elif (setting_request['key'] == "camera_angle"):
                     value = setting_request['value']
                     self.solo.set_camera_angle(value)
@@ -74,3 +121,45 @@ class SettingsHandler():
                     self.solo.set_camera_resolution(value)
                 else:
                     raise ValueError  # if we get to this point, something went wrong
+
+    def parse_subscription(self, config):
+        """
+        Args:
+            config: the configuration of a subscribe message, e.g.
+                    {"fields": {"current_location": 10, "battery_level": 0.2}, "max_bandwidth": 2048}
+        Returns:
+            a dict with the rate per field in Hz, and the bytes per second the pushes may use
+        """
+        fields = config.get('fields')
+        if not isinstance(fields, dict):
+            raise ValueError("FormatError: the fields should be an object with the rate per field")
+        rates = {}
+        for field, rate in fields.items():
+            if field not in SUBSCRIBABLE_FIELDS:
+                raise ValueError("{0} can not be subscribed to".format(field))
+            if not isinstance(rate, (int, long, float)) or not 0 < rate <= MAX_FIELD_RATE:
+                raise ValueError("the rate of {0} should be between 0 and {1} Hz".format(field, MAX_FIELD_RATE))
+            rates[str(field)] = float(rate)
+        max_bandwidth = config.get('max_bandwidth', DEFAULT_SUBSCRIPTION_BANDWIDTH)
+        if not isinstance(max_bandwidth, (int, long, float)) or not 0 < max_bandwidth <= MAX_SUBSCRIPTION_BANDWIDTH:
+            raise ValueError("the bandwidth should be between 0 and {0} bytes per second"
+                             .format(MAX_SUBSCRIPTION_BANDWIDTH))
+        return {'fields': rates, 'max_bandwidth': max_bandwidth}
+
+    def parse_delta_config(self, config):
+        """
+        Args:
+            config: the configuration of a workstation_config message
+        Returns:
+            a dict with the 'keyframe_interval' and the 'thresholds' per field for the delta heartbeats
+        """
+        keyframe_interval = int(config.get('keyframe_interval', DEFAULT_KEYFRAME_INTERVAL))
+        if keyframe_interval < 1:
+            raise ValueError("the keyframe interval should be at least 1")
+        thresholds = config.get('heartbeat_thresholds', {})
+        if not isinstance(thresholds, dict):
+            raise ValueError("FormatError: the heartbeat thresholds should be an object")
+        for field, threshold in thresholds.items():
+            if not isinstance(threshold, (int, long, float)) or threshold < 0:
+                raise ValueError("the threshold of {0} should be a positive number".format(field))
+        return {'keyframe_interval': keyframe_interval, 'thresholds': thresholds}
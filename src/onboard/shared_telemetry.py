@@ -0,0 +1,235 @@
+import os
+import mmap
+import math
+import struct
+import threading
+
+import wire_format
+from global_classes import LocationEncoder, TelemetrySnapshot, create_timestamp, monotonic
+
+## the file that backs the shared memory, in /dev/shm when the system has it so it never touches the disk
+TELEMETRY_PATH = "/dev/shm/shae_telemetry" if os.path.isdir("/dev/shm") else "/tmp/shae_telemetry"
+## the amount of records in the ring
+TELEMETRY_SLOTS = 16
+## a record that was published longer ago than this (in seconds) is not used for heartbeats,
+# the server asks the control module itself instead, so a control module that hangs or died is noticed
+MAX_TELEMETRY_AGE = 2.0
+
+## header of the shared memory: magic, version, amount of slots, size of a slot and the count of published records
+HEADER_FORMAT = ">4sHHIQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+## offset of the published count in the header, it is the only field that changes after the header is written
+COUNT_OFFSET = HEADER_SIZE - 8
+MAGIC = "SHTR"
+VERSION = 1
+## every slot starts with its sequence number, it is odd while the control module writes the record
+SEQUENCE_FORMAT = ">I"
+SEQUENCE_SIZE = struct.calcsize(SEQUENCE_FORMAT)
+## the record: monotonic time when it was published, then the fields of the TelemetrySnapshot and the waypoint order
+RECORD_FORMAT = ">ddddddiid3d16s?i"
+SLOT_SIZE = SEQUENCE_SIZE + struct.calcsize(RECORD_FORMAT)
+## the integers in the record use this value for None, the floats use NaN
+MISSING = -2 ** 31
+
+
+def heartbeat_fields(telemetry, waypoint_order):
+    """
+    The fields of a heartbeat, the StatusHandler and the server create heartbeats with this function
+
+    Args:
+        telemetry: TelemetrySnapshot instance
+        waypoint_order: the order of the last waypoint that was visited
+    Returns:
+        dict with the fields of the heartbeat
+    """
+    return {'current_location': telemetry.location(),
+            'waypoint_order': waypoint_order,
+            'orientation': telemetry.orientation,
+            'battery_level': telemetry.battery_level,
+            'gps_signal': telemetry.gps_signal,
+            'height': telemetry.height}
+
+
+def to_float(value):
+    return float('nan') if value is None else float(value)
+
+
+def from_float(value):
+    return None if math.isnan(value) else value
+
+
+def to_int(value):
+    return MISSING if value is None else int(value)
+
+
+def from_int(value):
+    return None if value == MISSING else value
+
+
+## @ingroup Onboard
+# @brief Publishes the telemetry of the control module in shared memory
+#
+# The memory holds a ring of records, each protected by a sequence number (a seqlock):
+# the sequence number is made odd, the record is written and the sequence number is made even again.
+# A reader that sees an odd sequence number, or a different one after reading the record, reads again.
+# The writer never waits for the readers, so a slow server can not delay the control module.
+class TelemetryWriter():
+    def __init__(self, path=TELEMETRY_PATH, slots=TELEMETRY_SLOTS):
+        """
+        Create (or take over) the shared memory
+
+        Args:
+            path: the file that backs the shared memory
+            slots: the amount of records in the ring
+        """
+        ## the amount of records in the ring
+        self.slots = slots
+        ## the amount of records that were published
+        self.count = 0
+        ## lock, so the DroneKit thread and the navigation thread can both publish
+        self.lock = threading.Lock()
+        size = HEADER_SIZE + slots * SLOT_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            os.ftruncate(fd, size)
+            ## the shared memory
+            self.memory = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)  # the mapping stays valid
+        self.memory[:] = '\x00' * size  # a server that still has the previous memory mapped sees an empty ring
+        struct.pack_into(HEADER_FORMAT, self.memory, 0, MAGIC, VERSION, slots, SLOT_SIZE, 0)
+
+    def publish(self, telemetry, waypoint_order):
+        """
+        Args:
+            telemetry: TelemetrySnapshot instance
+            waypoint_order: the order of the last waypoint that was visited
+        """
+        velocity = telemetry.velocity if telemetry.velocity is not None else (None, None, None)
+        record = (monotonic(), to_float(telemetry.timestamp), to_float(telemetry.latitude),
+                  to_float(telemetry.longitude), to_float(telemetry.height), to_float(telemetry.orientation),
+                  to_int(telemetry.battery_level), to_int(telemetry.gps_signal), to_float(telemetry.speed),
+                  to_float(velocity[0]), to_float(velocity[1]), to_float(velocity[2]),
+                  (telemetry.mode or '').encode('ascii', 'replace')[:16], bool(telemetry.armed),
+                  to_int(waypoint_order))
+        with self.lock:
+            offset = HEADER_SIZE + (self.count % self.slots) * SLOT_SIZE
+            sequence = struct.unpack_from(SEQUENCE_FORMAT, self.memory, offset)[0]
+            struct.pack_into(SEQUENCE_FORMAT, self.memory, offset, (sequence + 1) & 0xffffffff)
+            struct.pack_into(RECORD_FORMAT, self.memory, offset + SEQUENCE_SIZE, *record)
+            struct.pack_into(SEQUENCE_FORMAT, self.memory, offset, (sequence + 2) & 0xffffffff)
+            self.count += 1
+            struct.pack_into(">Q", self.memory, COUNT_OFFSET, self.count)
+
+    def close(self):
+        self.memory.close()
+
+
+## @ingroup Onboard
+# @brief Reads the telemetry that the control module publishes with a TelemetryWriter
+#
+# Reading is a few memory accesses, no request to the control module and no system call,
+# except for the attempts to map the memory while the control module has not created it yet.
+class TelemetryReader():
+    def __init__(self, path=TELEMETRY_PATH, max_age=MAX_TELEMETRY_AGE, retries=100):
+        """
+        Args:
+            path: the file that backs the shared memory
+            max_age: records that are older than this (in seconds) are not returned
+            retries: how many times a record is read again when the control module was writing it
+        """
+        ## the file that backs the shared memory
+        self.path = path
+        ## records that are older than this (in seconds) are not returned
+        self.max_age = max_age
+        ## how many times a record is read again when the control module was writing it
+        self.retries = retries
+        ## the shared memory, None until the control module created it
+        self.memory = None
+        ## the amount of records in the ring
+        self.slots = 0
+        ## how many times a record was read again, because the control module was writing it
+        self.collisions = 0
+
+    def open(self):
+        """
+        Returns:
+            True if the shared memory is mapped
+        """
+        if self.memory is not None:
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            size = os.fstat(fd).st_size
+            if size < HEADER_SIZE:
+                return False
+            memory = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, version, slots, slot_size, count = struct.unpack_from(HEADER_FORMAT, memory, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE \
+                or size < HEADER_SIZE + slots * SLOT_SIZE:
+            memory.close()
+            return False
+        self.memory = memory
+        self.slots = slots
+        return True
+
+    def latest(self):
+        """
+        Returns:
+            a tuple with the latest TelemetrySnapshot and waypoint order,
+            or None if there is none or if it is older than max_age
+        """
+        if not self.open():
+            return None
+        for attempt in range(self.retries):
+            count = struct.unpack_from(">Q", self.memory, COUNT_OFFSET)[0]
+            if count == 0:
+                return None
+            offset = HEADER_SIZE + ((count - 1) % self.slots) * SLOT_SIZE
+            before = struct.unpack_from(SEQUENCE_FORMAT, self.memory, offset)[0]
+            record = struct.unpack_from(RECORD_FORMAT, self.memory, offset + SEQUENCE_SIZE)
+            after = struct.unpack_from(SEQUENCE_FORMAT, self.memory, offset)[0]
+            if before == after and before % 2 == 0:
+                break
+            self.collisions += 1
+        else:
+            return None
+        (published, timestamp, latitude, longitude, height, orientation, battery_level, gps_signal, speed,
+         vx, vy, vz, mode, armed, waypoint_order) = record
+        if monotonic() - published > self.max_age:
+            return None
+        velocity = None
+        if not math.isnan(vx):
+            velocity = (vx, vy, vz)
+        telemetry = TelemetrySnapshot(timestamp=from_float(timestamp), latitude=from_float(latitude),
+                                      longitude=from_float(longitude), height=from_float(height),
+                                      orientation=from_float(orientation), battery_level=from_int(battery_level),
+                                      gps_signal=from_int(gps_signal), speed=from_float(speed), velocity=velocity,
+                                      mode=mode.rstrip('\x00'), armed=armed)
+        return telemetry, from_int(waypoint_order)
+
+    def heartbeat(self, encoding='json'):
+        """
+        Create a heartbeat like the StatusHandler would
+
+        Args:
+            encoding: one of wire_format.ENCODINGS
+        Returns:
+            the encoded heartbeat, or None if there is no recent telemetry in the shared memory
+        """
+        latest = self.latest()
+        if latest is None:
+            return None
+        data = heartbeat_fields(*latest)
+        data.update({'message_type': 'status', 'timestamp': create_timestamp(), 'heartbeat': True})
+        return wire_format.dumps(data, encoding, LocationEncoder)
+
+    def close(self):
+        if self.memory is not None:
+            self.memory.close()
+            self.memory = None
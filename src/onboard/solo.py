@@ -1,13 +1,29 @@
 import sys
 import math
 import logging
-from threading import RLock
+from threading import RLock, Event
 from pymavlink.mavutil import mavlink
-from dronekit import VehicleMode, Battery, Attitude, SystemStatus, LocationGlobal, LocationGlobalRelative, time
+from dronekit import VehicleMode, Battery, Attitude, SystemStatus, LocationGlobal, LocationGlobalRelative, Command, \
+    time
 
 from GoProManager import GoProManager
 from GoProConstants import GOPRO_RESOLUTION, GOPRO_FRAME_RATE
-from global_classes import Location, WayPoint, WayPointEncoder, DroneType, logformat, dateformat
+from global_classes import Location, WayPoint, WayPointEncoder, DroneType, TelemetrySnapshot, logformat, dateformat, \
+    monotonic
+from arrival import ArrivalDetector
+from geodesy import distance, from_enu, to_enu
+from events import EventLog, HALTED, LANDED, LOW_BATTERY, LOW_BATTERY_HYSTERESIS, LOW_BATTERY_LEVEL, MODE_CHANGED, \
+    TAKEOFF_COMPLETE
+
+## the DroneKit attributes that are copied into the TelemetrySnapshot, it is updated when one of them changes
+TELEMETRY_ATTRIBUTES = ('location.global_relative_frame', 'attitude', 'battery', 'gps_0',
+                        'airspeed', 'velocity', 'mode', 'armed')
+## the MAVLink messages in which the autopilot reports the progress of a mission
+MISSION_MESSAGES = ('MISSION_CURRENT', 'MISSION_ITEM_REACHED')
+## the ways the waypoints can be flown: a 'simple_goto' per waypoint, or uploaded as a mission the autopilot flies
+NAVIGATION_MODES = ('guided', 'mission')
+## the most seconds to wait for the autopilot to switch to AUTO mode
+MISSION_START_TIMEOUT = 5.0
 
 
 ## @ingroup Onboard
@@ -28,10 +44,14 @@ class Solo:
         """
         ## a DroneKit vehicle, that will be used to control the drone
         self.vehicle = vehicle
-        ## a lock to guarantee that no threads ask the drone for e.g. his location, while a takeoff is taking place
-        self.solo_lock = RLock()  # make sure that only 1 thread can access the vehicle at the same time
+        ## a lock to guarantee that only one thread sends commands to the drone at the same time
+        # it is not held while waiting for the drone, so status requests can be answered during e.g. a takeoff
+        self.solo_lock = RLock()
         ## a boolean, when this becomes 'True', the solo should stop visiting waypoints
         self.is_halted = False
+        ## threading.Event that is set by an emergency or stop command, every wait for the drone is cut short by it
+        # it is cleared again by resume(), when a new flight is started
+        self.interrupted = Event()
 
         # When you want to receive GoPro messages, this will have to be uncommented
         # However, using it might insert some instabilities
@@ -49,6 +69,11 @@ class Solo:
 
         ## how close should the drone get to its WayPoint before it is considered "reached"
         self.distance_threshold = 1.0
+        ## ArrivalDetector instance, it is updated by the location updates and wakes up visit_waypoint
+        self.arrival = ArrivalDetector(self.distance_threshold)
+        ## how close the drone should get to a waypoint before it flies on to the next one,
+        # None to stop at every waypoint
+        self.acceptance_radius = None
         self.update_rate = update_rate  # this attribute is not used by any of the functions used in Project Shae
         ## the height that the drone should fly on
         self.height = height
@@ -76,26 +101,162 @@ class Solo:
         self.logger.addHandler(handler)
         self.logger.setLevel(logging_level)
 
+        ## EventLog instance with the mission events, see events.py
+        self.events = EventLog()
+        ## boolean, True after a LOW_BATTERY event until the battery is charged again
+        self.battery_low = False
+        ## TelemetrySnapshot with the latest telemetry of the drone, it is replaced as a whole on every update
+        self.telemetry = self.read_telemetry()
+        ## functions that are called with every new TelemetrySnapshot, see add_telemetry_listener
+        self.telemetry_listeners = []
+        for attribute in TELEMETRY_ATTRIBUTES:
+            self.vehicle.add_attribute_listener(attribute, self.update_telemetry)
+
+        ## one of NAVIGATION_MODES
+        self.navigation_mode = 'guided'
+        ## the amount of waypoints in the mission that is being flown, 0 if there is none
+        self.mission_size = 0
+        ## the amount of waypoints of the mission that the autopilot reported reached
+        self.mission_reached = 0
+        ## the sequence number of the mission item the autopilot flies to
+        self.mission_current = 0
+        ## boolean, False until the autopilot reports the start of the new mission,
+        # the MISSION_CURRENT messages before that can still be about the previous one
+        self.mission_synced = False
+        ## threading.Event that is set when the autopilot reports progress
+        self.mission_event = Event()
+        for message in MISSION_MESSAGES:
+            self.vehicle.add_message_listener(message, self.update_mission)
+
         return
 
+    def read_telemetry(self):
+        """
+        Returns:
+            a TelemetrySnapshot with the current values of the vehicle attributes
+        """
+        location = self.vehicle.location.global_relative_frame
+        attitude = self.vehicle.attitude
+        battery = self.vehicle.battery
+        gps = self.vehicle.gps_0
+        velocity = self.vehicle.velocity
+        satellites = None
+        if gps is not None:
+            satellites = gps.satellites_visible
+        return TelemetrySnapshot(timestamp=time.time(),
+                                 latitude=location.lat,
+                                 longitude=location.lon,
+                                 height=location.alt,
+                                 orientation=attitude.yaw if attitude is not None else None,
+                                 battery_level=battery.level if battery is not None else None,
+                                 gps_signal=satellites if satellites is not None else -1,
+                                 speed=self.vehicle.airspeed,
+                                 velocity=tuple(velocity) if velocity is not None else None,
+                                 mode=self.vehicle.mode.name,
+                                 armed=self.vehicle.armed)
+
+    ## DroneKit attribute listener, this replaces the telemetry snapshot
+    def update_telemetry(self, vehicle, name, value):
+        # all listeners are called from the DroneKit thread, so there is only one writer
+        previous = self.telemetry
+        self.telemetry = self.read_telemetry()
+        self.detect_events(previous, self.telemetry)
+        self.arrival.update(self.telemetry, monotonic())
+        for listener in self.telemetry_listeners:
+            listener(self.telemetry)
+
+    def add_telemetry_listener(self, listener):
+        """
+        Args:
+            listener: function that is called with every new TelemetrySnapshot, from the DroneKit thread
+        """
+        self.telemetry_listeners.append(listener)
+
+    def detect_events(self, previous, telemetry):
+        """
+        Emit the events that can be seen in the telemetry: mode changes, landing and a low battery
+
+        Args:
+            previous: the TelemetrySnapshot before the update
+            telemetry: the new TelemetrySnapshot
+        """
+        if telemetry.mode != previous.mode:
+            self.events.emit(MODE_CHANGED, mode=telemetry.mode, previous_mode=previous.mode)
+        if previous.armed and not telemetry.armed:  # the autopilot disarms the drone once it is on the ground
+            self.events.emit(LANDED, latitude=telemetry.latitude, longitude=telemetry.longitude)
+        battery_level = telemetry.battery_level
+        if battery_level is not None:
+            if not self.battery_low and battery_level < LOW_BATTERY_LEVEL:
+                self.battery_low = True
+                self.events.emit(LOW_BATTERY, battery_level=battery_level)
+            elif self.battery_low and battery_level >= LOW_BATTERY_LEVEL + LOW_BATTERY_HYSTERESIS:
+                self.battery_low = False
+
+    ## MAVLink message listener, this keeps track of the mission items the autopilot reached
+    def update_mission(self, vehicle, name, message):
+        if self.mission_size == 0:
+            return  # no mission is being flown
+        # the items are numbered from 1, item 0 is the home location
+        if name == 'MISSION_CURRENT':
+            if not self.mission_synced:
+                self.mission_synced = message.seq <= 1
+                if not self.mission_synced:
+                    return
+            self.mission_current = message.seq
+            reached = message.seq - 1  # the items before the current one were reached
+        else:
+            reached = message.seq
+        reached = min(reached, self.mission_size)
+        if reached > self.mission_reached:
+            self.mission_reached = reached
+            self.mission_event.set()
+
+    def get_telemetry(self):
+        """
+        Returns:
+            the latest TelemetrySnapshot, this never blocks
+        """
+        return self.telemetry
+
+    ## interrupt whatever the solo is waiting for, so an emergency or stop command can take over right away
+    def interrupt(self):
+        self.interrupted.set()
+        self.arrival.wake()
+        self.mission_event.set()
+
+    ## allow the solo to wait for the drone again after an interruption
+    def resume(self):
+        self.interrupted.clear()
+
     ## arm the solo, making it available for automatic takeoff and flight
     def arm(self):
-        self.solo_lock.acquire()
-        self.vehicle.mode = VehicleMode("GUIDED")
+        with self.solo_lock:
+            if self.interrupted.is_set():  # e.g. an emergency landing, GUIDED mode would undo it
+                self.logger.info("arming was interrupted")
+                return
+            self.vehicle.mode = VehicleMode("GUIDED")
         while self.vehicle.mode != "GUIDED":
-            time.sleep(0.1)
+            if self.interrupted.wait(0.1):
+                self.logger.info("arming was interrupted")
+                return
         self.logger.debug("control granted")
         if self.vehicle.armed is False:
             # Don't let the user try to arm until autopilot is ready
             self.logger.debug("waiting for vehicle to initialise...")
             while not self.vehicle.is_armable:
-                time.sleep(1)
+                if self.interrupted.wait(1):
+                    self.logger.info("arming was interrupted")
+                    return
+            self.solo_lock.acquire()
             self.vehicle.armed = True
+            self.solo_lock.release()
             self.logger.info("the solo is now armed")
-        self.solo_lock.release()
 
     ## Launch the drone to predefined height, the drone has to be armed on beforehand
     def takeoff(self):
+        if self.interrupted.is_set():
+            self.logger.info("takeoff was interrupted")
+            return 0
         self.solo_lock.acquire()
         if self.vehicle.mode != 'GUIDED':
             self.logger.error("DroneDirectError: 'takeoff({0})' was not executed. \
@@ -103,36 +264,43 @@ class Solo:
             self.solo_lock.release()
             return -1
 
+        self.solo_lock.release()
         while not self.vehicle.armed:
             self.logger.debug("waiting for arming...")
-            time.sleep(1)
-
-        if self.vehicle.system_status != SystemStatus('STANDBY'):
-            self.logger.debug("solo was already airborne")
-            loc = self.vehicle.location.global_frame
-            loc.alt = loc.alt + self.height
-            self.vehicle.commands.goto(loc)
-            self.vehicle.flush()
-            self.logger.debug("command flushed")
-            self.solo_lock.release()
-            return
+            if self.interrupted.wait(1):
+                self.logger.info("takeoff was interrupted")
+                return 0  # retrying would undo the interruption
 
-        self.logger.info("the solo is now taking off")
-        self.vehicle.simple_takeoff(self.height)
+        with self.solo_lock:  # takeoff runs as a job, an exception should not leave the lock taken
+            if self.interrupted.is_set():
+                self.logger.info("takeoff was interrupted")
+                return 0
+            if self.vehicle.system_status != SystemStatus('STANDBY'):
+                self.logger.debug("solo was already airborne")
+                loc = self.vehicle.location.global_frame
+                loc.alt = loc.alt + self.height
+                self.vehicle.commands.goto(loc)
+                self.vehicle.flush()
+                self.logger.debug("command flushed")
+                return
+
+            self.logger.info("the solo is now taking off")
+            self.vehicle.simple_takeoff(self.height)
         # Wait until the vehicle reaches a safe height
         # while self.vehicle.mode == 'GUIDED':
         while True:
             self.logger.debug("solo is in {0} mode".format(self.vehicle.mode))
             if self.vehicle.location.global_relative_frame.alt >= self.height * 0.95:  # Trigger just below target alt.
                 self.logger.info("the solo is now ready to fly")
-                self.solo_lock.release()
+                self.events.emit(TAKEOFF_COMPLETE, height=self.vehicle.location.global_relative_frame.alt)
+                return 0
+            if self.interrupted.wait(1):
+                self.logger.info("takeoff was interrupted")
                 return 0
-            time.sleep(1)
         # Sometimes the Solo will switch out of GUIDED mode during takeoff
         # If this happens, we will return -1 so we can try again
         self.logger.error("DroneDirectError: 'takeoff({0})' was interrupted. \
                           Vehicle was swicthed out of GUIDED mode".format(self.height))
-        self.solo_lock.release()
         return -1
 
     ## Stop the drone from visiting waypoints, this does not land the drone
@@ -140,19 +308,27 @@ class Solo:
         self.solo_lock.acquire()
         self.is_halted = True
         self.solo_lock.release()
+        self.arrival.wake()
+        self.mission_event.set()
 
     # Stop the drone from moving, this does not land the drone
     def brake(self):
+        self.interrupt()
         self.solo_lock.acquire()
         mode = self.vehicle.mode
         msg = self.vehicle.message_factory.set_mode_encode(0, mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED, 17)
         self.vehicle.send_mavlink(msg)
         self.vehicle.flush()
+        if mode == "AUTO":
+            mode = VehicleMode("GUIDED")  # going back to AUTO would continue the mission
         self.vehicle.mode = mode
         self.solo_lock.release()
+        telemetry = self.telemetry
+        self.events.emit(HALTED, latitude=telemetry.latitude, longitude=telemetry.longitude, height=telemetry.height)
 
     # Land the drone
     def land(self):
+        self.interrupt()
         self.solo_lock.acquire()
         self.vehicle.mode = VehicleMode("LAND")
         while self.vehicle.mode != "LAND":
@@ -161,35 +337,109 @@ class Solo:
         self.logger.info("Landing Solo...")
         self.solo_lock.release()
 
-    def visit_waypoint(self, waypoint):
+    def visit_waypoint(self, waypoint, radius=None):
         """
         Fly to the coordinates of the waypoint
-        This function only returns when the solo has visited the waypoint
+        This function only returns when the solo has visited the waypoint,
+        it is woken up by the location update that reaches it (see ArrivalDetector)
 
         Args:
             waypoint: a WayPoint
+            radius: how close (in meters) the solo should get, by default the distance threshold.
+                    With a larger radius the next waypoint can be sent while the solo is still at cruise speed
+        Returns:
+            True if the solo arrived, False if it was interrupted, halted or left GUIDED mode
         """
         # Here we don't need to take the lock, since we want to be able to send heartbeats while we visit waypoints
 
         location = LocationGlobalRelative(lat=waypoint.location.latitude, lon=waypoint.location.longitude, alt=self.height)
+        self.arrival.set_target(location.lat, location.lon, location.alt, radius)
         self.vehicle.simple_goto(location=location, airspeed=self.speed)
 
-        latlon_to_m = 1.113195e5   # converts lat/lon to meters
-        while self.vehicle.mode == "GUIDED":
-            veh_loc = self.vehicle.location.global_relative_frame
-            diff_lat_m = (location.lat - veh_loc.lat) * latlon_to_m
-            diff_lon_m = (location.lon - veh_loc.lon) * latlon_to_m
-            diff_alt_m = location.alt - veh_loc.alt
-            dist_xyz = math.sqrt(diff_lat_m**2 + diff_lon_m**2 + diff_alt_m**2)
-            if dist_xyz > self.distance_threshold and not self.is_halted:
-                time.sleep(0.5)
-            else:
-                if not self.is_halted:
+        try:
+            while self.vehicle.mode == "GUIDED":
+                if self.interrupted.is_set():
+                    self.logger.info("Solo was interrupted")
+                    return False
+                if self.is_halted:
+                    self.logger.info("Solo was halted")
+                    self.is_halted = False  # reset the self.is_halted attribute
+                    return False
+                if self.arrival.arrived():
                     self.logger.info("Solo arrived at waypoint")
-                else:
+                    return True
+                self.arrival.wait(0.5)  # in case the location updates stop, the mode is checked again
+            return False
+        finally:
+            self.arrival.clear()
+
+    def fly_mission(self, waypoints, on_reached):
+        """
+        Upload the waypoints as a mission and let the autopilot fly it in AUTO mode
+        This function only returns when the mission is done, or when the solo was interrupted, halted or left AUTO mode
+
+        Args:
+            waypoints: list of WayPoint
+            on_reached: function that is called with every WayPoint the autopilot reports reached, in order
+        Returns:
+            True if every waypoint was reached
+        """
+        self.solo_lock.acquire()
+        try:
+            radius = self.acceptance_radius or self.distance_threshold
+            commands = self.vehicle.commands
+            commands.download()
+            commands.wait_ready()
+            commands.clear()
+            for waypoint in waypoints:
+                # param1 is the time to hold at the waypoint, param2 the acceptance radius
+                commands.add(Command(0, 0, 0, mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT, mavlink.MAV_CMD_NAV_WAYPOINT,
+                                     0, 0, 0, radius, 0, 0,
+                                     waypoint.location.latitude, waypoint.location.longitude, self.height))
+            commands.upload()
+            self.logger.info("uploaded a mission with {0} waypoints".format(len(waypoints)))
+
+            self.mission_size = len(waypoints)
+            self.mission_reached = 0
+            self.mission_current = 0
+            self.mission_synced = False
+            self.mission_event.clear()
+            commands.next = 0  # start at the first item, the autopilot could resume a previous mission otherwise
+            self.vehicle.groundspeed = self.speed
+            self.vehicle.mode = VehicleMode("AUTO")
+        finally:
+            self.solo_lock.release()
+
+        try:
+            start = time.time()
+            while self.vehicle.mode != "AUTO":
+                if self.interrupted.wait(0.1) or time.time() - start > MISSION_START_TIMEOUT:
+                    self.logger.error("the solo did not switch to AUTO mode, the mission was not started")
+                    return False
+            reported = 0
+            while True:
+                self.mission_event.clear()
+                while reported < self.mission_reached:
+                    on_reached(waypoints[reported])
+                    reported += 1
+                if reported == len(waypoints):
+                    self.logger.info("Solo finished the mission")
+                    self.vehicle.mode = VehicleMode("GUIDED")  # hold here, like after the last 'simple_goto'
+                    return True
+                if self.interrupted.is_set():
+                    self.logger.info("Solo was interrupted")
+                    return False
+                if self.is_halted:
                     self.logger.info("Solo was halted")
                     self.is_halted = False  # reset the self.is_halted attribute
-                return
+                    self.vehicle.mode = VehicleMode("GUIDED")
+                    return False
+                if self.vehicle.mode != "AUTO":
+                    self.logger.info("Solo left AUTO mode")
+                    return False
+                self.mission_event.wait(0.5)
+        finally:
+            self.mission_size = 0
 
     ## Point the copter in a direction
     def point(self, degrees, relative=True):
@@ -259,9 +509,7 @@ class Solo:
         x_ef = y * math.cos(yaw) - x * math.sin(yaw)
         y_ef = y * math.sin(yaw) + x * math.cos(yaw)
 
-        latlon_to_m = 1.113195e5   # converts lat/lon to meters
-        lat = x_ef / latlon_to_m + location.lat
-        lon = y_ef / latlon_to_m + location.lon
+        lat, lon = from_enu(location.lat, location.lon, east=y_ef, north=x_ef)
         alt = z + location.alt
         msg = self.vehicle.message_factory.set_position_target_global_int_encode(
             0,  # time_boot_ms (not used)
@@ -284,50 +532,33 @@ class Solo:
         self.last_send_translate = time.time()
         self.point(0)
         self.logger.info("translating...")
+        self.solo_lock.release()
         if wait_for_arrival:
-            while self.vehicle.mode == "GUIDED":
+            while self.vehicle.mode == "GUIDED" and not self.interrupted.wait(0.1):
                 veh_loc = self.vehicle.location.global_relative_frame
-                diff_lat_m = (lat - veh_loc.lat) * latlon_to_m
-                diff_lon_m = (lon - veh_loc.lon) * latlon_to_m
+                diff_east_m, diff_north_m = to_enu(veh_loc.lat, veh_loc.lon, lat, lon)
                 diff_alt_m = alt - veh_loc.alt
-                dist_xyz = math.sqrt(diff_lat_m**2 + diff_lon_m**2 + diff_alt_m**2)
+                dist_xyz = math.sqrt(diff_north_m**2 + diff_east_m**2 + diff_alt_m**2)
                 if dist_xyz < self.distance_threshold:
                     self.logger.info("Arrived")
-                    self.solo_lock.release()
                     return
             self.logger.error("DroneDirectError: 'translate({0},{1},{2})' was interrupted. \
                               Vehicle was switched out of GUIDED mode".format(x, y, z))
-        self.solo_lock.release()
 
     def get_battery_level(self):
-        self.solo_lock.acquire()
-        batt = self.vehicle.battery
-        self.solo_lock.release()
-        return batt.level
+        return self.telemetry.battery_level
 
     def get_drone_type(self):
         return self.drone_type
 
     def get_location(self):
-        self.solo_lock.acquire()
-        veh_loc = self.vehicle.location.global_relative_frame
-        loc = Location(longitude=veh_loc.lon, latitude=veh_loc.lat)
-        self.solo_lock.release()
-        return loc
+        return self.telemetry.location()
 
     def get_gps_signal_strength(self):
-        self.solo_lock.acquire()
-        ss = self.vehicle.gps_0.satellites_visible
-        if ss is None:
-            ss = -1
-        self.solo_lock.release()
-        return ss
+        return self.telemetry.gps_signal
 
     def get_speed(self):
-        self.solo_lock.acquire()
-        airspeed = self.vehicle.airspeed
-        self.solo_lock.release()
-        return airspeed
+        return self.telemetry.speed
 
     def get_target_speed(self):
         return self.speed
@@ -346,13 +577,38 @@ class Solo:
             threshold: threshold to use to determine wheter the Solo has reached a waypoint
         """
         self.distance_threshold = threshold
+        self.arrival.threshold = threshold
+        return
+
+    def get_acceptance_radius(self):
+        return self.acceptance_radius
+
+    def set_acceptance_radius(self, radius):
+        """
+        Args:
+            radius: how close (in meters) the Solo should get to a waypoint before it flies on to the next one,
+                    None or 0 to stop at every waypoint
+        """
+        if radius is not None and radius < 0:
+            raise ValueError("the acceptance radius can not be negative")
+        self.acceptance_radius = radius or None
+        return
+
+    def get_navigation_mode(self):
+        return self.navigation_mode
+
+    def set_navigation_mode(self, mode):
+        """
+        Args:
+            mode: one of NAVIGATION_MODES, it is used from the next waypoint on
+        """
+        if mode not in NAVIGATION_MODES:
+            raise ValueError("the navigation mode should be one of {0}".format(", ".join(NAVIGATION_MODES)))
+        self.navigation_mode = mode
         return
 
     def get_height(self):
-        self.solo_lock.acquire()
-        loc = self.vehicle.location
-        self.solo_lock.release()
-        return loc.global_relative_frame.alt
+        return self.telemetry.height
 
     def get_target_height(self):
         return self.height
@@ -366,10 +622,7 @@ class Solo:
         return
 
     def get_orientation(self):
-        self.solo_lock.acquire()
-        att = self.vehicle.attitude
-        self.solo_lock.release()
-        return att.yaw
+        return self.telemetry.orientation
 
     def get_camera_angle(self):
          # self.solo_lock.acquire()
@@ -470,7 +723,7 @@ class Solo:
         if yaw is None:
             yaw = gmbl.yaw()
 
-        while gmbl.pitch != pitch:
+        while gmbl.pitch != pitch and not self.interrupted.is_set():
             gmbl.rotate(pitch, roll, yaw)
             print gmbl.pitch
             time.sleep(0.1)
@@ -488,33 +741,20 @@ class Solo:
         Returns:
             distance in metres to the waypoint
         """
-        lat = waypoint.location.latitude
-        lon = waypoint.location.longitude
-        alt = self.height
-
-        target_waypoint_location = LocationGlobalRelative(lat, lon, alt)
-        distance_to_point = self.get_distance_metres(self.vehicle.location.global_frame, target_waypoint_location)
-        return distance_to_point
+        return self.get_distance_metres(self.get_location(), waypoint.location)
 
     def get_location_metres(self, original_location, dNorth, dEast):
         """
         This function was taken from http://python.dronekit.io/examples/mission_basic.html
 
         Args:
-            original_location: a Location
+            original_location: a LocationGlobal
         Returns:
             a LocationGlobal object containing the latitude/longitude `dNorth` and `dEast` metres from the
             specified `original_location`. The returned Location has the same `alt` value
             as `original_location`.
         """
-        earth_radius = 6378137.0  # Radius of "spherical" earth
-        # Coordinate offsets in radians
-        dLat = dNorth / earth_radius
-        dLon = dEast / (earth_radius * math.cos(math.pi * original_location.lat / 180))
-
-        # New position in decimal degrees
-        newlat = original_location.latitude + (dLat * 180 / math.pi)
-        newlon = original_location.longitude + (dLon * 180 / math.pi)
+        newlat, newlon = from_enu(original_location.lat, original_location.lon, east=dEast, north=dNorth)
         return LocationGlobal(newlat, newlon, original_location.alt)
 
     def get_distance_metres(self, aLocation1, aLocation2):
@@ -525,12 +765,9 @@ class Solo:
             aLocation1: a Location
             aLocation2: a Location
         Returns:
-            the ground distance in metres between two LocationGlobal objects.
+            the ground distance in metres between two Location objects.
         """
-        latlon_to_m = 1.113195e5   # converts lat/lon to meters
-        dlat = aLocation2.latitude - aLocation1.latitude
-        dlong = aLocation2.longitude - aLocation1.longitude
-        return math.sqrt((dlat * dlat) + (dlong * dlong)) * latlon_to_m
+        return distance(aLocation1.latitude, aLocation1.longitude, aLocation2.latitude, aLocation2.longitude)
 
     def condition_yaw(self, heading, relative=False):
         """
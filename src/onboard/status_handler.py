@@ -1,17 +1,17 @@
 import sys
-import copy
-import json
 import logging
-from dronekit import time
 
+import wire_format
 from solo import Solo
-from global_classes import DroneTypeEncoder, LocationEncoder, WayPoint, WayPointEncoder, WayPointQueue, logformat, dateformat
+from shared_telemetry import heartbeat_fields
+from global_classes import LocationEncoder, WayPoint, WayPointQueue, \
+    create_timestamp, logformat, dateformat
 
 
 ## @ingroup Onboard
 # @brief This class will take care of packets of the 'status' message type
 class StatusHandler():
-    def __init__(self, solo, queue, logging_level, log_type='console', filename=''):
+    def __init__(self, solo, queue, logging_level, log_type='console', filename='', job_dispatcher=None):
         """
         Initiate the handler
 
@@ -21,6 +21,7 @@ class StatusHandler():
             logging_level: the level that should be used for logging, e.g. DEBUG
             log_type: log to stdout ('console') or to a file ('file')
             filename: the name of the file if log_type is 'file'
+            job_dispatcher: JobDispatcher instance, needed to answer 'job_status' requests
         """
         ## The entire request from the workstation
         self.packet = None
@@ -30,6 +31,10 @@ class StatusHandler():
         self.solo = solo
         ## WayPointQueue instance
         self.waypoint_queue = queue
+        ## JobDispatcher instance
+        self.job_dispatcher = job_dispatcher
+        ## the encoding of the request, the response is sent in the same encoding
+        self.encoding = 'json'
 
         # set up logging
         ## logger instance
@@ -44,34 +49,28 @@ class StatusHandler():
         self.stat_logger.addHandler(handler)
         self.stat_logger.setLevel(logging_level)
 
-    def handle_packet(self, packet, message):
+    def handle_packet(self, packet, message, encoding='json'):
         self.packet = packet
         self.message = message
+        self.encoding = encoding
         if (self.message == "all_statuses"):
             self.waypoint_queue.queue_lock.acquire()
             last_wayp_ord = self.waypoint_queue.last_waypoint_order
             self.waypoint_queue.queue_lock.release()
 
-            battery = self.solo.get_battery_level()
-            gps_signal_strength = self.solo.get_gps_signal_strength()
-            loc = self.solo.get_location()
-            orientation = self.solo.get_orientation()
-            drone_type = self.solo.get_drone_type()
-            speed = self.solo.get_speed()
+            telemetry = self.solo.get_telemetry()  # one consistent snapshot for the whole status
             target_speed = self.solo.get_target_speed()
-            height = self.solo.get_height()
             target_height = self.solo.get_target_height()
             drone_type = self.solo.get_drone_type()
-            drone_type.__dict__
 
-            data = {'current_location': loc,
+            data = {'current_location': telemetry.location(),
                     'waypoint_order': last_wayp_ord,
-                    'battery_level': battery,
-                    'gps_signal': gps_signal_strength,
-                    'orientation': orientation,
-                    'speed': speed,
+                    'battery_level': telemetry.battery_level,
+                    'gps_signal': telemetry.gps_signal,
+                    'orientation': telemetry.orientation,
+                    'speed': telemetry.speed,
                     'selected_speed': target_speed,
-                    'height': height,
+                    'height': telemetry.height,
                     'selected_height': target_height,
                     'drone_type': drone_type.__dict__}
             return self.create_packet(data, cls=LocationEncoder, heartbeat=False)
@@ -80,123 +79,146 @@ class StatusHandler():
             self.waypoint_queue.queue_lock.acquire()
             last_wayp_ord = self.waypoint_queue.last_waypoint_order
             self.waypoint_queue.queue_lock.release()
-            height = self.solo.get_height()
-            battery = self.solo.get_battery_level()
-            gps_signal_strength = self.solo.get_gps_signal_strength()
-            loc = self.solo.get_location()
-            orientation = self.solo.get_orientation()
-
-            data = {'current_location': loc,
-                    'waypoint_order': last_wayp_ord,
-                    'orientation': orientation,
-                    'battery_level': battery,
-                    'gps_signal': gps_signal_strength,
-                    'height': height}
+            telemetry = self.solo.get_telemetry()
 
+            data = heartbeat_fields(telemetry, last_wayp_ord)  # the server creates the same from the shared memory
             return self.create_packet(data, cls=LocationEncoder, heartbeat=True)
 
+        elif (self.message == "events"):  # the mission events after 'since', e.g. the ones a workstation missed
+            since = self.packet.get('since', 0)
+            if not isinstance(since, (int, long)):
+                raise ValueError("FormatError: since should be a sequence number")
+            return self.create_packet({'events': self.solo.events.since(since)})
+
+        elif (self.message == "job_status"):  # the state of a job that was started by a navigation message
+            if self.job_dispatcher is None or 'job_id' not in self.packet:
+                raise ValueError("job_status needs a job_id")
+            job = self.job_dispatcher.get_job(self.packet['job_id'])
+            if job is None:
+                raise ValueError("unknown job {0}".format(self.packet['job_id']))
+            return self.create_packet(job.to_dict())
+
         else:                                       # this is an array with the attributes that were required
             if not isinstance(self.message, list):  # if it is not a list, something went wrong
                 self.stat_logger.warning("Message not a list")
                 raise ValueError("FormatError")
-            for status_request in self.message:
-                if (status_request['key'] == "battery_level"):
-                    battery = self.solo.get_battery_level()
-                    data = {'battery_level': battery}
-                    return self.create_packet(data)
-
-                if (status_request['key'] == "gps_signal"):
-                    gps_signal_strength = self.solo.get_gps_signal_strength()
-                    data = {'gps_signal': gps_signal_strength}
-                    return self.create_packet(data)
-
-                elif (status_request['key'] == "current_location"):
-                    loc = self.solo.get_location()
-                    loc_message = {'current_location': loc}
-                    return self.create_packet(loc_message, cls=LocationEncoder)
-
-                elif (status_request['key'] == "drone_type"):
-                    self.stat_logger.info("Getting dronetype")
-                    drone_type = self.solo.get_drone_type()
-                    return self.create_packet({'drone_type': drone_type}, cls=DroneTypeEncoder)
-
-                elif (status_request['key'] == "waypoint_order"):
-                    # this message is obsolete, instead the drone will let the workstation know whether
-                    # it has reached the next waypoint through its status
-                    self.stat_logger.info("Obsolete waypoint reached message received")
-
-                elif (status_request['key'] == "next_waypoint"):
-                    self.waypoint_queue.queue_lock.acquire()
-                    next_wp = self.waypoint_queue.queue[0]
-                    self.waypoint_queue.queue_lock.release()
-                    data = json.dumps(next_wp, cls=WayPointEncoder)  # TODO: remove the json.dumps
-                    return self.create_packet(data)
-
-                elif (status_request['key'] == "next_waypoints"):
-                    self.waypoint_queue.queue_lock.acquire()
-                    wpq = copy.deepcopy(self.waypoint_queue.queue)
-                    self.waypoint_queue.queue_lock.release()
-                    path_message = {'next_waypoints': wpq}
-                    data = json.dumps(path_message, cls=WayPointEncoder)  # TODO: remove the json.dumps
-                    return self.create_packet(data)
-
-                elif (status_request['key'] == "speed"):
-                    speed = self.solo.get_speed()
-                    data = {'speed': speed}
-                    return self.create_packet(data)
-
-                elif (status_request['key'] == "selected_speed"):
-                    target_speed = self.solo.get_target_speed()
-                    data = {'selected_speed': target_speed}
-                    return self.create_packet(data)
-
-                elif (status_request['key'] == "height"):
-                    height = self.solo.get_height()
-                    data = {'height': height}
-                    return self.create_packet(data)
-
-                elif (status_request['key'] == "selected_height"):
-                    target_height = self.solo.get_target_height()
-                    data = {'selected_height': target_height}
-                    return self.create_packet(data)
-
-                elif (status_request['Key'] == "orientation"):
-                    orientation = self.solo.get_orientation()
-                    data = {'orientation': orientation}
-                    return self.create_packet(data)
-
-                elif (status_request['Key'] == "camera_angle"):
-                    camera_angle = self.solo.get_camera_angle()
-                    data = {'camera_angle': camera_angle}
-                    return self.create_packet(data)
-
-                elif (status_request['key'] == "fps"):
-                    fps = self.solo.get_camera_fps()
-                    data = {'fps': fps}
-                    return self.create_packet(data)
-
-                elif (status_request['key'] == "resolution"):
-                    resolution = self.solo.get_camera_resolution()
-                    data = {'resolution': resolution}
-                    return self.create_packet(data)
+            return self.create_packet(self.read_statuses(self.message))
+
+    def read_statuses(self, status_requests):
+        """
+        Answer all requested keys in one packet, a key that can not be answered gets an entry in 'errors'
+        instead of failing the whole request
 
+        Args:
+            status_requests: list of dicts with a 'key'
+        Returns:
+            dict with the value per key, and an 'errors' dict with the reason per key if there were errors
+        """
+        telemetry = self.solo.get_telemetry()  # one snapshot for all keys
+        data = {}
+        errors = {}
+        waypoints = None
+        for status_request in status_requests:
+            if not isinstance(status_request, dict) or 'key' not in status_request:
+                raise ValueError("FormatError: every status request needs a key")
+            key = status_request['key']
+            try:
+                if key == "next_waypoints":
+                    if waypoints is None:  # one snapshot of the queue, even if both keys are requested
+                        waypoints = self.waypoint_queue.snapshot()
+                    data[key] = waypoints.to_dicts()
+                elif key == "next_waypoint":
+                    if waypoints is None:
+                        waypoints = self.waypoint_queue.snapshot()
+                    if len(waypoints):
+                        front = waypoints.waypoint(len(waypoints) - 1)
+                        data[key] = {'order': front.order,
+                                     'location': {'latitude': front.location.latitude,
+                                                  'longitude': front.location.longitude}}
+                    else:
+                        errors[key] = "there are no waypoints left"
+                elif key == "next_waypoints_since":
+                    data[key] = self.read_waypoint_changes(status_request.get('since', -1))
                 else:
-                    raise ValueError  # if we get to this point, something went wrong
+                    data[key] = self.read_status(key, telemetry)
+            except KeyError:
+                errors[key] = "unknown key"
+            except Exception, msg:  # e.g. the camera does not answer, the other keys can still be sent
+                self.stat_logger.warning("could not read '{0}': {1}".format(key, msg))
+                errors[key] = str(msg) or type(msg).__name__
+        if errors:
+            data['errors'] = errors
+        return data
+
+    def read_waypoint_changes(self, since):
+        """
+        Args:
+            since: the version of the waypoint queue the workstation knows, -1 if it does not know any
+        Returns:
+            dict with the current 'version', the 'waypoints' (with their 'id') that were inserted after 'since',
+            and the ids of the waypoints that were 'removed' after 'since'.
+            If the changes after 'since' are not known, 'reset' is True and 'waypoints' has all the waypoints.
+        """
+        if not isinstance(since, (int, long)):
+            raise ValueError("FormatError: since should be a version of the waypoint queue")
+        snapshot, insertions, removed = self.waypoint_queue.changes_since(since)
+        if insertions is None:
+            return {'version': snapshot.version, 'reset': True, 'waypoints': snapshot.to_dicts(ids=True),
+                    'removed': []}
+        return {'version': snapshot.version, 'reset': False,
+                'waypoints': snapshot.to_dicts(ids=True, inserted_after=insertions), 'removed': removed}
+
+    def read_status(self, key, telemetry):
+        """
+        Args:
+            key: the requested key
+            telemetry: the TelemetrySnapshot of this request
+        Returns:
+            the value of the key
+        Raises:
+            KeyError: if the key is unknown
+        """
+        if (key == "battery_level"):
+            return telemetry.battery_level
+        elif (key == "gps_signal"):
+            return telemetry.gps_signal
+        elif (key == "current_location"):
+            return LocationEncoder().default(telemetry.location())
+        elif (key == "drone_type"):
+            return self.solo.get_drone_type().__dict__
+        elif (key == "waypoint_order"):
+            # the heartbeats contain this as well, but a workstation without heartbeats can ask for it
+            with self.waypoint_queue.queue_lock:
+                return self.waypoint_queue.last_waypoint_order
+        elif (key == "speed"):
+            return telemetry.speed
+        elif (key == "selected_speed"):
+            return self.solo.get_target_speed()
+        elif (key == "height"):
+            return telemetry.height
+        elif (key == "selected_height"):
+            return self.solo.get_target_height()
+        elif (key == "orientation"):
+            return telemetry.orientation
+        elif (key == "camera_angle"):
+            return self.solo.get_camera_angle()
+        elif (key == "fps"):
+            return self.solo.get_camera_fps()
+        elif (key == "resolution"):
+            return self.solo.get_camera_resolution()
+        raise KeyError(key)
 
     def create_packet(self, data, cls=None, heartbeat=False):
         """
-        Create a packet in JSON format from some data
+        Create a packet from some data, in the encoding of the request
         Args:
             data: dict with data that should come in the packet
         """
-        now = time.time()
-        localtime = time.localtime(now)
-        milliseconds = '%03d' % int((now - int(now)) * 1000)
-        timestamp = time.strftime('%d%m%Y%H%M%S', localtime) + milliseconds
+        timestamp = create_timestamp()
 
         if heartbeat:
             data.update({'message_type': 'status', 'timestamp': timestamp, 'heartbeat': True})
         else:
             data.update({'message_type': 'status', 'timestamp': timestamp, 'heartbeat': False})
 
-        return json.dumps(data, cls=cls)
+        return wire_format.dumps(data, self.encoding, cls)
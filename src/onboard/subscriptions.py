@@ -0,0 +1,169 @@
+import wire_format
+from global_classes import LocationEncoder, create_timestamp, monotonic
+
+## the fields a workstation can subscribe to, they are answered from the shared telemetry,
+# or with one multi-key status request when the shared telemetry is not recent
+SUBSCRIBABLE_FIELDS = ('current_location', 'waypoint_order', 'orientation', 'battery_level', 'gps_signal',
+                       'height', 'speed')
+## the highest rate at which a field can be pushed, in Hz
+MAX_FIELD_RATE = 50.0
+## bytes per second the pushes may use when the workstation does not specify it
+DEFAULT_SUBSCRIPTION_BANDWIDTH = 4096
+## the most bytes per second a workstation can ask for, the video stream needs the rest of the link
+MAX_SUBSCRIPTION_BANDWIDTH = 65536
+
+
+def read_fields(telemetry, waypoint_order, fields):
+    """
+    Args:
+        telemetry: TelemetrySnapshot instance
+        waypoint_order: the order of the last waypoint that was visited
+        fields: the names of the fields, see SUBSCRIBABLE_FIELDS
+    Returns:
+        dict with the value per field
+    """
+    values = {}
+    for field in fields:
+        if field == 'current_location':
+            values[field] = LocationEncoder().default(telemetry.location())
+        elif field == 'waypoint_order':
+            values[field] = waypoint_order
+        else:
+            values[field] = getattr(telemetry, field)
+    return values
+
+
+def subscription_message(values, encoding='json'):
+    """
+    Args:
+        values: dict with the value per field
+        encoding: one of wire_format.ENCODINGS
+    Returns:
+        the encoded message that is pushed to the workstation
+    """
+    data = dict(values)
+    data.update({'message_type': 'status', 'timestamp': create_timestamp(), 'heartbeat': False,
+                 'subscription': True})
+    return wire_format.dumps(data, encoding)
+
+
+## @ingroup Onboard
+# @brief Limits how many bytes can be sent per second, while allowing a burst of up to one second
+class TokenBucket():
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate: bytes per second
+            capacity: the largest burst in bytes, by default one second worth of bytes
+        """
+        ## bytes per second
+        self.rate = float(rate)
+        ## the largest burst in bytes
+        self.capacity = float(capacity if capacity is not None else rate)
+        ## the bytes that can be sent right now
+        self.tokens = self.capacity
+        ## the monotonic time the tokens were last refilled
+        self.last = monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def consume(self, size, now):
+        """
+        Args:
+            size: the size of the message in bytes
+            now: the monotonic time
+        Returns:
+            True if the message can be sent, the tokens are taken. False if it has to wait
+        """
+        self.refill(now)
+        if self.tokens >= size or self.tokens >= self.capacity:  # a message larger than a burst still gets out
+            self.tokens -= size
+            return True
+        return False
+
+    def delay(self, size, now):
+        """
+        Returns:
+            the seconds until a message of this size can be sent
+        """
+        self.refill(now)
+        needed = min(size, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate)
+
+
+## @ingroup Onboard
+# @brief Decides which subscribed fields are pushed when
+#
+# Every field has its own period. The fields that are due at the same time are pushed in one message.
+# When a message does not fit in the bandwidth, it waits for the TokenBucket and the fields stay due,
+# so a field that is due again in the meantime is not sent twice: the pushes become slower, not longer.
+#
+# Usage:
+#     fields = schedule.due(now)
+#     if fields and schedule.admit(fields, len(message), now):
+#         send(message)
+#     sleep(schedule.next_delay(now))
+class SubscriptionSchedule():
+    def __init__(self, rates, max_bandwidth=DEFAULT_SUBSCRIPTION_BANDWIDTH):
+        """
+        Args:
+            rates: dict with the rate per field, in Hz
+            max_bandwidth: the bytes per second all pushes together may use
+        """
+        ## dict with the period per field, in seconds
+        self.periods = dict((field, 1.0 / rate) for field, rate in rates.items())
+        now = monotonic()
+        ## dict with the monotonic time at which a field is due, every field is pushed right away once
+        self.next_due = dict((field, now) for field in rates)
+        ## TokenBucket instance that enforces the bandwidth
+        self.bucket = TokenBucket(max_bandwidth)
+        ## the size of the message that is waiting for the bucket, None if there is none
+        self.waiting = None
+        ## how many messages were sent
+        self.sent = 0
+        ## how many times a message had to wait for the bandwidth
+        self.throttled = 0
+
+    def due(self, now):
+        """
+        Returns:
+            the fields that should be pushed now
+        """
+        return [field for field, due in self.next_due.items() if due <= now]
+
+    def admit(self, fields, size, now):
+        """
+        Args:
+            fields: the fields in the message
+            size: the size of the message in bytes
+            now: the monotonic time
+        Returns:
+            True if the message can be sent now, the fields are then scheduled for their next push
+        """
+        if not self.bucket.consume(size, now):
+            if self.waiting is None:
+                self.throttled += 1
+            self.waiting = size
+            return False
+        self.waiting = None
+        self.sent += 1
+        for field in fields:
+            due = self.next_due[field] + self.periods[field]
+            if due <= now:  # this field was throttled or late, don't catch up in a burst
+                due = now + self.periods[field]
+            self.next_due[field] = due
+        return True
+
+    def next_delay(self, now):
+        """
+        Returns:
+            the seconds until the next push
+        """
+        if self.waiting is not None:
+            return self.bucket.delay(self.waiting, now)
+        return max(0.0, min(self.next_due.values()) - now)
+
+    def stats(self):
+        return {'sent': self.sent, 'throttled': self.throttled}
@@ -0,0 +1,272 @@
+import json
+import struct
+
+## the encodings the drone understands, the workstation picks one in its workstation_config message
+# 'json': the default, every message is a JSON object
+# 'msgpack': a compact binary encoding, compatible with the MessagePack format for the types used here
+ENCODINGS = ('json', 'msgpack')
+
+## struct format of one packed waypoint: the order, the latitude and the longitude
+WAYPOINT_FORMAT = ">idd"
+## the size of one packed waypoint in bytes
+WAYPOINT_SIZE = struct.calcsize(WAYPOINT_FORMAT)
+
+
+def detect(data):
+    """
+    Find out how a message was encoded, every JSON message is an object and starts with '{',
+    which can never be the first byte of a msgpack map
+
+    Args:
+        data: the encoded message
+    Returns:
+        'json' or 'msgpack'
+    """
+    if data[:1] == '{' or data[:1].isspace():
+        return 'json'
+    return 'msgpack'
+
+
+def dumps(data, encoding='json', cls=None):
+    """
+    Encode a message
+
+    Args:
+        data: dict with the message
+        encoding: one of ENCODINGS
+        cls: the JSONEncoder that converts the objects in the message, e.g. LocationEncoder
+    Returns:
+        the encoded message
+    """
+    if encoding == 'json':
+        return json.dumps(data, cls=cls)
+    if encoding == 'msgpack':
+        default = None
+        if cls is not None:
+            default = cls().default  # the encoders turn objects into dicts, which can be packed as well
+        chunks = []
+        pack(data, chunks, default)
+        return ''.join(chunks)
+    raise ValueError("unknown encoding: {0}".format(encoding))
+
+
+def loads(data):
+    """
+    Decode a message in any of the ENCODINGS
+
+    Args:
+        data: the encoded message
+    Returns:
+        the decoded message
+    """
+    if detect(data) == 'json':
+        return json.loads(data)
+    value, offset = unpack(data, 0)
+    if offset != len(data):
+        raise ValueError("trailing bytes after the message")
+    return value
+
+
+def pack(value, chunks, default=None):
+    """
+    Append the msgpack encoding of a value to a list of strings
+
+    Args:
+        value: None, a boolean, number, string, list, tuple or dict, or an object that default can convert
+        chunks: list to which the encoded bytes are appended
+        default: function that converts other objects into one of the types above
+    """
+    if value is None:
+        chunks.append('\xc0')
+    elif value is True:
+        chunks.append('\xc3')
+    elif value is False:
+        chunks.append('\xc2')
+    elif isinstance(value, (int, long)):
+        if 0 <= value < 0x80:
+            chunks.append(chr(value))
+        elif -32 <= value < 0:
+            chunks.append(struct.pack("b", value))
+        elif 0 <= value <= 0xffffffff:
+            chunks.append(struct.pack(">BI", 0xce, value))
+        elif -0x80000000 <= value < 0:
+            chunks.append(struct.pack(">Bi", 0xd2, value))
+        elif value > 0:
+            chunks.append(struct.pack(">BQ", 0xcf, value))
+        else:
+            chunks.append(struct.pack(">Bq", 0xd3, value))
+    elif isinstance(value, float):
+        chunks.append(struct.pack(">Bd", 0xcb, value))
+    elif isinstance(value, unicode):
+        pack_raw(value.encode('utf-8'), chunks, 0xa0, 0xd9)
+    elif isinstance(value, str):
+        pack_raw(value, chunks, 0xa0, 0xd9)
+    elif isinstance(value, bytearray):
+        pack_raw(str(value), chunks, None, 0xc4)
+    elif isinstance(value, (list, tuple)):
+        pack_header(len(value), chunks, 0x90, 0xdc)
+        for item in value:
+            pack(item, chunks, default)
+    elif isinstance(value, dict):
+        pack_header(len(value), chunks, 0x80, 0xde)
+        for key, item in value.items():
+            pack(key, chunks, default)
+            pack(item, chunks, default)
+    elif default is not None:
+        pack(default(value), chunks, None)
+    else:
+        raise TypeError("{0!r} can not be encoded".format(value))
+
+
+def pack_raw(raw, chunks, fix_code, code8):
+    """
+    Append a string (str 8/16/32) or binary data (bin 8/16/32)
+
+    Args:
+        raw: the bytes
+        chunks: list to which the encoded bytes are appended
+        fix_code: the code of the short form with the length in the code itself, or None if there is none
+        code8: the code of the form with a one byte length, the 16 and 32 bit forms follow it
+    """
+    length = len(raw)
+    if fix_code is not None and length < 32:
+        chunks.append(chr(fix_code | length))
+    elif length < 0x100:
+        chunks.append(struct.pack(">BB", code8, length))
+    elif length < 0x10000:
+        chunks.append(struct.pack(">BH", code8 + 1, length))
+    else:
+        chunks.append(struct.pack(">BI", code8 + 2, length))
+    chunks.append(raw)
+
+
+def pack_header(length, chunks, fix_code, code16):
+    """
+    Append the header of an array or a map
+
+    Args:
+        length: the amount of items
+        chunks: list to which the encoded bytes are appended
+        fix_code: the code of the short form, for up to 15 items
+        code16: the code of the form with a 16 bit length, the 32 bit form follows it
+    """
+    if length < 16:
+        chunks.append(chr(fix_code | length))
+    elif length < 0x10000:
+        chunks.append(struct.pack(">BH", code16, length))
+    else:
+        chunks.append(struct.pack(">BI", code16 + 1, length))
+
+
+## struct format and size of the values that follow a code, for the codes with a fixed size
+FIXED_FORMATS = {0xca: (">f", 4), 0xcb: (">d", 8),
+                 0xcc: (">B", 1), 0xcd: (">H", 2), 0xce: (">I", 4), 0xcf: (">Q", 8),
+                 0xd0: (">b", 1), 0xd1: (">h", 2), 0xd2: (">i", 4), 0xd3: (">q", 8)}
+## struct format and size of the length that follows a code, for strings, binary data, arrays and maps
+LENGTH_FORMATS = {0xd9: (">B", 1), 0xda: (">H", 2), 0xdb: (">I", 4),
+                  0xc4: (">B", 1), 0xc5: (">H", 2), 0xc6: (">I", 4),
+                  0xdc: (">H", 2), 0xdd: (">I", 4),
+                  0xde: (">H", 2), 0xdf: (">I", 4)}
+
+
+def unpack(data, offset):
+    """
+    Decode the msgpack value that starts at offset
+
+    Args:
+        data: the encoded bytes
+        offset: where the value starts
+    Returns:
+        a tuple with the value and the offset right after it
+    """
+    try:
+        code = ord(data[offset])
+    except IndexError:
+        raise ValueError("the message is truncated")
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if 0xa0 <= code <= 0xbf:
+        return unpack_raw(data, offset, code & 0x1f, text=True)
+    if 0x90 <= code <= 0x9f:
+        return unpack_array(data, offset, code & 0x0f)
+    if 0x80 <= code <= 0x8f:
+        return unpack_map(data, offset, code & 0x0f)
+    if code == 0xc0:
+        return None, offset
+    if code == 0xc2:
+        return False, offset
+    if code == 0xc3:
+        return True, offset
+    if code in FIXED_FORMATS:
+        fmt, size = FIXED_FORMATS[code]
+        if offset + size > len(data):
+            raise ValueError("the message is truncated")
+        return struct.unpack(fmt, data[offset:offset + size])[0], offset + size
+    if code in LENGTH_FORMATS:
+        fmt, size = LENGTH_FORMATS[code]
+        if offset + size > len(data):
+            raise ValueError("the message is truncated")
+        length = struct.unpack(fmt, data[offset:offset + size])[0]
+        offset += size
+        if code in (0xd9, 0xda, 0xdb):
+            return unpack_raw(data, offset, length, text=True)
+        if code in (0xc4, 0xc5, 0xc6):
+            return unpack_raw(data, offset, length, text=False)
+        if code in (0xdc, 0xdd):
+            return unpack_array(data, offset, length)
+        return unpack_map(data, offset, length)
+    raise ValueError("unsupported msgpack code: 0x{0:02x}".format(code))
+
+
+def unpack_raw(data, offset, length, text):
+    if offset + length > len(data):
+        raise ValueError("the message is truncated")
+    raw = data[offset:offset + length]
+    if text:
+        raw = raw.decode('utf-8')  # like json.loads, strings are unicode
+    return raw, offset + length
+
+
+def unpack_array(data, offset, length):
+    items = []
+    for i in xrange(length):
+        item, offset = unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def unpack_map(data, offset, length):
+    items = {}
+    for i in xrange(length):
+        key, offset = unpack(data, offset)
+        value, offset = unpack(data, offset)
+        items[key] = value
+    return items, offset
+
+
+def pack_waypoints(waypoints):
+    """
+    Pack waypoints as fixed-size records, for the 'packed_waypoints' field of a path message
+
+    Args:
+        waypoints: list of WayPoint
+    Returns:
+        a bytearray with WAYPOINT_SIZE bytes per waypoint, so it is packed as binary data instead of as a string
+    """
+    return bytearray(''.join(struct.pack(WAYPOINT_FORMAT, waypoint.order, waypoint.location.latitude,
+                                         waypoint.location.longitude) for waypoint in waypoints))
+
+
+def unpack_waypoints(data):
+    """
+    Args:
+        data: the 'packed_waypoints' field of a path message
+    Returns:
+        a list with a tuple (order, latitude, longitude) per waypoint
+    """
+    if len(data) % WAYPOINT_SIZE != 0:
+        raise ValueError("the packed waypoints have an invalid length")
+    return [struct.unpack_from(WAYPOINT_FORMAT, data, offset) for offset in xrange(0, len(data), WAYPOINT_SIZE)]
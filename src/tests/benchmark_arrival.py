@@ -0,0 +1,165 @@
+"""
+Compare the total time of a simulated survey mission when the arrival at a waypoint is polled every 0.5s,
+like visit_waypoint used to, with the ArrivalDetector that is driven by the location updates,
+and with path following: flying through every waypoint but the last one once it is within the acceptance radius.
+
+The drone is simulated on a clock of its own, so the benchmark runs in a fraction of the mission time:
+it accelerates towards its waypoint up to the flying speed and brakes so it stops on it, like the autopilot does
+in GUIDED mode, and reports its location and velocity at the rate DroneKit receives them.
+The next waypoint is sent as soon as the arrival is detected.
+
+Usage: python benchmark_arrival.py [-n <waypoints>] [-d <meters between waypoints>] [-u <location updates per second>]
+                                   [-v <flying speed>] [-t <distance threshold>] [-r <acceptance radius>]
+"""
+import sys
+import math
+import getopt
+
+from shae.onboard.arrival import ArrivalDetector
+from shae.onboard.geodesy import from_enu, to_enu
+from shae.onboard.global_classes import TelemetrySnapshot
+
+## the seconds between two steps of the simulation
+STEP = 0.005
+## m/s^2, the acceleration and deceleration of the drone
+ACCELERATION = 2.5
+## the seconds between two polls in the old visit_waypoint
+POLL_PERIOD = 0.5
+HEIGHT = 4.0
+## the latitude and longitude of the start of the path, the simulation is in meters (north, east) from here
+ORIGIN = (51.011447, 3.711648)
+
+
+def survey_path(count, spacing):
+    """
+    Returns:
+        list with (north, east) in meters of a lawnmower pattern, rows of 10 waypoints
+    """
+    path = []
+    for i in range(count):
+        row, column = divmod(i, 10)
+        if row % 2 == 1:
+            column = 9 - column
+        path.append((row * spacing, column * spacing))
+    return path
+
+
+class SimulatedDrone():
+    def __init__(self, speed):
+        self.speed = speed
+        self.north = 0.0
+        self.east = 0.0
+        self.velocity = (0.0, 0.0)
+
+    def step(self, target):
+        north = target[0] - self.north
+        east = target[1] - self.east
+        distance = math.hypot(north, east)
+        if distance < 1e-9:
+            self.velocity = (0.0, 0.0)
+            return
+        current = math.hypot(*self.velocity)
+        vmax = min(self.speed, math.sqrt(2 * ACCELERATION * distance))
+        speed = min(vmax, current + ACCELERATION * STEP)
+        self.velocity = (north / distance * speed, east / distance * speed)
+        move = min(distance, speed * STEP)
+        self.north += north / distance * move
+        self.east += east / distance * move
+
+    def distance(self, target):
+        return math.hypot(target[0] - self.north, target[1] - self.east)
+
+    def telemetry(self):
+        latitude, longitude = from_enu(ORIGIN[0], ORIGIN[1], self.east, self.north)
+        return TelemetrySnapshot(timestamp=None, latitude=latitude, longitude=longitude, height=HEIGHT,
+                                 orientation=0.0, battery_level=90, gps_signal=10,
+                                 speed=math.hypot(*self.velocity), velocity=(self.velocity[0], self.velocity[1], 0.0),
+                                 mode='GUIDED', armed=True)
+
+
+def fly(path, speed, update_rate, threshold, detector, radius=None):
+    """
+    Args:
+        detector: True to use the ArrivalDetector, False to poll
+        radius: the acceptance radius of path following, None to stop at every waypoint
+    Returns:
+        the mission time, and the mean delay and mean distance to the waypoint at the detection of an arrival
+    """
+    drone = SimulatedDrone(speed)
+    arrival = ArrivalDetector(threshold)
+    now = 0.0
+    steps = 0
+    update_steps = int(round(1.0 / update_rate / STEP))
+    poll_steps = int(round(POLL_PERIOD / STEP))
+    last_update = drone.telemetry()
+    delays = []
+    distances = []
+    for i, target in enumerate(path):
+        target_location = from_enu(ORIGIN[0], ORIGIN[1], target[1], target[0]) + (HEIGHT,)
+        target_radius = radius if i < len(path) - 1 else None
+        arrival.set_target(*target_location, radius=target_radius)
+        goto_step = steps
+        crossed = None
+        while True:
+            drone.step(target)
+            steps += 1
+            now = steps * STEP
+            if crossed is None and drone.distance(target) <= (target_radius or threshold):
+                crossed = now
+            if steps % update_steps == 0:
+                last_update = drone.telemetry()
+                arrival.update(last_update, now)
+            if detector:
+                if arrival.arrived(now):
+                    break
+            elif (steps - goto_step) % poll_steps == 0:
+                east, north = to_enu(last_update.latitude, last_update.longitude,
+                                     target_location[0], target_location[1])
+                if math.hypot(north, east) <= threshold:
+                    break
+        delays.append(now - crossed if crossed is not None else 0.0)
+        distances.append(drone.distance(target))
+    arrival.clear()
+    return now, sum(delays) / len(delays), sum(distances) / len(distances)
+
+
+def main():
+    count = 200
+    spacing = 5.0
+    update_rate = 4.0
+    speed = 5.0
+    threshold = 1.0
+    radius = 2.5
+    opts, args = getopt.getopt(sys.argv[1:], "n:d:u:v:t:r:")
+    for opt, arg in opts:
+        if opt == "-n":
+            count = int(arg)
+        elif opt == "-d":
+            spacing = float(arg)
+        elif opt == "-u":
+            update_rate = float(arg)
+        elif opt == "-v":
+            speed = float(arg)
+        elif opt == "-t":
+            threshold = float(arg)
+        elif opt == "-r":
+            radius = float(arg)
+
+    path = survey_path(count, spacing)
+    print "{0} waypoints {1} m apart, {2} m/s, {3} location updates per second, threshold {4} m" \
+        .format(count, spacing, speed, update_rate, threshold)
+    print "{0:<18} {1:>16} {2:>22} {3:>22}".format("arrival", "mission time (s)", "mean delay (ms)",
+                                                  "mean distance (m)")
+    polled = fly(path, speed, update_rate, threshold, detector=False)
+    detected = fly(path, speed, update_rate, threshold, detector=True)
+    following = fly(path, speed, update_rate, threshold, detector=True, radius=radius)
+    for name, (mission_time, delay, distance) in (("poll every 0.5s", polled), ("ArrivalDetector", detected),
+                                                  ("radius {0} m".format(radius), following)):
+        print "{0:<18} {1:>16.1f} {2:>22.0f} {3:>22.2f}".format(name, mission_time, delay * 1000, distance)
+    print "the detector saves {0:.1f} s ({1:.1f}%), path following saves another {2:.1f} s ({3:.1f}%)".format(
+        polled[0] - detected[0], 100.0 * (polled[0] - detected[0]) / polled[0],
+        detected[0] - following[0], 100.0 * (detected[0] - following[0]) / detected[0])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Measure how long it takes before the drone is in LAND mode after an 'emergency' request.
+
+The simulator runs in this process, so the vehicle of the control module can be observed directly:
+a listener on the 'mode' attribute records when LAND is reached.
+While the drone takes off, a few sessions keep the server busy with heartbeat requests.
+
+Usage: python benchmark_emergency.py [-c <load clients>] [-t <trials>] [-d <delay after start>]
+"""
+import sys
+import json
+import time
+import getopt
+import socket
+import struct
+import threading
+
+from shae.onboard.global_classes import recv_exact
+from shae.simulator.simulator import Simulator
+
+HOST = "127.0.0.1"
+PORT = 6330
+
+
+def request(message):
+    sock = socket.create_connection((HOST, PORT))
+    data = json.dumps(message)
+    sock.sendall(struct.pack(">I", len(data)) + data)
+    code = struct.unpack(">H", recv_exact(sock, 2))[0]
+    sock.close()
+    return code
+
+
+def load_client(stop):
+    """Keep a session busy with heartbeat requests, with a few of them in flight"""
+    message = json.dumps({'message_type': 'status', 'message': 'heartbeat'})
+    sock = socket.create_connection((HOST, PORT))
+    session = json.dumps({'message_type': 'session', 'message': 'open'})
+    sock.sendall(struct.pack(">I", len(session)) + session)
+    recv_exact(sock, 2)
+    while not stop.is_set():
+        for request_id in range(4):
+            sock.sendall(struct.pack(">II", len(message), request_id) + message)
+        for request_id in range(4):
+            code = struct.unpack(">IH", recv_exact(sock, 6))[1]
+            if code == 300:
+                recv_exact(sock, struct.unpack(">H", recv_exact(sock, 2))[0])
+    sock.close()
+
+
+def wait_until(condition, timeout):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.1)
+    return condition()
+
+
+def main():
+    clients = 4
+    trials = 5
+    delay = 2.0
+    opts, args = getopt.getopt(sys.argv[1:], "c:t:d:")
+    for opt, arg in opts:
+        if opt == "-c":
+            clients = int(arg)
+        elif opt == "-t":
+            trials = int(arg)
+        elif opt == "-d":
+            delay = float(arg)
+
+    sim = Simulator()
+    time.sleep(30)
+    vehicle = sim.control_thread.control_module.vehicle
+
+    land_times = []
+
+    def mode_listener(vehicle, name, mode):
+        if mode.name == "LAND":
+            land_times.append(time.time())
+    vehicle.add_attribute_listener('mode', mode_listener)
+
+    stop = threading.Event()
+    loaders = [threading.Thread(target=load_client, args=(stop,)) for i in range(clients)]
+    for loader in loaders:
+        loader.daemon = True
+        loader.start()
+
+    acks = []
+    lands = []
+    try:
+        for trial in range(trials):
+            request({'message_type': 'navigation', 'message': 'start'})
+            time.sleep(delay)  # the takeoff is in progress now
+            del land_times[:]
+            start = time.time()
+            request({'message_type': 'navigation', 'message': 'emergency'})
+            acks.append(time.time() - start)
+            if wait_until(lambda: land_times, 10):
+                lands.append(land_times[0] - start)
+            else:
+                print "trial {0}: the drone did not switch to LAND mode".format(trial)
+            if not wait_until(lambda: not vehicle.armed, 60):
+                print "trial {0}: the drone did not land".format(trial)
+                break
+    finally:
+        stop.set()
+        sim.stop()
+
+    print "{0:<24} {1:>10} {2:>10} {3:>10}".format("", "min (ms)", "mean (ms)", "max (ms)")
+    for name, values in (("emergency -> ACK", acks), ("emergency -> LAND mode", lands)):
+        if values:
+            print "{0:<24} {1:>10.1f} {2:>10.1f} {3:>10.1f}".format(name, min(values) * 1000,
+                                                                   sum(values) / len(values) * 1000,
+                                                                   max(values) * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Measure the geodesy functions on batches of locations, e.g. the waypoints of a survey path,
+called one location at a time, with the batch_ functions on lists (without NumPy) and with NumPy.
+The old flat conversion, which used 1.113195e5 meters per degree for latitude and longitude alike,
+is compared with the great-circle distance over 100 m to the north and to the east of our site.
+
+Usage: python benchmark_geodesy.py [-s <comma-separated sizes>] [-m <largest size for the scalar and list loops>]
+"""
+import sys
+import math
+import time
+import random
+import getopt
+from array import array
+
+from shae.onboard import geodesy
+from shae.onboard.geodesy import batch_bearing, batch_distance, batch_from_enu, batch_offset, batch_to_enu, \
+    bearing, distance, from_enu, offset, to_enu
+
+ORIGIN = (51.011447, 3.711648)
+## the conversion the Solo used before
+LATLON_TO_M = 1.113195e5
+
+
+def locations(size):
+    """
+    Returns:
+        arrays with the latitudes and the longitudes of random locations within 2 km of the origin
+    """
+    latitudes = array('d')
+    longitudes = array('d')
+    for i in range(size):
+        latitude, longitude = from_enu(ORIGIN[0], ORIGIN[1], random.uniform(-2000, 2000), random.uniform(-2000, 2000))
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+    return latitudes, longitudes
+
+
+def scalar(function, latitudes, longitudes):
+    """
+    Call the function for every location, offset and from_enu take the latitudes and longitudes as their two numbers
+    """
+    latitude, longitude = ORIGIN
+    return [function(latitude, longitude, lat, lon) for lat, lon in zip(latitudes, longitudes)]
+
+
+def batch(function, latitudes, longitudes):
+    batch_function = {distance: batch_distance, bearing: batch_bearing, offset: batch_offset, to_enu: batch_to_enu,
+                      from_enu: batch_from_enu}[function]
+    return batch_function(ORIGIN[0], ORIGIN[1], latitudes, longitudes)
+
+
+def measure(run, function, latitudes, longitudes):
+    start = time.time()
+    run(function, latitudes, longitudes)
+    return time.time() - start
+
+
+def accuracy():
+    """
+    Returns:
+        the relative error of the old flat conversion for a line to the north and a line to the east of the origin
+    """
+    errors = []
+    for heading in (0.0, 90.0):
+        latitude, longitude = offset(ORIGIN[0], ORIGIN[1], 100.0, heading)
+        old = math.hypot(latitude - ORIGIN[0], longitude - ORIGIN[1]) * LATLON_TO_M
+        errors.append((old - 100.0) / 100.0)
+    return errors
+
+
+def main():
+    sizes = [1000, 10000, 100000, 1000000]
+    loop_limit = 1000000
+    opts, args = getopt.getopt(sys.argv[1:], "s:m:")
+    for opt, arg in opts:
+        if opt == "-s":
+            sizes = [int(size) for size in arg.split(",")]
+        elif opt == "-m":
+            loop_limit = int(arg)
+
+    numpy = geodesy.numpy
+    random.seed(1)
+    north_error, east_error = accuracy()
+    print "the old conversion is off by {0:+.1f}% to the north and {1:+.1f}% to the east at {2} degrees north" \
+        .format(north_error * 100, east_error * 100, ORIGIN[0])
+    print "NumPy {0}".format(numpy.__version__ if numpy is not None else "is not installed")
+    print "time in ms"
+    print "{0:>8} {1:<10} {2:>12} {3:>12} {4:>12}".format("size", "function", "scalar", "list", "numpy")
+    for size in sizes:
+        latitudes, longitudes = locations(size)
+        for function in (distance, bearing, offset, to_enu, from_enu):
+            times = []
+            for mode in ("scalar", "list", "numpy"):
+                if mode != "numpy" and size > loop_limit or mode == "numpy" and numpy is None:
+                    times.append(None)
+                    continue
+                geodesy.numpy = numpy if mode == "numpy" else None
+                times.append(measure(scalar if mode == "scalar" else batch, function, latitudes, longitudes))
+            geodesy.numpy = numpy
+            print "{0:>8} {1:<10} {2:>12} {3:>12} {4:>12}".format(
+                size, function.__name__, *["-" if t is None else "{0:.1f}".format(t * 1000) for t in times])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Compare the CPU cost of a heartbeat that is requested from the control module with one that is created
+from the shared telemetry.
+
+For the requests, a fake control module runs in a second process, like on the drone. It answers the heartbeat
+requests over a unix domain socket the way the StatusHandler does. The CPU time of both processes is measured,
+so the cost of the control module (parsing the request, creating the heartbeat) is included.
+With the shared memory, the server reads the latest record and creates the heartbeat itself, the control module
+pays for publishing every telemetry update instead, whether or not there is a heartbeat.
+
+The Solo runs on a 1 GHz ARM Cortex-A9, use -s to scale the results to its speed,
+e.g. -s 8 when this machine is about eight times faster per core.
+
+Usage: python benchmark_heartbeat.py [-n <heartbeats>] [-r <heartbeats per second>] [-u <telemetry updates per second>]
+                                     [-s <slowdown of the Solo>]
+"""
+import os
+import sys
+import time
+import getopt
+import socket
+import struct
+import logging
+import resource
+import multiprocessing
+
+from shae.onboard import wire_format
+from shae.onboard.control_channel import ControlChannelPool, is_channel_request
+from shae.onboard.global_classes import LocationEncoder, MessageCodes, TelemetrySnapshot, create_timestamp, recv_exact
+from shae.onboard.shared_telemetry import TelemetryReader, TelemetryWriter, heartbeat_fields
+
+UDS_PATH = "/tmp/uds_benchmark_heartbeat"
+TELEMETRY_PATH = "/tmp/shae_benchmark_telemetry"
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def telemetry(i):
+    return TelemetrySnapshot(timestamp=time.time(), latitude=51.0226 + i * 1e-7, longitude=3.7251, height=4.2,
+                             orientation=1.57, battery_level=87, gps_signal=10, speed=5.0,
+                             velocity=(1.0, 0.5, 0.0), mode='GUIDED', armed=True)
+
+
+def answer(raw, i):
+    """Answer a heartbeat request like the control module and the StatusHandler"""
+    packet = wire_format.loads(raw)
+    data = heartbeat_fields(telemetry(i), 3)
+    data.update({'message_type': packet['message_type'], 'timestamp': create_timestamp(), 'heartbeat': True})
+    response = wire_format.dumps(data, wire_format.detect(raw), LocationEncoder)
+    return struct.pack(">II", MessageCodes.STATUS_RESPONSE, len(response)) + response
+
+
+def fake_control_module(cpu):
+    """
+    Answer heartbeat requests on a channel until the server closes it,
+    the CPU time that was used is put in 'cpu'
+    """
+    uds = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    uds.bind(UDS_PATH)
+    uds.listen(1)
+    client, address = uds.accept()
+    raw_length = recv_exact(client, 4)
+    raw = recv_exact(client, struct.unpack(">I", raw_length)[0])
+    assert is_channel_request(raw)
+    client.sendall(struct.pack(">I", MessageCodes.ACK))
+    start = None
+    i = 0
+    while True:
+        header = recv_exact(client, 8)
+        if header is None:
+            break
+        if start is None:  # the channel is open, start measuring
+            start = cpu_time()
+        length, request_id = struct.unpack(">II", header)
+        response = answer(recv_exact(client, length), i)
+        client.sendall(struct.pack(">II", request_id, len(response)) + response)
+        i += 1
+    cpu.value = cpu_time() - start
+    client.close()
+
+
+def remove_files():
+    for path in (UDS_PATH, TELEMETRY_PATH):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def measure_requests(beats):
+    """
+    Returns:
+        the CPU seconds of the server and of the control module per heartbeat
+    """
+    remove_files()
+    cpu = multiprocessing.Value('d', 0.0)
+    control_module = multiprocessing.Process(target=fake_control_module, args=(cpu,))
+    control_module.start()
+    while not os.path.exists(UDS_PATH):
+        time.sleep(0.01)
+    logger = logging.getLogger("Benchmark")
+    logger.addHandler(logging.NullHandler())
+    pool = ControlChannelPool(logger, path=UDS_PATH, size=1)
+    request = wire_format.dumps({'message_type': 'status', 'message': 'heartbeat'})
+    start = cpu_time()
+    for i in range(beats):
+        status_code, fields = pool.request(request)
+        assert status_code == MessageCodes.STATUS_RESPONSE
+    server_cpu = cpu_time() - start
+    pool.close()  # the fake control module stops
+    control_module.join()
+    return server_cpu / beats, cpu.value / beats
+
+
+def measure_shared_memory(beats):
+    """
+    Returns:
+        the CPU seconds of the server per heartbeat, and of the control module per telemetry update
+    """
+    remove_files()
+    writer = TelemetryWriter(path=TELEMETRY_PATH)
+    reader = TelemetryReader(path=TELEMETRY_PATH)
+    start = cpu_time()
+    for i in range(beats):
+        writer.publish(telemetry(i), 3)
+    control_cpu = cpu_time() - start
+    start = cpu_time()
+    for i in range(beats):
+        assert reader.heartbeat() is not None
+    server_cpu = cpu_time() - start
+    reader.close()
+    writer.close()
+    return server_cpu / beats, control_cpu / beats
+
+
+def main():
+    beats = 2000
+    rate = 50.0
+    updates = 40.0
+    slowdown = 1.0
+    opts, args = getopt.getopt(sys.argv[1:], "n:r:u:s:")
+    for opt, arg in opts:
+        if opt == "-n":
+            beats = int(arg)
+        elif opt == "-r":
+            rate = float(arg)
+        elif opt == "-u":
+            updates = float(arg)
+        elif opt == "-s":
+            slowdown = float(arg)
+
+    request_server, request_control = measure_requests(beats)
+    shared_server, shared_control = measure_shared_memory(beats)
+    remove_files()
+
+    print "CPU per heartbeat in us, and in % of one core at {0} heartbeats and {1} telemetry updates per second" \
+        .format(rate, updates)
+    print "{0:<14} {1:>12} {2:>26} {3:>10}".format("source", "server", "control module", "% CPU")
+    total = (request_server + request_control) * rate * slowdown * 100
+    print "{0:<14} {1:>12.1f} {2:>26.1f} {3:>10.2f}".format("uds request", request_server * 1e6 * slowdown,
+                                                            request_control * 1e6 * slowdown, total)
+    total = (shared_server * rate + shared_control * updates) * slowdown * 100
+    print "{0:<14} {1:>12.1f} {2:>26} {3:>10.2f}".format("shared memory", shared_server * 1e6 * slowdown,
+                                                         "{0:.1f} per update".format(shared_control * 1e6 * slowdown),
+                                                         total)
+
+
+if __name__ == '__main__':
+    main()
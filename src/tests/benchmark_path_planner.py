@@ -0,0 +1,56 @@
+"""
+Measure how much shorter optimize_route makes a path of unordered waypoints, and how long it takes.
+
+The waypoints are spread at random over a square of 1 km by 1 km, the route starts in a corner.
+The given order is random, like a point set an operator uploads; the nearest neighbour route is the route
+before it is improved with 2-opt and Or-opt. A route that is not complete ran out of time.
+
+Usage: python benchmark_path_planner.py [-s <comma-separated sizes>] [-b <time budget in seconds>] [-n (without NumPy)]
+"""
+import sys
+import time
+import random
+import getopt
+
+from shae.onboard import path_planner
+from shae.onboard.geodesy import from_enu
+from shae.onboard.global_classes import Location
+from shae.onboard.path_planner import RouteOptimizer, optimize_route
+
+START = Location(longitude=3.711648, latitude=51.011447)
+SIDE = 1000.0
+
+
+def main():
+    sizes = [10, 100, 500, 1000, 2000, 5000]
+    budget = path_planner.TIME_BUDGET
+    opts, args = getopt.getopt(sys.argv[1:], "s:b:n")
+    for opt, arg in opts:
+        if opt == "-s":
+            sizes = [int(size) for size in arg.split(",")]
+        elif opt == "-b":
+            budget = float(arg)
+        elif opt == "-n":
+            path_planner.numpy = None
+
+    random.seed(1)
+    print "NumPy {0}, time budget {1} s".format("is used" if path_planner.numpy is not None else "is not used", budget)
+    print "{0:>6} {1:>14} {2:>18} {3:>14} {4:>10} {5:>9}".format("size", "given (m)", "nearest neigh. (m)",
+                                                                "optimized (m)", "time (ms)", "complete")
+    for size in sizes:
+        points = [(random.uniform(0, SIDE), random.uniform(0, SIDE)) for i in range(size)]
+        locations = [from_enu(START.latitude, START.longitude, east, north) for east, north in points]
+        latitudes = [location[0] for location in locations]
+        longitudes = [location[1] for location in locations]
+        optimizer = RouteOptimizer([0.0] + [point[0] for point in points], [0.0] + [point[1] for point in points],
+                                   time.time() + budget)
+        nearest = optimizer.length(optimizer.nearest_neighbour())
+        start = time.time()
+        plan = optimize_route(START, latitudes, longitudes, budget)
+        elapsed = time.time() - start
+        print "{0:>6} {1:>14.0f} {2:>18.0f} {3:>14.0f} {4:>10.0f} {5:>9}".format(
+            size, plan.distance_before, nearest, plan.distance_after, elapsed * 1000, str(plan.complete))
+
+
+if __name__ == '__main__':
+    main()
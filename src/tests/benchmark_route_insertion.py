@@ -0,0 +1,91 @@
+"""
+Measure the insertion of new waypoints, one at a time, in a queue that holds a survey route,
+like a workstation that retasks the drone during a mission.
+
+The queue holds a lawnmower route over a square of 1 km by 1 km, and 200 waypoints at random places in the square
+are added to it. 'in order' inserts them with the highest order, at the back of the queue like a path message does,
+'cheapest' inserts each of them where it adds the least to the remaining route (a path message with 'insert' set).
+
+Usage: python benchmark_route_insertion.py [-s <comma-separated sizes>] [-k <new waypoints>] [-n (without NumPy)]
+"""
+import sys
+import time
+import random
+import getopt
+
+from shae.onboard import geodesy, path_planner
+from shae.onboard.geodesy import from_enu
+from shae.onboard.global_classes import Location, WayPoint, WayPointQueue
+from shae.onboard.path_planner import cheapest_position, route_length
+
+START = Location(longitude=3.711648, latitude=51.011447)
+SIDE = 1000.0
+
+
+def survey_queue(size):
+    """
+    Returns:
+        a WayPointQueue with a lawnmower route of 'size' waypoints over the square
+    """
+    lines = max(1, int(size ** 0.5))
+    records = []
+    for i in range(size):
+        line, step = divmod(i, lines)
+        east = SIDE * step / lines if line % 2 == 0 else SIDE * (lines - step) / lines
+        latitude, longitude = from_enu(START.latitude, START.longitude, east, SIDE * line / lines)
+        records.append((i, latitude, longitude))
+    queue = WayPointQueue()
+    queue.insert_records(records)
+    return queue
+
+
+def length(queue):
+    snapshot = queue.snapshot()
+    return route_length(START, snapshot.latitudes[::-1], snapshot.longitudes[::-1])
+
+
+def in_order(queue, points):
+    for latitude, longitude in points:
+        queue.insert_waypoint(WayPoint(location=Location(latitude=latitude, longitude=longitude), order=2 ** 31 - 1))
+
+
+def cheapest(queue, points):
+    for latitude, longitude in points:
+        inserted = False
+        while not inserted:
+            snapshot = queue.snapshot()
+            position, cost = cheapest_position(START, snapshot.latitudes[::-1], snapshot.longitudes[::-1],
+                                               latitude, longitude)
+            inserted = queue.insert_at(position, latitude, longitude, snapshot.version)
+
+
+def main():
+    sizes = [100, 1000, 10000, 100000]
+    count = 200
+    opts, args = getopt.getopt(sys.argv[1:], "s:k:n")
+    for opt, arg in opts:
+        if opt == "-s":
+            sizes = [int(size) for size in arg.split(",")]
+        elif opt == "-k":
+            count = int(arg)
+        elif opt == "-n":
+            geodesy.numpy = path_planner.numpy = None
+
+    random.seed(1)
+    print "NumPy {0}, {1} new waypoints".format("is used" if path_planner.numpy is not None else "is not used", count)
+    print "{0:>7} {1:>10} {2:>12} {3:>16} {4:>16}".format("size", "mode", "route (m)", "added (m)", "per point (ms)")
+    for size in sizes:
+        points = [from_enu(START.latitude, START.longitude, random.uniform(0, SIDE), random.uniform(0, SIDE))
+                  for i in range(count)]
+        for name, insert in (("in order", in_order), ("cheapest", cheapest)):
+            queue = survey_queue(size)
+            before = length(queue)
+            start = time.time()
+            insert(queue, points)
+            elapsed = time.time() - start
+            print "{0:>7} {1:>10} {2:>12.0f} {3:>16.0f} {4:>16.3f}".format(
+                size, name, before, length(queue) - before, elapsed * 1000 / count)
+
+
+if __name__ == '__main__':
+    main()
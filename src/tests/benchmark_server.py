@@ -0,0 +1,171 @@
+"""
+Compare the thread-per-request Server with the single-threaded EventServer.
+
+A fake control module answers every request over /tmp/uds_control, so no simulator is needed.
+Both servers run in their own process, the clients run in this process.
+
+Usage: python benchmark_server.py [-c <clients>] [-n <requests per client>]
+"""
+import os
+import sys
+import json
+import time
+import errno
+import getopt
+import socket
+import struct
+import logging
+import threading
+import multiprocessing
+
+from shae.onboard.global_classes import MessageCodes, recv_exact
+from shae.onboard.control_channel import is_channel_request
+from shae.onboard.server import Server
+from shae.onboard.event_server import EventServer
+
+HOST = "127.0.0.1"
+PORT = 6330
+
+
+def fake_control_module():
+    """Answer every request over the unix domain socket, like the control module would"""
+    try:
+        os.remove("/tmp/uds_control")
+    except OSError:
+        pass
+    uds = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    uds.bind("/tmp/uds_control")
+    uds.listen(64)
+    response = json.dumps({'message_type': 'status', 'battery_level': 87, 'height': 4.2, 'heartbeat': False})
+    answer = struct.pack(">II", MessageCodes.STATUS_RESPONSE, len(response)) + response
+
+    def handle(client):
+        raw_length = recv_exact(client, 4)
+        if raw_length is not None:
+            raw = recv_exact(client, struct.unpack(">I", raw_length)[0])
+            if is_channel_request(raw):
+                client.sendall(struct.pack(">I", MessageCodes.ACK))
+                while True:
+                    header = recv_exact(client, 8)
+                    if header is None:
+                        break
+                    length, request_id = struct.unpack(">II", header)
+                    recv_exact(client, length)
+                    client.sendall(struct.pack(">II", request_id, len(answer)) + answer)
+            else:
+                client.sendall(answer)
+        client.close()
+
+    while True:
+        client, address = uds.accept()
+        thread = threading.Thread(target=handle, args=(client,))
+        thread.daemon = True
+        thread.start()
+
+
+def run_server(engine):
+    logger = logging.getLogger("Benchmark")
+    logger.addHandler(logging.NullHandler())
+    if engine == 'event':
+        server = EventServer(logger=logger, SIM=True)
+    else:
+        server = Server(logger=logger, SIM=True)
+    server.run()
+
+
+def one_shot_request(message):
+    sock = socket.create_connection((HOST, PORT))
+    sock.sendall(struct.pack(">I", len(message)) + message)
+    code = struct.unpack(">H", recv_exact(sock, 2))[0]
+    length = struct.unpack(">H", recv_exact(sock, 2))[0]
+    recv_exact(sock, length)
+    sock.close()
+    return code
+
+
+def one_shot_client(requests, latencies):
+    message = json.dumps({'message_type': 'status', 'message': [{'key': 'battery_level'}]})
+    for i in range(requests):
+        start = time.time()
+        one_shot_request(message)
+        latencies.append(time.time() - start)
+
+
+def session_client(requests, latencies, window=4):
+    message = json.dumps({'message_type': 'status', 'message': [{'key': 'battery_level'}]})
+    sock = socket.create_connection((HOST, PORT))
+    session = json.dumps({'message_type': 'session', 'message': 'open'})
+    sock.sendall(struct.pack(">I", len(session)) + session)
+    recv_exact(sock, 2)
+    sent_at = {}
+    next_id = 0
+    received = 0
+    while received < requests:
+        while next_id < requests and len(sent_at) < window:  # keep a few requests in flight
+            sent_at[next_id] = time.time()
+            sock.sendall(struct.pack(">II", len(message), next_id) + message)
+            next_id += 1
+        request_id, code = struct.unpack(">IH", recv_exact(sock, 6))
+        length = struct.unpack(">H", recv_exact(sock, 2))[0]
+        recv_exact(sock, length)
+        latencies.append(time.time() - sent_at.pop(request_id))
+        received += 1
+    sock.close()
+
+
+def wait_for_server():
+    while True:
+        try:
+            socket.create_connection((HOST, PORT)).close()
+            return
+        except socket.error, err:
+            if err.args[0] != errno.ECONNREFUSED:
+                raise
+            time.sleep(0.1)
+
+
+def measure(client, clients, requests):
+    latencies = []
+    threads = [threading.Thread(target=client, args=(requests, latencies)) for i in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start
+    latencies.sort()
+    p50 = latencies[len(latencies) / 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return len(latencies) / duration, p50, p99
+
+
+def main():
+    clients = 4
+    requests = 500
+    opts, args = getopt.getopt(sys.argv[1:], "c:n:")
+    for opt, arg in opts:
+        if opt == "-c":
+            clients = int(arg)
+        elif opt == "-n":
+            requests = int(arg)
+
+    control_module = multiprocessing.Process(target=fake_control_module)
+    control_module.daemon = True
+    control_module.start()
+
+    print "{0:<8} {1:<10} {2:>12} {3:>10} {4:>10}".format("engine", "mode", "requests/s", "p50 (ms)", "p99 (ms)")
+    for engine in ('thread', 'event'):
+        server = multiprocessing.Process(target=run_server, args=(engine,))
+        server.start()
+        wait_for_server()
+        for mode, client in (('one-shot', one_shot_client), ('session', session_client)):
+            rate, p50, p99 = measure(client, clients, requests)
+            print "{0:<8} {1:<10} {2:>12.0f} {3:>10.2f} {4:>10.2f}".format(engine, mode, rate, p50, p99)
+        server.terminate()
+        server.join()
+
+    control_module.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Measure the memory a path of waypoints takes in the WayPointQueue, in bytes per waypoint.
+
+The queue used to keep a WayPoint and a Location object per waypoint (with a key tuple for the sorting),
+it now keeps the orders, latitudes and longitudes in typed arrays. Every layout is measured in a new process,
+as the growth of its resident memory while the path is inserted. For the arrays this includes the keys that are
+sorted once, which Python keeps for reuse, so the size of the arrays themselves is shown as well.
+
+Usage: python benchmark_waypoint_memory.py [-n <waypoints>]
+"""
+import sys
+import getopt
+import resource
+import multiprocessing
+
+from shae.onboard.global_classes import Location, WayPoint, WayPointQueue
+
+
+def resident_memory():
+    """
+    Returns:
+        the resident memory of this process in bytes
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # the peak, not as precise
+
+
+def records(count):
+    return [(i, 51.0 + i * 1e-6, 3.7 + i * 1e-6) for i in xrange(count)]
+
+
+def objects(count, result, arrays):
+    """The layout before: a list with a ((-order, -rank), WayPoint) entry per waypoint"""
+    path = records(count)
+    before = resident_memory()
+    entries = [((-order, -i), WayPoint(location=Location(longitude=longitude, latitude=latitude), order=order))
+               for i, (order, latitude, longitude) in enumerate(path)]
+    entries.sort()
+    result.value = resident_memory() - before
+
+
+def columns(count, result, arrays):
+    path = records(count)
+    before = resident_memory()
+    queue = WayPointQueue()
+    queue.insert_records(path)
+    result.value = resident_memory() - before
+    arrays.value = sum(column.buffer_info()[1] * column.itemsize
+                       for column in (queue.orders, queue.ranks, queue.ids, queue.latitudes, queue.longitudes))
+
+
+def measure(function, count):
+    result = multiprocessing.Value('d', 0.0)
+    arrays = multiprocessing.Value('d', 0.0)
+    process = multiprocessing.Process(target=function, args=(count, result, arrays))
+    process.start()
+    process.join()
+    return result.value, arrays.value
+
+
+def main():
+    count = 100000
+    opts, args = getopt.getopt(sys.argv[1:], "n:")
+    for opt, arg in opts:
+        if opt == "-n":
+            count = int(arg)
+
+    print "{0} waypoints".format(count)
+    print "{0:<26} {1:>14} {2:>20}".format("layout", "memory (MB)", "bytes per waypoint")
+    for name, function in (("WayPoint objects", objects), ("typed array columns", columns)):
+        memory, arrays = measure(function, count)
+        print "{0:<26} {1:>14.1f} {2:>20.0f}".format(name, memory / 2 ** 20, memory / count)
+        if arrays:
+            print "{0:<26} {1:>14.1f} {2:>20.0f}".format("  of which the arrays", arrays / 2 ** 20, arrays / count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Measure how the WayPointQueue scales with the size of a path, compared with the list and bubble sort it used before.
+
+For every size a path message is handled (the waypoints are inserted in a random order and sorted),
+a waypoint is visited again (removed and inserted in the front, like after a stop),
+and the queue is emptied one waypoint at a time, like the NavigationThread does.
+The old queue is only measured up to a size limit, bubble sort takes hours on the largest paths.
+
+Usage: python benchmark_waypoint_queue.py [-s <comma-separated sizes>] [-m <largest size for the old queue>]
+"""
+import sys
+import time
+import random
+import getopt
+from threading import RLock
+
+from shae.onboard.global_classes import Location, WayPoint, WayPointQueue
+
+
+class ListWayPointQueue():
+    """The WayPointQueue as it was, for comparison"""
+    def __init__(self):
+        self.queue_lock = RLock()
+        self.queue = []
+        self.current_waypoint = None
+        self.last_waypoint_order = -1
+
+    def insert_waypoint(self, waypoint, side='back'):
+        self.queue_lock.acquire()
+        if side == 'front':
+            self.queue = [waypoint] + self.queue
+        else:
+            self.queue.append(waypoint)
+        self.queue_lock.release()
+
+    def remove_waypoint(self, side='front'):
+        self.queue_lock.acquire()
+        if side == 'back':
+            waypoint = self.queue.pop()
+        else:
+            waypoint = self.queue[0]
+            self.queue = self.queue[1:]
+        if self.current_waypoint is not None:
+            self.last_waypoint_order = self.current_waypoint.order
+        self.current_waypoint = waypoint
+        self.queue_lock.release()
+        return waypoint
+
+    def sort_waypoints(self):
+        self.queue_lock.acquire()
+        wp_ord = 0
+        for j in range(0, len(self.queue)):
+            last_wp_ord = -1
+            for i in range(0, len(self.queue) - j):
+                wp_ord = self.queue[i].order
+                if wp_ord < last_wp_ord:
+                    self.queue[i], self.queue[i - 1] = self.queue[i - 1], self.queue[i]
+                else:
+                    last_wp_ord = wp_ord
+        self.queue_lock.release()
+
+    def is_empty(self):
+        return not self.queue
+
+
+def path(size):
+    waypoints = [WayPoint(location=Location(longitude=3.7 + i * 1e-6, latitude=51.0), order=i) for i in range(size)]
+    random.shuffle(waypoints)
+    return waypoints
+
+
+def measure(queue, waypoints, bulk):
+    """
+    Returns:
+        the seconds to handle the path message, to visit a waypoint again and to empty the queue
+    """
+    start = time.time()
+    if bulk:
+        queue.insert_waypoints(waypoints)
+    else:
+        for waypoint in waypoints:
+            queue.insert_waypoint(waypoint)
+    queue.sort_waypoints()
+    inserted = time.time()
+    waypoint = queue.remove_waypoint()
+    queue.insert_waypoint(waypoint, side='front')
+    visited = time.time()
+    while not queue.is_empty():
+        queue.remove_waypoint()
+    emptied = time.time()
+    return inserted - start, visited - inserted, emptied - visited
+
+
+def main():
+    sizes = [10, 100, 1000, 10000, 100000]
+    old_limit = 2000
+    opts, args = getopt.getopt(sys.argv[1:], "s:m:")
+    for opt, arg in opts:
+        if opt == "-s":
+            sizes = [int(size) for size in arg.split(",")]
+        elif opt == "-m":
+            old_limit = int(arg)
+
+    random.seed(1)
+    print "time in ms"
+    print "{0:>8} {1:<22} {2:>12} {3:>12} {4:>12}".format("size", "queue", "path", "revisit", "empty")
+    for size in sizes:
+        waypoints = path(size)
+        rows = [("list + bubble sort", ListWayPointQueue, False),
+                ("insert one by one", WayPointQueue, False),
+                ("insert_waypoints", WayPointQueue, True)]
+        for name, queue_class, bulk in rows:
+            if queue_class is ListWayPointQueue and size > old_limit:
+                print "{0:>8} {1:<22} {2:>12} {3:>12} {4:>12}".format(size, name, "-", "-", "-")
+                continue
+            times = measure(queue_class(), waypoints, bulk)
+            print "{0:>8} {1:<22} {2:>12.2f} {3:>12.3f} {4:>12.2f}".format(size, name, *[t * 1000 for t in times])
+
+
+if __name__ == '__main__':
+    main()
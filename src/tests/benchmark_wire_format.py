@@ -0,0 +1,77 @@
+"""
+Compare the JSON encoding with the compact binary encoding of the wire_format module.
+
+For a heartbeat, an 'all_statuses' response and a path upload, the size of the message is printed,
+together with how long it takes to encode and to decode it. The path is uploaded as a list of waypoint
+objects in both encodings, and as 'packed_waypoints' in the binary encoding.
+
+Usage: python benchmark_wire_format.py [-w <waypoints in the path>] [-n <repetitions>]
+"""
+import sys
+import time
+import getopt
+
+from shae.onboard import wire_format
+from shae.onboard.global_classes import Location, WayPoint, WayPointEncoder
+
+
+def heartbeat():
+    return {'message_type': 'status', 'heartbeat': True, 'timestamp': '01012017120000000',
+            'current_location': {'latitude': 51.0226, 'longitude': 3.7251},
+            'orientation': 1.5707, 'battery_level': 87, 'gps_signal': 10, 'height': 4.2, 'speed': 5.0}
+
+
+def all_statuses():
+    status = heartbeat()
+    status.update({'heartbeat': False, 'next_waypoint': 12, 'speed_target': 5.0, 'height_target': 4.0,
+                   'drone_type': {'manufacturer': '3DR', 'model': 'Solo'}, 'camera_angle': 90,
+                   'fps': 30, 'resolution': 720, 'distance_threshold': 0.5})
+    return status
+
+
+def path(waypoints):
+    return [WayPoint(location=Location(longitude=3.7251 + i * 1e-5, latitude=51.0226 + (i % 50) * 1e-5), order=i)
+            for i in range(waypoints)]
+
+
+def measure(message, encoding, repetitions, cls=None):
+    start = time.time()
+    for i in range(repetitions):
+        encoded = wire_format.dumps(message, encoding, cls)
+    encode_time = (time.time() - start) / repetitions
+    start = time.time()
+    for i in range(repetitions):
+        wire_format.loads(encoded)
+    decode_time = (time.time() - start) / repetitions
+    return len(encoded), encode_time * 1e6, decode_time * 1e6
+
+
+def main():
+    waypoints = 500
+    repetitions = 200
+    opts, args = getopt.getopt(sys.argv[1:], "w:n:")
+    for opt, arg in opts:
+        if opt == "-w":
+            waypoints = int(arg)
+        elif opt == "-n":
+            repetitions = int(arg)
+
+    waypoint_list = path(waypoints)
+    objects = {'message_type': 'navigation', 'message': 'path', 'waypoints': waypoint_list}
+    packed = {'message_type': 'navigation', 'message': 'path',
+              'packed_waypoints': wire_format.pack_waypoints(waypoint_list)}
+    cases = [('heartbeat', heartbeat(), None, ('json', 'msgpack')),
+             ('all_statuses', all_statuses(), None, ('json', 'msgpack')),
+             ('path ({0} wp)'.format(waypoints), objects, WayPointEncoder, ('json', 'msgpack')),
+             ('packed path', packed, None, ('msgpack',))]
+
+    print "{0:<16} {1:<8} {2:>10} {3:>14} {4:>14}".format("message", "encoding", "bytes", "encode (us)", "decode (us)")
+    for name, message, cls, encodings in cases:
+        for encoding in encodings:
+            size, encode_time, decode_time = measure(message, encoding, repetitions, cls)
+            print "{0:<16} {1:<8} {2:>10} {3:>14.1f} {4:>14.1f}".format(name, encoding, size,
+                                                                         encode_time, decode_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import unittest
+
+from shae.onboard.arrival import ArrivalDetector
+from shae.onboard.geodesy import METERS_PER_DEGREE, from_enu
+from shae.onboard.global_classes import TelemetrySnapshot
+
+
+def telemetry(north, velocity_north):
+    return TelemetrySnapshot(timestamp=None, latitude=north / METERS_PER_DEGREE, longitude=0.0, height=4.0,
+                             orientation=0.0, battery_level=90, gps_signal=10, speed=abs(velocity_north),
+                             velocity=(velocity_north, 0.0, 0.0), mode='GUIDED', armed=True)
+
+
+class TestArrival(unittest.TestCase):
+    def test_1_reached(self):
+        detector = ArrivalDetector(threshold=1.0)
+        detector.update(telemetry(0.0, 0.0), 0.0)
+        detector.set_target(10.0 / METERS_PER_DEGREE, 0.0, 4.0)
+        self.assertFalse(detector.arrived(0.0))
+        detector.update(telemetry(9.5, 0.0), 1.0)
+        self.assertTrue(detector.arrived(1.0))
+        self.assertTrue(detector.event.is_set())
+        # a drone that is already at its target arrives right away
+        detector.set_target(9.0 / METERS_PER_DEGREE, 0.0, 4.0)
+        self.assertTrue(detector.arrived(1.0))
+
+    def test_2_predicted(self):
+        detector = ArrivalDetector(threshold=1.0)
+        detector.set_target(10.0 / METERS_PER_DEGREE, 0.0, 4.0)
+        detector.update(telemetry(0.0, 5.0), 0.0)
+        detector.update(telemetry(5.0, 5.0), 1.0)
+        self.assertFalse(detector.arrived(1.5))  # crossing the threshold takes longer than an update
+        detector.update(telemetry(8.0, 5.0), 1.6)
+        self.assertIsNotNone(detector.deadline)
+        self.assertAlmostEqual(detector.deadline, 1.8)
+        self.assertFalse(detector.arrived(1.7))
+        self.assertTrue(detector.arrived(1.8))
+        # flying away from the target does not predict an arrival
+        detector.set_target(0.0, 0.0, 4.0)
+        self.assertIsNone(detector.deadline)
+
+    def test_3_east_west(self):
+        # a degree of longitude is 0.63 times a degree of latitude at 51 degrees north
+        detector = ArrivalDetector(threshold=1.0)
+        latitude, longitude = from_enu(51.0, 3.7, 0.8, 0.0)
+        detector.set_target(51.0, 3.7, 4.0)
+        detector.update(telemetry(0.0, 0.0)._replace(latitude=latitude, longitude=longitude), 0.0)
+        self.assertTrue(detector.arrived(0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+import os
+import json
+import Queue
+import socket
+import struct
+import logging
+import tempfile
+import threading
+import unittest
+
+from shae.onboard.control_channel import ControlChannel, ControlChannelPool
+from shae.onboard.control_module import ChannelThread, ChannelWorker, ControlModule
+from shae.onboard.global_classes import MessageCodes, recv_exact
+
+
+class SlowControlModule():
+    """Takes the place of the ControlModule, a request with "slow" in it waits until self.release is set"""
+    def __init__(self):
+        self.logger = logging.getLogger("test control channel")
+        self.release = threading.Event()
+        self.slow_started = threading.Event()
+        self.handled = []
+
+    def handle_request(self, raw):
+        if 'slow' in raw:
+            self.slow_started.set()
+            self.release.wait(5.0)
+        self.handled.append(json.loads(raw)['message'])
+        return struct.pack(">I", MessageCodes.ACK)
+
+
+class EchoStatusHandler():
+    """Takes the place of the StatusHandler, it expects the message to be a string"""
+    def handle_packet(self, packet, message, encoding):
+        return json.dumps({'message_type': 'status', 'echo': message.upper()})
+
+
+class DetachedControlModule(ControlModule):
+    """A ControlModule without a drone, only what handle_request needs for a status request"""
+    def __init__(self):
+        self.logger = logging.getLogger("test control module")
+        self.handler_locks = {'status': threading.Lock()}
+        self.stat_handler = EchoStatusHandler()
+
+
+class TestControlChannel(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "uds_control")
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(1)
+        self.control_module = SlowControlModule()
+        self.request_queue = Queue.Queue()
+        for i in range(2):
+            worker = ChannelWorker(self.control_module, self.request_queue)
+            worker.start()
+        self.accepted = threading.Thread(target=self.accept)
+        self.accepted.start()
+        self.channel = ControlChannel(self.path)
+        self.accepted.join()
+
+    def accept(self):
+        client, address = self.listener.accept()
+        length = struct.unpack(">I", recv_exact(client, 4))[0]
+        recv_exact(client, length)  # the channel open request
+        client.sendall(struct.pack(">I", MessageCodes.ACK))
+        self.channel_thread = ChannelThread(self.control_module, client, self.request_queue)
+        self.channel_thread.start()
+
+    def tearDown(self):
+        self.control_module.release.set()
+        self.channel.close()
+        self.channel_thread.join(1.0)
+        for i in range(2):
+            self.request_queue.put(None)
+        self.listener.close()
+        os.remove(self.path)
+        os.rmdir(os.path.dirname(self.path))
+
+    def request(self, message, responses):
+        response = self.channel.request(json.dumps({'message_type': 'status', 'message': message}))
+        responses.append((message, response))
+
+    def test_1_out_of_order(self):
+        responses = []
+        slow = threading.Thread(target=self.request, args=('slow', responses))
+        slow.start()
+        self.assertTrue(self.control_module.slow_started.wait(1.0))
+        # the fast request is sent after the slow one on the same channel, but it does not wait for it
+        self.request('fast', responses)
+        self.assertEqual(responses, [('fast', (MessageCodes.ACK, []))])
+        self.assertTrue(slow.is_alive())
+        self.control_module.release.set()
+        slow.join(1.0)
+        self.assertEqual(responses[1], ('slow', (MessageCodes.ACK, [])))
+        self.assertEqual(self.control_module.handled, ['fast', 'slow'])
+
+    def test_2_malformed_request(self):
+        self.control_module.handle_request = DetachedControlModule().handle_request
+        # valid JSON, but the handler raises an AttributeError on the message
+        response = self.channel.request(json.dumps({'message_type': 'status', 'message': 5}))
+        self.assertEqual(response, (MessageCodes.ERR, []))
+        response = self.channel.request(json.dumps([{'message_type': 'status'}]))
+        self.assertEqual(response, (MessageCodes.ERR, []))
+        # the channel is still served
+        response = self.channel.request(json.dumps({'message_type': 'status', 'message': 'battery'}))
+        self.assertEqual(response[0], MessageCodes.STATUS_RESPONSE)
+        self.assertEqual(json.loads(response[1][0])['echo'], 'BATTERY')
+
+
+class TestControlChannelPool(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "uds_control")
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(4)
+        self.control_module = SlowControlModule()
+        self.request_queue = Queue.Queue()
+        self.worker = ChannelWorker(self.control_module, self.request_queue)
+        self.worker.start()
+        # the control module only answers a channel open request when this is set
+        self.answer = threading.Event()
+        self.answer.set()
+        self.handshakes = []
+        self.stopped = False
+        self.listening = threading.Thread(target=self.listen)
+        self.listening.daemon = True
+        self.listening.start()
+        self.pool = ControlChannelPool(logging.getLogger("test control channel pool"), path=self.path,
+                                       size=2, max_users=1, timeout=0.2)
+
+    def listen(self):
+        while True:
+            client, address = self.listener.accept()
+            if self.stopped:
+                client.close()
+                return
+            handshake = threading.Thread(target=self.open_channel, args=(client,))
+            handshake.daemon = True
+            handshake.start()
+            self.handshakes.append(handshake)
+
+    def open_channel(self, client):
+        length = struct.unpack(">I", recv_exact(client, 4))[0]
+        recv_exact(client, length)  # the channel open request
+        self.answer.wait(5.0)
+        try:
+            client.sendall(struct.pack(">I", MessageCodes.ACK))
+        except socket.error:
+            return  # the pool gave up on this channel
+        ChannelThread(self.control_module, client, self.request_queue).start()
+
+    def tearDown(self):
+        self.answer.set()
+        self.pool.close()
+        self.stopped = True
+        socket.socket(socket.AF_UNIX, socket.SOCK_STREAM).connect(self.path)  # wakes up listen()
+        self.listening.join(1.0)
+        for handshake in self.handshakes:
+            handshake.join(1.0)
+        self.request_queue.put(None)
+        self.listener.close()
+        os.remove(self.path)
+        os.rmdir(os.path.dirname(self.path))
+
+    def wait_for_open(self):
+        for i in range(100):
+            if self.pool.pending_opens:
+                return
+            self.answer.wait(0.01)
+        self.fail("the pool did not start to open a channel")
+
+    def test_1_open_without_lock(self):
+        first = self.pool.acquire()
+        self.answer.clear()
+        second = []
+        opening = threading.Thread(target=lambda: second.append(self.pool.acquire()))
+        opening.start()
+        self.wait_for_open()
+        # the control module did not answer yet, a finished request can still give its channel back
+        releasing = threading.Thread(target=self.pool.release, args=(first,))
+        releasing.start()
+        releasing.join(1.0)
+        self.assertFalse(releasing.is_alive())
+        # the channel that is being opened counts toward the size, the free channel is reused
+        self.assertIs(self.pool.acquire(), first)
+        self.answer.set()
+        opening.join(1.0)
+        self.assertIsNot(second[0], first)
+        self.assertEqual(self.pool.pending_opens, 0)
+        stats = self.pool.stats()
+        self.assertEqual((stats['size'], stats['in_flight'], stats['opened']), (2, 2, 2))
+        self.assertEqual(second[0].request(json.dumps({'message_type': 'status', 'message': 'height'})),
+                         (MessageCodes.ACK, []))
+
+    def test_2_open_timeout(self):
+        self.answer.clear()
+        # the control module never answers, the open gives up and the slot is free again
+        self.assertRaises(socket.timeout, self.pool.acquire)
+        self.assertEqual(self.pool.pending_opens, 0)
+        self.assertEqual(self.pool.stats()['opened'], 0)
+        self.answer.set()
+        channel = self.pool.acquire()
+        self.assertTrue(channel.alive)
+        self.assertEqual(self.pool.stats()['opened'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import math
+import unittest
+
+from shae.onboard import coverage
+from shae.onboard.geodesy import distance, from_enu, to_enu
+
+ORIGIN = (51.011447, 3.711648)
+
+
+def polygon(points):
+    """
+    Args:
+        points: list of (east, north) in meters from ORIGIN
+    Returns:
+        the (latitude, longitude) of the points
+    """
+    return [from_enu(ORIGIN[0], ORIGIN[1], east, north) for east, north in points]
+
+
+def meters(waypoints):
+    result = []
+    for latitude, longitude in waypoints:
+        east, north = to_enu(ORIGIN[0], ORIGIN[1], latitude, longitude)
+        result.append((round(east, 3), round(north, 3)))
+    return result
+
+
+class TestCoverage(unittest.TestCase):
+    def test_1_vision_width(self):
+        # the vision width of the hello message, 0.0001 degree, at the default height of 4 m
+        self.assertAlmostEqual(coverage.vision_width(4.0), 11.1, places=1)
+        self.assertAlmostEqual(coverage.track_spacing(8.0, 0.5), coverage.vision_width(8.0) / 2)
+
+    def test_2_boustrophedon(self):
+        # a rectangle of 100 m east by 50 m north, lines to the north 10 m apart
+        rectangle = polygon([(0, 0), (100, 0), (100, 50), (0, 50)])
+        waypoints = meters(coverage.boustrophedon(rectangle, 10.0))
+        self.assertEqual(waypoints[:4], [(5.0, 0.0), (5.0, 50.0), (15.0, 50.0), (15.0, 0.0)])
+        self.assertEqual(len(waypoints), 20)
+        # lines to the east: 5 of them, centered on the rectangle
+        waypoints = meters(coverage.boustrophedon(rectangle, 10.0, sweep_angle=90.0))
+        self.assertEqual([waypoint[1] for waypoint in waypoints[::2]], [45.0, 35.0, 25.0, 15.0, 5.0])
+        self.assertEqual([waypoint[0] for waypoint in waypoints[:4]], [0.0, 100.0, 100.0, 0.0])
+
+    def test_3_concave(self):
+        # a U: the lines to the east cross both arms above 20 m
+        u = polygon([(0, 0), (90, 0), (90, 60), (60, 60), (60, 20), (30, 20), (30, 60), (0, 60)])
+        waypoints = meters(coverage.boustrophedon(u, 10.0, sweep_angle=90.0))
+        self.assertEqual(waypoints[:4], [(0.0, 55.0), (30.0, 55.0), (60.0, 55.0), (90.0, 55.0)])
+        self.assertEqual(waypoints[4:8], [(90.0, 45.0), (60.0, 45.0), (30.0, 45.0), (0.0, 45.0)])
+        self.assertEqual(waypoints[-2:], [(90.0, 5.0), (0.0, 5.0)])
+
+    def test_4_lazy(self):
+        # a square of 100 km with 1 m between the lines: 10 million waypoints, only the first ones are generated
+        square = polygon([(0, 0), (100000, 0), (100000, 100000), (0, 100000)])
+        waypoints = coverage.generate('boustrophedon', square, 1.0)
+        self.assertEqual(meters([next(waypoints), next(waypoints)]), [(0.5, 0.0), (0.5, 100000.0)])
+
+    def test_5_search_patterns(self):
+        square = polygon([(-100, -100), (100, -100), (100, 100), (-100, 100)])
+        waypoints = meters(coverage.generate('expanding_square', square, 10.0))
+        self.assertEqual(waypoints[:6], [(0.0, 0.0), (0.0, 10.0), (10.0, 10.0), (10.0, -10.0), (-10.0, -10.0),
+                                         (-10.0, 20.0)])
+        # the last square reaches beyond the corners of the area
+        self.assertGreater(max(abs(east) for east, north in waypoints), 100 * math.sqrt(2))
+        waypoints = list(coverage.generate('sector', square, 10.0, sweep_angle=90.0))
+        self.assertEqual(len(waypoints), 10)
+        self.assertEqual(meters(waypoints[:1]), [(0.0, 0.0)])
+        self.assertAlmostEqual(meters(waypoints[1:2])[0][0], 100 * math.sqrt(2), places=1)
+        for latitude, longitude in waypoints:
+            self.assertIn(round(distance(ORIGIN[0], ORIGIN[1], latitude, longitude)), (0, round(100 * math.sqrt(2))))
+        self.assertRaises(ValueError, coverage.generate, 'spiral', square, 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
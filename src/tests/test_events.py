@@ -0,0 +1,74 @@
+import json
+import struct
+import socket
+import logging
+import threading
+import unittest
+
+from shae.onboard.events import EventLog, HALTED, LANDED, WAYPOINT_REACHED, event_frame, event_stream_request, \
+    is_event_stream_request, read_event
+from shae.onboard.server import EventThread
+
+
+class RecordingHeartBeatThread():
+    """Takes the place of the HeartBeatThread, it keeps what would be sent to the workstation"""
+    def __init__(self):
+        self.encoding = 'json'
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+class TestEvents(unittest.TestCase):
+    def test_1_since(self):
+        events = EventLog(size=2)
+        events.emit(WAYPOINT_REACHED, waypoint_order=1)
+        events.emit(HALTED)
+        events.emit(LANDED)
+        self.assertEqual([event['event'] for event in events.since(0)], [HALTED, LANDED])
+        self.assertEqual([event['sequence'] for event in events.since(2)], [3])
+        # a sequence number from before a restart of the control module counts as 0
+        self.assertEqual(len(events.since(10)), 2)
+
+    def test_2_wait(self):
+        events = EventLog()
+        self.assertEqual(events.wait(0, timeout=0.01), [])
+        timer = threading.Timer(0.05, lambda: events.emit(WAYPOINT_REACHED, waypoint_order=3))
+        timer.start()
+        new_events = events.wait(0, timeout=2.0)
+        timer.join()
+        self.assertEqual(len(new_events), 1)
+        self.assertEqual(new_events[0]['waypoint_order'], 3)
+        self.assertEqual(new_events[0]['message_type'], 'event')
+
+    def test_3_stream(self):
+        self.assertIsNotNone(is_event_stream_request(event_stream_request(4)))
+        self.assertIsNone(is_event_stream_request(json.dumps({'message_type': 'status', 'message': 'events'})))
+        frame = event_frame({'event': LANDED})
+        length = struct.unpack(">I", frame[:4])[0]
+        self.assertEqual(json.loads(frame[4:4 + length])['event'], LANDED)
+
+    def test_4_read_event(self):
+        self.assertEqual(read_event(json.dumps({'event': LANDED, 'sequence': 3}))['sequence'], 3)
+        for data in ('{"event": "lan', '[1, 2]', json.dumps({'event': LANDED}), json.dumps({'sequence': 'x'})):
+            self.assertRaises(ValueError, read_event, data)
+
+    def test_5_malformed_frame(self):
+        heartbeat_thread = RecordingHeartBeatThread()
+        event_thread = EventThread(logging.getLogger("test events"), heartbeat_thread)
+        event_thread.sock, control_module = socket.socketpair()
+        good = json.dumps({'event': LANDED, 'sequence': 7})
+        for data in (json.dumps({'event': HALTED, 'sequence': 6}), '{"truncat', json.dumps({'event': HALTED}), good):
+            control_module.sendall(struct.pack(">I", len(data)) + data)
+        control_module.close()
+        # the malformed frames are dropped, the stream goes on with the next frame
+        event_thread.forward_events()
+        self.assertEqual(len(heartbeat_thread.sent), 2)
+        self.assertEqual(heartbeat_thread.sent[1], good)
+        self.assertEqual(event_thread.sequence, 7)
+        event_thread.sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import math
+import unittest
+
+from shae.onboard.geodesy import METERS_PER_DEGREE, batch_bearing, batch_distance, batch_from_enu, batch_offset, \
+    batch_to_enu, bearing, distance, from_enu, offset, to_enu
+
+GHENT = (51.011447, 3.711648)
+
+
+def angle_difference(first, second):
+    return (first - second + 180.0) % 360.0 - 180.0
+
+
+class TestGeodesy(unittest.TestCase):
+    def test_1_distance(self):
+        self.assertAlmostEqual(distance(50.0, 3.7, 51.0, 3.7), METERS_PER_DEGREE, places=3)
+        # a degree of longitude shrinks with cos(latitude)
+        east = distance(GHENT[0], GHENT[1], GHENT[0], GHENT[1] + 0.001)
+        self.assertAlmostEqual(east / (0.001 * METERS_PER_DEGREE), math.cos(math.radians(GHENT[0])), places=6)
+        self.assertEqual(distance(GHENT[0], GHENT[1], GHENT[0], GHENT[1]), 0.0)
+
+    def test_2_bearing_and_offset(self):
+        latitude, longitude = GHENT
+        for heading in (0.0, 45.0, 90.0, 180.0, 270.0):
+            target = offset(latitude, longitude, 250.0, heading)
+            self.assertAlmostEqual(distance(latitude, longitude, target[0], target[1]), 250.0, places=6)
+            self.assertAlmostEqual(angle_difference(bearing(latitude, longitude, target[0], target[1]), heading), 0.0,
+                                   places=3)
+
+    def test_3_enu(self):
+        east, north = to_enu(GHENT[0], GHENT[1], *offset(GHENT[0], GHENT[1], 500.0, 60.0))
+        self.assertAlmostEqual(math.hypot(east, north), 500.0, delta=0.05)
+        self.assertAlmostEqual(math.degrees(math.atan2(east, north)), 60.0, places=2)
+        latitude, longitude = from_enu(GHENT[0], GHENT[1], east, north)
+        self.assertEqual(to_enu(GHENT[0], GHENT[1], latitude, longitude), (east, north))
+
+    def test_4_batch(self):
+        latitudes = [GHENT[0] + i * 1e-4 for i in range(-5, 6)]
+        longitudes = [GHENT[1] - i * 2e-4 for i in range(-5, 6)]
+        distances = batch_distance(GHENT[0], GHENT[1], latitudes, longitudes)
+        bearings = batch_bearing(GHENT[0], GHENT[1], latitudes, longitudes)
+        easts, norths = batch_to_enu(GHENT[0], GHENT[1], latitudes, longitudes)
+        for i in range(len(latitudes)):
+            self.assertAlmostEqual(distances[i], distance(GHENT[0], GHENT[1], latitudes[i], longitudes[i]))
+            self.assertAlmostEqual(angle_difference(bearings[i],
+                                                    bearing(GHENT[0], GHENT[1], latitudes[i], longitudes[i])), 0.0)
+            east, north = to_enu(GHENT[0], GHENT[1], latitudes[i], longitudes[i])
+            self.assertAlmostEqual(easts[i], east)
+            self.assertAlmostEqual(norths[i], north)
+        back = batch_from_enu(GHENT[0], GHENT[1], easts, norths)
+        reached = batch_offset(GHENT[0], GHENT[1], distances, bearings)
+        for i in range(len(latitudes)):
+            self.assertAlmostEqual(back[0][i], latitudes[i], places=9)
+            self.assertAlmostEqual(back[1][i], longitudes[i], places=9)
+            self.assertAlmostEqual(reached[0][i], latitudes[i], places=9)
+            self.assertAlmostEqual(reached[1][i], longitudes[i], places=9)
+
+
+if __name__ == '__main__':
+    unittest.main()
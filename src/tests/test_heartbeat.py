@@ -0,0 +1,148 @@
+import json
+import time
+import socket
+import struct
+import unittest
+
+from shae.onboard.global_classes import recv_exact
+from shae.onboard.heartbeat import Backoff, ConnectTransport, DatagramTransport, DeltaEncoder, StreamTransport, \
+    create_transport, datagram_frame, stream_frame
+
+
+class TestHeartbeat(unittest.TestCase):
+    def heartbeat(self, latitude=51.0, height=4.0, battery_level=90):
+        return json.dumps({'message_type': 'status', 'heartbeat': True, 'timestamp': '01012017120000000',
+                           'current_location': {'latitude': latitude, 'longitude': 3.7},
+                           'height': height, 'battery_level': battery_level, 'gps_signal': 10})
+
+    def test_1_frames(self):
+        self.assertEqual(stream_frame('abc'), struct.pack(">HI", 7, 3) + 'abc')
+        self.assertEqual(datagram_frame(2 ** 32 + 5, 'abc'), struct.pack(">II", 5, 3) + 'abc')
+
+    def test_2_keyframes_and_deltas(self):
+        encoder = DeltaEncoder(keyframe_interval=3)
+        first = json.loads(encoder.encode(self.heartbeat()))
+        self.assertTrue(first['keyframe'])
+        self.assertEqual(first['sequence'], 0)
+        self.assertEqual(first['height'], 4.0)
+
+        # a change below the threshold is not sent, the timestamp always is
+        second = json.loads(encoder.encode(self.heartbeat(height=4.05)))
+        self.assertFalse(second['keyframe'])
+        self.assertEqual(second['sequence'], 1)
+        self.assertNotIn('height', second)
+        self.assertIn('timestamp', second)
+
+        third = json.loads(encoder.encode(self.heartbeat(latitude=51.001, height=4.2)))
+        self.assertEqual(third['current_location']['latitude'], 51.001)
+        self.assertEqual(third['height'], 4.2)
+        self.assertNotIn('battery_level', third)
+
+        self.assertTrue(json.loads(encoder.encode(self.heartbeat()))['keyframe'])
+
+    def test_3_resync(self):
+        encoder = DeltaEncoder(keyframe_interval=100, thresholds={'battery_level': 5})
+        encoder.encode(self.heartbeat())
+        self.assertNotIn('battery_level', json.loads(encoder.encode(self.heartbeat(battery_level=87))))
+        encoder.request_keyframe()
+        resync = json.loads(encoder.encode(self.heartbeat(battery_level=87)))
+        self.assertTrue(resync['keyframe'])
+        self.assertEqual(resync['battery_level'], 87)
+
+    def test_4_backoff(self):
+        backoff = Backoff(initial=10.0, maximum=25.0)
+        self.assertTrue(backoff.ready())
+        self.assertEqual(backoff.failure(), 10.0)
+        self.assertFalse(backoff.ready())
+        self.assertEqual(backoff.failure(), 20.0)
+        self.assertEqual(backoff.failure(), 25.0)
+        backoff.success()
+        self.assertTrue(backoff.ready())
+        self.assertEqual(backoff.failure(), 10.0)
+
+    def test_5_backoff_retry(self):
+        backoff = Backoff(initial=0.02, maximum=0.05)
+        for i in range(4):
+            backoff.failure()
+        self.assertEqual(backoff.failures, 4)
+        self.assertEqual(backoff.delay, 0.05)
+        self.assertFalse(backoff.ready())
+        time.sleep(0.06)
+        self.assertTrue(backoff.ready())  # the workstation can be tried again, the delay stays at the maximum
+        self.assertEqual(backoff.failure(), 0.05)
+        backoff.success()
+        self.assertEqual((backoff.failures, backoff.delay), (0, 0.02))
+
+    def listen(self):
+        workstation = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        workstation.bind(('127.0.0.1', 0))
+        workstation.listen(2)
+        workstation.settimeout(2.0)
+        self.addCleanup(workstation.close)
+        return workstation
+
+    def receive_frame(self, connection):
+        length = struct.unpack(">H", recv_exact(connection, 2))[0]
+        return recv_exact(connection, length)[4:]
+
+    def test_6_connect_transport(self):
+        workstation = self.listen()
+        transport = ConnectTransport(workstation.getsockname())
+        for heartbeat in ('first', 'second'):
+            transport.send(heartbeat)
+            connection, address = workstation.accept()
+            self.assertEqual(self.receive_frame(connection), heartbeat)
+            self.assertEqual(connection.recv(1), '')  # a connection per heartbeat
+            connection.close()
+        address = workstation.getsockname()
+        workstation.close()
+        self.assertRaises(socket.error, ConnectTransport(address).send, 'lost')
+
+    def test_7_stream_transport(self):
+        workstation = self.listen()
+        transport = StreamTransport(workstation.getsockname())
+        self.addCleanup(transport.close)
+        transport.send('first')
+        transport.send('second')
+        connection, address = workstation.accept()
+        self.assertEqual([self.receive_frame(connection), self.receive_frame(connection)], ['first', 'second'])
+        # the workstation closes the connection, a send fails once the drone notices
+        connection.close()
+        for attempt in range(100):
+            try:
+                transport.send('lost')
+            except socket.error:
+                break
+            time.sleep(0.01)
+        self.assertIsNone(transport.sock)
+        transport.send('third')  # the next heartbeat reconnects
+        connection, address = workstation.accept()
+        self.assertEqual(self.receive_frame(connection), 'third')
+        connection.close()
+
+    def test_8_datagram_transport(self):
+        workstation = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        workstation.bind(('127.0.0.1', 0))
+        workstation.settimeout(2.0)
+        self.addCleanup(workstation.close)
+        transport = DatagramTransport(workstation.getsockname())
+        self.addCleanup(transport.close)
+        transport.send('first')
+        transport.send('second')
+        for sequence, heartbeat in enumerate(('first', 'second')):
+            datagram = workstation.recv(1024)
+            self.assertEqual(struct.unpack(">II", datagram[:8]), (sequence, len(heartbeat)))
+            self.assertEqual(datagram[8:], heartbeat)
+
+    def test_9_create_transport(self):
+        address = ('127.0.0.1', 6331)
+        self.assertIsInstance(create_transport('connect', address), ConnectTransport)
+        self.assertIsInstance(create_transport('stream', address), StreamTransport)
+        transport = create_transport('udp', address)
+        self.assertIsInstance(transport, DatagramTransport)
+        transport.close()
+        self.assertRaises(ValueError, create_transport, 'carrier_pigeon', address)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+import json
+import Queue
+import struct
+import logging
+import threading
+import unittest
+
+from shae.onboard.solo import Solo
+from shae.onboard.control_module import ControlModule
+from shae.onboard.job_dispatcher import Job, JobDispatcher
+from shae.onboard.navigation_handler import NavigationHandler, NavigationThread
+from shae.onboard.status_handler import StatusHandler
+from shae.onboard.global_classes import MessageCodes, WayPointQueue
+from shae.tests.test_solo import FakeVehicle
+
+
+class StatusControlModule(ControlModule):
+    """A ControlModule without a drone, it only answers status requests"""
+    def __init__(self, job_dispatcher):
+        self.logger = logging.getLogger("test job dispatcher")
+        self.handler_locks = {'status': threading.Lock()}
+        self.stat_handler = StatusHandler(None, WayPointQueue(), logging.CRITICAL, job_dispatcher=job_dispatcher)
+        self.job_dispatcher = job_dispatcher
+        self.nav_handler = self
+        self.priority_messages = []
+
+    def handle_priority_packet(self, message):
+        self.priority_messages.append(message)
+
+
+class NavigationControlModule(ControlModule):
+    """A ControlModule with a Solo on a FakeVehicle, it only answers navigation requests"""
+    def __init__(self, job_dispatcher):
+        self.logger = logging.getLogger("test job dispatcher")
+        self.handler_locks = {'navigation': threading.Lock()}
+        self.job_dispatcher = job_dispatcher
+        self.vehicle = FakeVehicle()
+        self.solo = Solo(vehicle=self.vehicle, logging_level=logging.CRITICAL)
+        self.waypoint_queue = WayPointQueue()
+        self.nav_thread = NavigationThread(self.solo, self.waypoint_queue, logging.CRITICAL)
+        self.nav_handler = NavigationHandler(self.solo, self.waypoint_queue, self.nav_thread, logging.CRITICAL)
+
+
+class WatchedJob(Job):
+    """A Job that records every change of its state, and whether the lock of the dispatcher was held for it"""
+    def __setattr__(self, name, value):
+        if name == 'state':
+            self.__dict__.setdefault('changes', []).append((value, self.dispatcher.jobs_lock.locked()))
+        self.__dict__[name] = value
+
+
+class CancellingQueue(Queue.Queue):
+    """A job queue that cancels the queued jobs when the dispatcher has just taken a job from it"""
+    def __init__(self, dispatcher):
+        Queue.Queue.__init__(self)
+        self.dispatcher = dispatcher
+        self.cancelled = []
+
+    def get(self, *args):
+        job = Queue.Queue.get(self, *args)
+        if job is not None:
+            self.cancelled.append(self.dispatcher.cancel_queued())
+        return job
+
+
+class TestJobDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = JobDispatcher(logging.CRITICAL)
+        self.release = threading.Event()
+        self.running = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        if self.dispatcher.is_alive():
+            self.dispatcher.stop_thread()
+            self.dispatcher.join(1.0)
+
+    def blocking(self):
+        self.running.set()
+        self.release.wait(5.0)
+        return 'released'
+
+    def finish(self, job):
+        # a job behind the given one is only taken from the queue when the given job finished
+        marker = self.dispatcher.submit('marker', threading.Event().set)
+        while not marker.is_finished():
+            self.release.wait(0.01)
+        return job
+
+    def test_1_lifecycle(self):
+        job = self.dispatcher.submit('start', self.blocking)
+        self.assertEqual(job.job_id, 1)
+        self.assertEqual(job.state, Job.QUEUED)
+        self.assertIs(self.dispatcher.get_job(1), job)
+        self.dispatcher.start()
+        self.assertTrue(self.running.wait(1.0))
+        self.assertEqual(job.state, Job.RUNNING)
+        self.assertIs(self.dispatcher.current_job, job)
+        self.release.set()
+        self.finish(job)
+        self.assertEqual(job.state, Job.DONE)
+        self.assertEqual(job.result, 'released')
+        self.assertTrue(job.submitted <= job.started <= job.finished)
+
+    def test_2_failed(self):
+        def fail():
+            raise ValueError("no gps fix")
+        job = self.dispatcher.submit('start', fail)
+        self.dispatcher.start()
+        self.finish(job)
+        self.assertEqual(job.state, Job.FAILED)
+        self.assertEqual(job.error, "no gps fix")
+        self.assertIsNone(job.result)
+        # the dispatcher keeps executing jobs after a failure
+        job = self.finish(self.dispatcher.submit('go_to', lambda: 1))
+        self.assertEqual((job.state, job.result), (Job.DONE, 1))
+
+    def test_3_cancel_queued(self):
+        running = self.dispatcher.submit('start', self.blocking)
+        self.dispatcher.start()
+        self.assertTrue(self.running.wait(1.0))
+        queued = [self.dispatcher.submit('go_to', lambda: None) for i in range(3)]
+        self.assertEqual(self.dispatcher.cancel_queued(), 3)
+        self.assertEqual([job.state for job in queued], [Job.CANCELLED] * 3)
+        self.assertIsNotNone(queued[0].finished)
+        # the running job is not cancelled, and a second cancel finds nothing
+        self.assertEqual(running.state, Job.RUNNING)
+        self.assertEqual(self.dispatcher.cancel_queued(), 0)
+        self.release.set()
+        self.finish(running)
+        self.assertEqual(running.state, Job.DONE)
+        self.assertEqual([job.started for job in queued], [None] * 3)
+
+    def test_4_history(self):
+        jobs = [self.dispatcher.submit('go_to', lambda: None) for i in range(40)]
+        self.dispatcher.start()
+        self.finish(jobs[-1])
+        # the marker job of finish() is the 41st, submitting one more forgets all but the last 32 finished jobs
+        self.dispatcher.submit('go_to', lambda: None)
+        self.assertEqual(self.dispatcher.history, 32)
+        self.assertEqual(sorted(self.dispatcher.jobs), range(10, 43))
+        self.assertIsNone(self.dispatcher.get_job(9))
+        self.assertIs(self.dispatcher.get_job(10), jobs[9])
+
+    def test_5_to_dict(self):
+        job = self.dispatcher.submit('start', lambda: 'taken off')
+        self.assertEqual(job.to_dict(), {'job_id': 1, 'job_message': 'start', 'state': 'queued',
+                                         'result': None, 'error': None, 'submitted': job.submitted,
+                                         'started': None, 'finished': None})
+        self.dispatcher.start()
+        self.finish(job)
+        state = json.loads(json.dumps(job.to_dict()))  # it is sent to the workstation as JSON
+        self.assertEqual(state['state'], 'done')
+        self.assertEqual(state['result'], 'taken off')
+        self.assertEqual(state['finished'], job.finished)
+
+    def test_6_job_status(self):
+        control_module = StatusControlModule(self.dispatcher)
+        job = self.dispatcher.submit('start', self.blocking)
+        response = control_module.handle_request(json.dumps({'message_type': 'status', 'message': 'job_status',
+                                                             'job_id': job.job_id}))
+        self.assertEqual(struct.unpack(">I", response[:4])[0], MessageCodes.STATUS_RESPONSE)
+        length = struct.unpack(">I", response[4:8])[0]
+        status = json.loads(response[8:8 + length])
+        self.assertEqual(status['job_id'], 1)
+        self.assertEqual(status['state'], 'queued')
+        self.assertEqual(status['message_type'], 'status')
+        # an unknown job and a request without job_id
+        for request in ({'message_type': 'status', 'message': 'job_status', 'job_id': 2},
+                        {'message_type': 'status', 'message': 'job_status'}):
+            response = control_module.handle_request(json.dumps(request))
+            self.assertEqual(response, struct.pack(">I", MessageCodes.ERR))
+
+    def test_7_stop_and_emergency(self):
+        control_module = StatusControlModule(self.dispatcher)
+        self.dispatcher.submit('start', self.blocking)
+        self.dispatcher.start()
+        self.assertTrue(self.running.wait(1.0))
+        queued = self.dispatcher.submit('path', lambda: None)
+        # a stop holds the drone, the queued jobs still run
+        response = control_module.handle_request(json.dumps({'message_type': 'navigation', 'message': 'stop'}))
+        self.assertEqual(response, struct.pack(">I", MessageCodes.ACK))
+        self.assertEqual(queued.state, Job.QUEUED)
+        # an emergency lands the drone, nothing that was queued runs after it
+        control_module.handle_request(json.dumps({'message_type': 'navigation', 'message': 'emergency'}))
+        self.assertEqual(queued.state, Job.CANCELLED)
+        self.assertEqual(control_module.priority_messages, ['stop', 'emergency'])
+
+    def watched_job(self, function):
+        job = self.dispatcher.submit('start', function)
+        job.__dict__['dispatcher'] = self.dispatcher
+        job.__class__ = WatchedJob
+        return job
+
+    def test_8_cancel_while_picked_up(self):
+        ran = []
+        self.dispatcher.job_queue = CancellingQueue(self.dispatcher)
+        job = self.watched_job(lambda: ran.append(True))
+        self.dispatcher.start()
+        while not job.is_finished():
+            self.release.wait(0.01)
+        # cancelled after the dispatcher took it from the queue, before it started: it does not run
+        self.assertEqual(self.dispatcher.job_queue.cancelled, [1])
+        self.assertEqual(job.state, Job.CANCELLED)
+        self.assertIsNone(job.started)
+        self.dispatcher.stop_thread()
+        self.dispatcher.join(1.0)
+        self.assertEqual(ran, [])
+
+        # a job that started can not be cancelled anymore, every change of its state is made under the lock
+        self.dispatcher = JobDispatcher(logging.CRITICAL)
+        job = self.watched_job(lambda: ran.append(self.dispatcher.cancel_queued()))
+        self.dispatcher.start()
+        while not job.is_finished():
+            self.release.wait(0.01)
+        self.assertEqual(ran, [0])
+        self.assertEqual(job.changes, [(Job.RUNNING, True), (Job.DONE, True)])
+
+    def emergency_after_start(self, control_module):
+        for message in ('start', 'emergency'):
+            response = control_module.handle_request(json.dumps({'message_type': 'navigation', 'message': message}))
+            self.assertEqual(response, struct.pack(">I", MessageCodes.ACK))
+
+    def test_9_emergency_after_start(self):
+        control_module = NavigationControlModule(self.dispatcher)
+        control_module.solo.interrupt()  # a previous stop, the start clears it
+        # the start job is queued behind another job, the emergency cancels it
+        self.dispatcher.submit('path', self.blocking)
+        self.dispatcher.start()
+        self.assertTrue(self.running.wait(1.0))
+        self.emergency_after_start(control_module)
+        self.release.set()
+        self.assertEqual(self.dispatcher.get_job(2).state, Job.CANCELLED)
+        self.assertEqual(control_module.vehicle.mode.name, 'LAND')
+
+        # the start job already runs when the emergency arrives, it does not take off
+        solo = control_module.solo
+        solo.interrupt()
+        started, landed = threading.Event(), threading.Event()
+
+        def get_location():
+            started.set()
+            landed.wait(1.0)
+            return Solo.get_location(solo)
+
+        solo.get_location = get_location
+        control_module.handle_request(json.dumps({'message_type': 'navigation', 'message': 'start'}))
+        self.assertTrue(started.wait(1.0))
+        control_module.handle_request(json.dumps({'message_type': 'navigation', 'message': 'emergency'}))
+        landed.set()
+        job = self.dispatcher.get_job(3)
+        while not job.is_finished():
+            self.release.wait(0.01)
+        self.assertEqual(control_module.vehicle.mode.name, 'LAND')
+        self.assertFalse(control_module.vehicle.armed)
+        self.assertEqual(job.state, Job.DONE)
+
+
+if __name__ == '__main__':
+    unittest.main()
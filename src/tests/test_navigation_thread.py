@@ -0,0 +1,252 @@
+import time
+import logging
+import unittest
+from threading import Event
+from Queue import Empty, Queue
+
+from shae.onboard.events import EventLog, PATTERN_FAILED
+from shae.onboard.global_classes import Location, TelemetrySnapshot, WayPoint, WayPointQueue
+from shae.onboard.navigation_handler import NavigationHandler, NavigationThread
+
+
+class RecordingSolo():
+    """Takes the place of the Solo, it records when the NavigationThread sends it to a waypoint"""
+    def __init__(self):
+        self.interrupted = Event()
+        self.is_halted = False
+        self.events = EventLog()
+        self.visits = Queue()
+        self.landed = Event()
+        self.navigation_mode = 'guided'
+        self.target_height = 4.0
+        self.missions = Queue()
+        self.reach = Queue()
+        self.telemetry = TelemetrySnapshot(timestamp=None, latitude=51.0, longitude=3.7, height=4.0, orientation=0.0,
+                                           battery_level=90, gps_signal=10, speed=0.0, velocity=(0.0, 0.0, 0.0),
+                                           mode='GUIDED', armed=True)
+
+    def get_navigation_mode(self):
+        return self.navigation_mode
+
+    def get_target_height(self):
+        return self.target_height
+
+    def get_acceptance_radius(self):
+        return None
+
+    def get_telemetry(self):
+        return self.telemetry
+
+    def get_location(self):
+        return Location(longitude=3.7, latitude=51.0)
+
+    def visit_waypoint(self, waypoint, radius=None):
+        self.visits.put((time.time(), waypoint))
+        return True
+
+    def fly_mission(self, waypoints, on_reached):
+        """Reports a waypoint of the mission reached for every item that is put in self.reach"""
+        self.missions.put(waypoints)
+        reported = 0
+        while reported < len(waypoints):
+            if self.interrupted.is_set():
+                return False
+            if self.is_halted:
+                self.is_halted = False
+                return False
+            try:
+                self.reach.get(timeout=0.01)
+            except Empty:
+                continue
+            on_reached(waypoints[reported])
+            reported += 1
+        return True
+
+    def arm(self):
+        return
+
+    def takeoff(self):
+        return 0
+
+    def halt(self):
+        self.is_halted = True
+
+    def brake(self):
+        self.interrupted.set()
+
+    def resume(self):
+        self.interrupted.clear()
+
+    def land(self):
+        self.landed.set()
+
+
+def path_packet(size):
+    return {'message_type': 'navigation', 'message': 'path',
+            'waypoints': [{'order': i, 'location': {'latitude': 51.0 + i * 1e-5, 'longitude': 3.7}}
+                          for i in range(size)]}
+
+
+class TestNavigationThread(unittest.TestCase):
+    def setUp(self):
+        self.solo = RecordingSolo()
+        self.queue = WayPointQueue()
+        self.thread = NavigationThread(self.solo, self.queue, logging_level=logging.CRITICAL)
+        self.handler = NavigationHandler(self.solo, self.queue, self.thread, logging_level=logging.CRITICAL)
+        self.thread.daemon = True
+        self.thread.start()
+        time.sleep(0.2)  # the thread waits for a path
+
+    def tearDown(self):
+        self.thread.stop_thread()
+        self.thread.join(1.0)
+
+    def test_1_path_latency(self):
+        latencies = []
+        for attempt in range(20):
+            packet = path_packet(1)
+            self.handler.handle_packet(packet, 'path')
+            acked = time.time()  # the ACK is sent when the handler returns
+            visited, waypoint = self.solo.visits.get(timeout=1.0)
+            latencies.append(max(0.0, visited - acked))
+            time.sleep(0.2)  # after the pause at the waypoint, the thread waits for the next path
+        latencies.sort()
+        print "latency from path ACK to the first waypoint: median {0:.2f} ms, max {1:.2f} ms" \
+            .format(latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000)
+        self.assertLess(latencies[-1], 0.05)  # it was up to a second
+
+    def test_2_stop_thread(self):
+        start = time.time()
+        self.thread.stop_thread()
+        self.thread.join(1.0)
+        self.assertFalse(self.thread.is_alive())
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_3_resume(self):
+        self.solo.interrupted.set()  # e.g. a stop before the path arrives
+        self.handler.handle_packet(path_packet(2), 'path')
+        time.sleep(0.2)
+        self.assertTrue(self.solo.visits.empty())
+        self.solo.resume()
+        self.thread.wake()
+        visited, waypoint = self.solo.visits.get(timeout=0.1)
+        self.assertEqual(waypoint.order, 0)
+
+    def test_4_wait_for_start(self):
+        self.solo.telemetry = self.solo.telemetry._replace(armed=False)
+        self.handler.handle_packet(path_packet(2), 'path')
+        time.sleep(0.2)
+        self.assertTrue(self.solo.visits.empty())  # the waypoints are not lost before the start
+        self.solo.telemetry = self.solo.telemetry._replace(armed=True)
+        self.handler.handle_packet({'message_type': 'navigation', 'message': 'start'}, 'start')
+        visited, waypoint = self.solo.visits.get(timeout=0.1)
+        self.assertEqual(waypoint.order, 0)
+
+    def test_5_return_to_home(self):
+        self.handler.handle_packet({'message_type': 'navigation', 'message': 'start'}, 'start')
+        self.handler.handle_packet({'message_type': 'navigation', 'message': 'rth'}, 'rth')
+        visited, waypoint = self.solo.visits.get(timeout=0.1)
+        self.assertEqual((waypoint.order, waypoint.location.latitude), (-1, 51.0))
+        self.assertTrue(self.solo.landed.wait(0.1))
+        self.thread.join(0.1)
+        self.assertFalse(self.thread.is_alive())
+
+    def reached(self):
+        return [event['waypoint_order'] for event in self.solo.events.since(0) if event['event'] == 'waypoint_reached']
+
+    def wait_for_reached(self, count):
+        deadline = time.time() + 1.0
+        while len(self.reached()) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return self.reached()
+
+    def test_6_mission(self):
+        self.solo.navigation_mode = 'mission'
+        self.handler.handle_packet(path_packet(3), 'path')
+        waypoints = self.solo.missions.get(timeout=1.0)
+        self.assertEqual([waypoint.order for waypoint in waypoints], [0, 1, 2])
+        self.assertEqual(self.queue.columns()[0], [1, 2])  # the solo flies to the first waypoint
+        for i in range(3):
+            self.solo.reach.put(True)
+        self.assertEqual(self.wait_for_reached(3), [0, 1, 2])
+        self.assertTrue(self.queue.is_empty())
+
+    def test_7_mission_queue_changes(self):
+        self.solo.navigation_mode = 'mission'
+        self.handler.handle_packet(path_packet(3), 'path')
+        self.solo.missions.get(timeout=1.0)
+        # a new path during the mission, its waypoint goes in front of the waypoints of the mission
+        self.queue.insert_waypoint(WayPoint(location=Location(longitude=3.7, latitude=52.0), order=-5))
+        self.solo.reach.put(True)
+        self.assertEqual(self.wait_for_reached(1), [0])
+        self.assertEqual(self.queue.columns()[0], [-5, 2])  # the waypoint of the mission was taken, not the new one
+        # the rest of the mission is removed from the queue: the mission is halted instead of taking other waypoints
+        self.queue.clear_queue()
+        self.queue.insert_waypoint(WayPoint(location=Location(longitude=3.7, latitude=53.0), order=-1))
+        self.solo.reach.put(True)
+        self.assertEqual(self.wait_for_reached(2), [0, 1])
+        # the waypoint that is left is flown in a new mission
+        waypoints = self.solo.missions.get(timeout=1.0)
+        self.assertEqual([waypoint.location.latitude for waypoint in waypoints], [53.0])
+
+    def test_8_mission_return_to_home(self):
+        self.solo.navigation_mode = 'mission'
+        self.handler.handle_packet({'message_type': 'navigation', 'message': 'start'}, 'start')
+        self.handler.handle_packet(path_packet(3), 'path')
+        self.solo.missions.get(timeout=1.0)
+        self.handler.handle_packet({'message_type': 'navigation', 'message': 'rth'}, 'rth')
+        visited, waypoint = self.solo.visits.get(timeout=1.0)
+        self.assertEqual(waypoint.order, -1)  # the home location is flown to, it is not taken as a mission item
+        self.assertTrue(self.solo.landed.wait(0.5))
+        self.assertEqual(self.reached(), [])
+
+    def test_9_pattern_failed(self):
+        def waypoints():
+            yield 51.0, 3.7
+            yield 51.1, 3.8
+            raise ZeroDivisionError("float division by zero")
+
+        records = list(self.handler.pattern_records('boustrophedon', 4, waypoints()))
+        # the pattern ends at the error, the workstation is told how far it got
+        self.assertEqual(records, [(4, 51.0, 3.7), (4, 51.1, 3.8)])
+        event = self.solo.events.since(0)[-1]
+        self.assertEqual(event['event'], PATTERN_FAILED)
+        self.assertEqual((event['pattern'], event['waypoints']), ('boustrophedon', 2))
+        self.assertEqual(event['error'], "float division by zero")
+
+    def test_10_area_spacing(self):
+        packet = {'message_type': 'navigation', 'message': 'area', 'pattern': 'expanding_square',
+                  'polygon': [{'latitude': 51.0, 'longitude': 3.7}, {'latitude': 51.001, 'longitude': 3.7},
+                              {'latitude': 51.001, 'longitude': 3.701}]}
+        self.solo.telemetry = self.solo.telemetry._replace(armed=False)  # the waypoints stay in the queue
+        self.solo.target_height = 0.0
+        self.assertRaises(ValueError, self.handler.handle_packet, packet, 'area')
+        self.assertEqual(self.queue.sources, [])
+        self.solo.target_height = 4.0
+        self.handler.handle_packet(packet, 'area')
+        self.assertEqual(len(self.queue.sources), 0)  # the whole pattern fits in the first batch
+        self.assertGreater(len(self.queue.orders), 3)
+
+    def test_11_stop_start(self):
+        self.handler.handle_packet(path_packet(3), 'path')
+        self.solo.visits.get(timeout=1.0)
+        self.handler.handle_priority_packet('stop')
+        time.sleep(0.2)
+        self.assertTrue(self.solo.visits.empty())  # the solo holds until the next start
+        self.assertEqual(len(self.queue.orders), 2)
+        self.handler.handle_packet({'message_type': 'navigation', 'message': 'start'}, 'start')
+        self.assertFalse(self.solo.interrupted.is_set())
+        self.assertEqual([self.solo.visits.get(timeout=1.0)[1].order for i in range(2)], [1, 2])
+
+    def test_12_ready_reads_only(self):
+        self.solo.telemetry = self.solo.telemetry._replace(armed=False)
+        self.queue.last_waypoint_order = 3
+        for i in range(5):  # every path wakes the thread, it checks ready() and waits again
+            self.handler.handle_packet(path_packet(1), 'path')
+        time.sleep(0.1)
+        self.assertTrue(self.solo.visits.empty())
+        self.assertEqual(self.queue.last_waypoint_order, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
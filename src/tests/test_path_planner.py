@@ -0,0 +1,89 @@
+import math
+import random
+import unittest
+
+from shae.onboard import path_planner
+from shae.onboard.geodesy import from_enu
+from shae.onboard.global_classes import Location
+from shae.onboard.path_planner import cheapest_position, optimize_route, route_length
+
+START = Location(longitude=3.711648, latitude=51.011447)
+
+
+def waypoints(points):
+    """
+    Args:
+        points: list of (east, north) in meters from START
+    Returns:
+        the latitudes and the longitudes of the points
+    """
+    locations = [from_enu(START.latitude, START.longitude, east, north) for east, north in points]
+    return [location[0] for location in locations], [location[1] for location in locations]
+
+
+class TestPathPlanner(unittest.TestCase):
+    def check_line(self):
+        # points on a line to the east, in a random order: the shortest route visits them from west to east
+        points = [(10.0 * i, 0.0) for i in range(1, 41)]
+        random.shuffle(points)
+        plan = optimize_route(START, *waypoints(points))
+        self.assertTrue(plan.complete)
+        self.assertEqual([points[index][0] for index in plan.order], [10.0 * i for i in range(1, 41)])
+        self.assertAlmostEqual(plan.distance_after, 400.0, places=3)
+        self.assertGreater(plan.distance_before, plan.distance_after)
+
+    def check_grid(self):
+        # a grid of 10 by 10 points, 10 m apart: a lawnmower route of 99 steps plus the way to the first corner
+        points = [(10.0 * (i % 10), 10.0 * (i // 10)) for i in range(100)]
+        random.shuffle(points)
+        plan = optimize_route(START, *waypoints(points))
+        self.assertEqual(sorted(plan.order), range(100))
+        self.assertLess(plan.distance_after, 99 * 10.0 * 1.05)
+
+    def check_budget(self):
+        points = [(random.uniform(0, 500), random.uniform(0, 500)) for i in range(300)]
+        plan = optimize_route(START, *waypoints(points), time_budget=0.0)
+        self.assertFalse(plan.complete)
+        self.assertEqual(sorted(plan.order), range(300))
+        self.assertLessEqual(plan.distance_after, plan.distance_before)
+
+    def check_insertion(self):
+        # a route to the east, every 100 m
+        latitudes, longitudes = waypoints([(100.0 * i, 0.0) for i in range(1, 5)])
+        self.assertAlmostEqual(route_length(START, latitudes, longitudes), 400.0, places=3)
+        for point, position, cost in (((150.0, 0.0), 1, 0.0), ((500.0, 0.0), 4, 100.0), ((-5.0, 0.0), 0, 10.0),
+                                      ((190.0, 50.0), 1, math.hypot(90.0, 50.0) + math.hypot(10.0, 50.0) - 100.0)):
+            (latitude,), (longitude,) = waypoints([point])
+            result = cheapest_position(START, latitudes, longitudes, latitude, longitude)
+            self.assertEqual(result[0], position)
+            self.assertAlmostEqual(result[1], cost, places=3)
+        # an empty route
+        (latitude,), (longitude,) = waypoints([(30.0, 40.0)])
+        self.assertEqual(cheapest_position(START, [], [], latitude, longitude)[0], 0)
+        self.assertAlmostEqual(cheapest_position(START, [], [], latitude, longitude)[1], 50.0, places=3)
+        self.assertEqual(route_length(START, [], []), 0.0)
+
+    def test_1_numpy(self):
+        if path_planner.numpy is None:
+            self.skipTest("NumPy is not installed")
+        random.seed(1)
+        self.check_line()
+        self.check_grid()
+        self.check_budget()
+        self.check_insertion()
+
+    def test_2_without_numpy(self):
+        numpy = path_planner.numpy
+        path_planner.numpy = None
+        try:
+            random.seed(1)
+            self.check_line()
+            self.check_grid()
+            self.check_budget()
+            self.check_insertion()
+        finally:
+            path_planner.numpy = numpy
+
+
+if __name__ == '__main__':
+    unittest.main()
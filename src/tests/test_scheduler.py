@@ -0,0 +1,85 @@
+import unittest
+
+from shae.onboard.scheduler import DeadlineScheduler
+
+
+class FakeClock():
+    """A monotonic clock that only moves when the test says so"""
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestDeadlineScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = DeadlineScheduler(1.0, clock=self.clock)
+        self.scheduler.start()
+
+    def run_task(self, duration, late=0.0):
+        """
+        Run the task once: it starts 'late' seconds after it was woken up and takes 'duration' seconds
+
+        Returns:
+            the delay until the next run
+        """
+        self.clock.sleep(late)
+        self.scheduler.tick()
+        self.clock.sleep(duration)
+        delay = self.scheduler.next_delay()
+        self.clock.sleep(delay)
+        return delay
+
+    def test_1_no_drift(self):
+        # the work takes 0.3 s, the next run is still exactly one period after the previous deadline
+        for i in range(5):
+            self.assertAlmostEqual(self.run_task(0.3), 0.7)
+        self.assertAlmostEqual(self.clock.now, 105.0)
+        self.assertEqual(self.scheduler.stats()['overruns'], 0)
+
+    def test_2_late_tick(self):
+        self.run_task(0.1)
+        # the task is woken up 0.4 s late, this does not move the deadlines after it
+        self.assertAlmostEqual(self.run_task(0.1, late=0.4), 0.5)
+        self.assertAlmostEqual(self.clock.now, 102.0)
+        self.assertAlmostEqual(self.run_task(0.1), 0.9)
+        self.assertAlmostEqual(self.clock.now, 103.0)
+        stats = self.scheduler.stats()
+        self.assertEqual(stats['ticks'], 3)
+        self.assertAlmostEqual(stats['max_jitter'], 0.4)
+        self.assertAlmostEqual(stats['mean_jitter'], 0.4 / 3)
+        self.assertEqual(stats['overruns'], 0)
+
+    def test_3_overrun(self):
+        # the work takes 2.5 periods: the deadlines at 101 and 102 are missed, the next run is at 103
+        self.assertAlmostEqual(self.run_task(2.5), 0.5)
+        self.assertAlmostEqual(self.clock.now, 103.0)
+        stats = self.scheduler.stats()
+        self.assertEqual((stats['overruns'], stats['skipped']), (1, 2))
+        # work that takes exactly a period is not an overrun, the next run starts right away
+        self.assertAlmostEqual(self.run_task(1.0), 0.0)
+        self.assertAlmostEqual(self.run_task(0.2), 0.8)
+        self.assertAlmostEqual(self.clock.now, 105.0)
+        stats = self.scheduler.stats()
+        self.assertEqual((stats['ticks'], stats['overruns'], stats['skipped']), (3, 1, 2))
+        self.assertAlmostEqual(stats['max_jitter'], 0.0)
+
+    def test_4_set_period(self):
+        self.run_task(0.1)
+        self.scheduler.set_period(0.5)  # the next deadline is one new period after the previous one
+        self.assertAlmostEqual(self.scheduler.deadline, 100.5)
+        self.scheduler.tick()
+        self.assertAlmostEqual(self.scheduler.stats()['max_jitter'], 0.5)
+        # start() resets the statistics
+        self.scheduler.start()
+        self.assertEqual(self.scheduler.stats(), {'period': 0.5, 'ticks': 0, 'overruns': 0, 'skipped': 0,
+                                                  'mean_jitter': 0.0, 'max_jitter': 0.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import json
+import Queue
+import socket
+import struct
+import logging
+import threading
+import unittest
+
+from shae.onboard.server import RequestWorker, Server, is_session_request, process_request
+from shae.onboard.global_classes import MessageCodes, recv_exact
+
+
+class FakeControlPool():
+    """Takes the place of the ControlChannelPool, a request with "slow" in it waits until self.release is set"""
+    def __init__(self):
+        self.release = threading.Event()
+        self.slow_started = threading.Event()
+        self.priority = []
+
+    def request(self, data):
+        if 'slow' in data:
+            self.slow_started.set()
+            self.release.wait(5.0)
+        response = json.dumps({'message_type': 'status', 'echo': json.loads(data)['message']})
+        return MessageCodes.STATUS_RESPONSE, [response]
+
+    def priority_request(self, data):
+        self.priority.append(json.loads(data)['message'])
+        return MessageCodes.ACK, []
+
+
+class SessionServer(Server):
+    """A Server without the sockets and threads of its own, it only opens sessions"""
+    def __init__(self, control_pool):
+        self.logger = logging.getLogger("test session")
+        self.request_queue = Queue.Queue()
+        self.control_pool = control_pool
+        self.heartbeat_thread = None
+        self.sessions = []
+
+
+def request(message, message_type='status'):
+    return json.dumps({'message_type': message_type, 'message': message})
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.control_pool = FakeControlPool()
+        self.server = SessionServer(self.control_pool)
+        self.workers = [RequestWorker(self.server.request_queue, self.control_pool, None, self.server.logger)
+                        for i in range(2)]
+        for worker in self.workers:
+            worker.start()
+        self.workstation, drone = socket.socketpair()
+        self.workstation.settimeout(2.0)
+        # the Server has read the session request from the new connection
+        self.assertTrue(is_session_request(request('open', message_type='session')))
+        self.server.open_session(drone)
+        self.session = self.server.sessions[0]
+
+    def tearDown(self):
+        self.control_pool.release.set()
+        self.session.stop_thread()
+        self.session.join(1.0)
+        self.workstation.close()
+        for worker in self.workers:
+            self.server.request_queue.put(None)
+
+    def send(self, request_id, data):
+        self.workstation.sendall(struct.pack(">II", len(data), request_id) + data)
+
+    def receive(self):
+        """
+        Returns:
+            the request ID, the status code and the response of the next response in the session
+        """
+        request_id, status_code = struct.unpack(">IH", recv_exact(self.workstation, 6))
+        if status_code != MessageCodes.STATUS_RESPONSE:
+            return request_id, status_code, None
+        length = struct.unpack(">H", recv_exact(self.workstation, 2))[0]
+        data = recv_exact(self.workstation, length)
+        return request_id, status_code, json.loads(data[4:4 + struct.unpack(">I", data[:4])[0]])
+
+    def test_1_handshake(self):
+        self.assertEqual(struct.unpack(">H", recv_exact(self.workstation, 2))[0], MessageCodes.ACK)
+        self.assertTrue(self.session.is_alive())
+        self.assertFalse(is_session_request(request('all_statuses')))
+        self.assertFalse(is_session_request('{"message_type": "session"'))
+
+    def test_2_request_ids(self):
+        recv_exact(self.workstation, 2)
+        self.send(7, request('battery_level'))
+        request_id, status_code, response = self.receive()
+        self.assertEqual((request_id, status_code), (7, MessageCodes.STATUS_RESPONSE))
+        self.assertEqual(response['echo'], 'battery_level')
+        # the largest ID that fits in '>I'
+        self.send(2 ** 32 - 1, request('height'))
+        self.assertEqual(self.receive()[0], 2 ** 32 - 1)
+
+    def test_3_out_of_order(self):
+        recv_exact(self.workstation, 2)
+        self.send(1, request('slow'))
+        self.assertTrue(self.control_pool.slow_started.wait(1.0))
+        self.send(2, request('fast'))
+        self.assertEqual(self.receive()[0], 2)
+        # a priority request does not go through the queue of the workers
+        self.send(3, request('emergency', message_type='navigation'))
+        self.assertEqual(self.receive(), (3, MessageCodes.ACK, None))
+        self.assertEqual(self.control_pool.priority, ['emergency'])
+        self.control_pool.release.set()
+        request_id, status_code, response = self.receive()
+        self.assertEqual((request_id, response['echo']), (1, 'slow'))
+
+    def test_4_disconnect(self):
+        recv_exact(self.workstation, 2)
+        # the workstation goes away in the middle of a request
+        data = request('height')
+        self.workstation.sendall(struct.pack(">II", len(data), 5) + data[:4])
+        self.workstation.shutdown(socket.SHUT_WR)
+        self.session.join(1.0)
+        self.assertFalse(self.session.is_alive())
+        self.assertTrue(self.server.request_queue.empty())
+
+    def test_5_recv_exact(self):
+        sender, receiver = socket.socketpair()
+        sender.sendall('abc')
+        timer = threading.Timer(0.05, lambda: sender.sendall('defg'))
+        timer.start()
+        self.assertEqual(recv_exact(receiver, 5), 'abcde')  # it keeps reading until all bytes arrived
+        timer.join()
+        sender.close()
+        self.assertIsNone(recv_exact(receiver, 4))  # 'fg' and then the connection was closed
+        self.assertEqual(recv_exact(receiver, 0), '')
+        receiver.close()
+
+    def test_6_process_request(self):
+        # the framing of a one-shot request: the status code, the length and the length-prefixed response
+        response = process_request(request('height'), self.control_pool, None, self.server.logger)
+        status_code, length, inner = struct.unpack(">HHI", response[:8])
+        self.assertEqual(status_code, MessageCodes.STATUS_RESPONSE)
+        self.assertEqual(length, inner + 4)
+        self.assertEqual(json.loads(response[8:])['echo'], 'height')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -78,5 +78,23 @@ class TestSettings(unittest.TestCase):
 
         return
 
+    def test_4_acceptance_radius_message(self):
+        radius_message = {'message_type': 'settings', 'message': [{'key': 'acceptance_radius', 'value': 3.0}]}
+        json_radius_message = json.dumps(radius_message)
+
+        sock = socket.socket(socket.AF_INET,  # Internet
+                             socket.SOCK_STREAM)  # TCP
+        # Connect to server and send data
+        sock.connect(("127.0.0.1", 6330))
+        sock.send(struct.pack(">I", len(json_radius_message)))
+        sock.send(json_radius_message)
+        data = sock.recv(2)
+        ack = struct.unpack(">H", data)[0]
+        sock.close()
+        self.assertEqual(ack, 200)
+        time.sleep(1)  # wait a bit before going to the next test
+
+        return
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,62 @@
+import os
+import json
+import time
+import unittest
+
+from shae.onboard.global_classes import TelemetrySnapshot
+from shae.onboard.shared_telemetry import TelemetryReader, TelemetryWriter
+
+PATH = "/tmp/shae_test_telemetry"
+
+
+class TestSharedTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.writer = TelemetryWriter(path=PATH, slots=4)
+        self.reader = TelemetryReader(path=PATH)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+        os.remove(PATH)
+
+    def telemetry(self, height=4.0, battery_level=90, velocity=(1.0, 0.0, -0.5)):
+        return TelemetrySnapshot(timestamp=time.time(), latitude=51.0, longitude=3.7, height=height,
+                                 orientation=0.5, battery_level=battery_level, gps_signal=10, speed=2.5,
+                                 velocity=velocity, mode='GUIDED', armed=True)
+
+    def test_1_empty(self):
+        self.assertIsNone(self.reader.latest())
+        self.assertIsNone(self.reader.heartbeat())
+
+    def test_2_latest(self):
+        for i in range(10):  # more records than slots, the ring wraps around
+            self.writer.publish(self.telemetry(height=float(i)), i)
+        telemetry, waypoint_order = self.reader.latest()
+        self.assertEqual(telemetry.height, 9.0)
+        self.assertEqual(waypoint_order, 9)
+        self.assertEqual(telemetry.velocity, (1.0, 0.0, -0.5))
+        self.assertEqual(telemetry.mode, 'GUIDED')
+        self.assertTrue(telemetry.armed)
+
+    def test_3_missing_values(self):
+        self.writer.publish(self.telemetry(battery_level=None, velocity=None), None)
+        telemetry, waypoint_order = self.reader.latest()
+        self.assertIsNone(telemetry.battery_level)
+        self.assertIsNone(telemetry.velocity)
+        self.assertIsNone(waypoint_order)
+
+    def test_4_heartbeat(self):
+        self.writer.publish(self.telemetry(), 2)
+        heartbeat = json.loads(self.reader.heartbeat())
+        self.assertTrue(heartbeat['heartbeat'])
+        self.assertEqual(heartbeat['waypoint_order'], 2)
+        self.assertEqual(heartbeat['current_location'], {'latitude': 51.0, 'longitude': 3.7})
+
+    def test_5_stale(self):
+        self.writer.publish(self.telemetry(), 2)
+        self.reader.max_age = 0.01
+        time.sleep(0.02)
+        self.assertIsNone(self.reader.latest())
+
+if __name__ == '__main__':
+    unittest.main()
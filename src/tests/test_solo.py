@@ -0,0 +1,129 @@
+import unittest
+from collections import namedtuple
+
+from dronekit import VehicleMode
+
+from shae.onboard.solo import Solo, TELEMETRY_ATTRIBUTES
+
+Frame = namedtuple('Frame', ['lat', 'lon', 'alt'])
+Attitude = namedtuple('Attitude', ['pitch', 'yaw', 'roll'])
+Battery = namedtuple('Battery', ['voltage', 'current', 'level'])
+GPSInfo = namedtuple('GPSInfo', ['eph', 'epv', 'fix_type', 'satellites_visible'])
+
+
+class FakeVehicle(object):
+    """Takes the place of a DroneKit Vehicle, a test sets its attributes and calls the listeners"""
+    def __init__(self):
+        self.location = namedtuple('Locations', ['global_relative_frame'])(Frame(51.0, 3.7, 0.0))
+        self.attitude = None
+        self.battery = None
+        self.gps_0 = None
+        self.velocity = None
+        self.airspeed = 0.0
+        self._mode = VehicleMode('GUIDED')
+        self.armed = False
+        self.attribute_listeners = {}
+        self.message_listeners = {}
+        self.sent = []
+        self.message_factory = self
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        self._mode = VehicleMode(mode.name)
+
+    def add_attribute_listener(self, name, listener):
+        self.attribute_listeners.setdefault(name, []).append(listener)
+
+    def add_message_listener(self, name, listener):
+        self.message_listeners.setdefault(name, []).append(listener)
+
+    def set(self, name, value):
+        """Change an attribute and call its listeners, like the DroneKit thread does"""
+        if name == 'location.global_relative_frame':
+            self.location = self.location._replace(global_relative_frame=value)
+        elif name == 'mode':
+            self._mode = value
+        else:
+            setattr(self, name, value)
+        for listener in self.attribute_listeners.get(name, []):
+            listener(self, name, value)
+
+    def set_mode_encode(self, *args):
+        return ('set_mode',) + args
+
+    def send_mavlink(self, message):
+        self.sent.append(message)
+
+    def flush(self):
+        return
+
+
+class TestSolo(unittest.TestCase):
+    def setUp(self):
+        self.vehicle = FakeVehicle()
+        self.solo = Solo(vehicle=self.vehicle)
+
+    def test_1_listeners(self):
+        self.assertEqual(sorted(self.vehicle.attribute_listeners), sorted(TELEMETRY_ATTRIBUTES))
+
+    def test_2_brake_in_a_mission(self):
+        self.vehicle.set('mode', VehicleMode('AUTO'))
+        self.solo.brake()
+        self.assertTrue(self.solo.interrupted.is_set())
+        self.assertEqual(self.vehicle.sent[0][0], 'set_mode')  # BRAKE mode
+        # going back to AUTO would continue the mission, the solo holds in GUIDED mode
+        self.assertEqual(self.vehicle.mode.name, 'GUIDED')
+        self.assertIn('halted', [event['event'] for event in self.solo.events.since(0)])
+
+    def test_3_brake_in_guided(self):
+        self.solo.brake()
+        self.assertEqual(self.vehicle.mode.name, 'GUIDED')
+
+    def test_4_telemetry(self):
+        snapshots = []
+        self.solo.add_telemetry_listener(snapshots.append)
+        # the attributes DroneKit did not receive yet
+        telemetry = self.solo.get_telemetry()
+        self.assertEqual((telemetry.latitude, telemetry.longitude, telemetry.height), (51.0, 3.7, 0.0))
+        self.assertIsNone(telemetry.orientation)
+        self.assertIsNone(telemetry.battery_level)
+        self.assertIsNone(telemetry.velocity)
+        self.assertEqual(telemetry.gps_signal, -1)
+        self.assertEqual((telemetry.mode, telemetry.armed), ('GUIDED', False))
+
+        self.vehicle.set('location.global_relative_frame', Frame(51.001, 3.702, 4.5))
+        self.vehicle.set('attitude', Attitude(0.0, 1.5, 0.0))
+        self.vehicle.set('battery', Battery(12.4, 1.0, 87))
+        self.vehicle.set('gps_0', GPSInfo(120, 150, 3, 9))
+        self.vehicle.set('airspeed', 2.5)
+        self.vehicle.set('velocity', [1.0, -0.5, 0.1])
+        self.vehicle.set('armed', True)
+        self.assertEqual(len(snapshots), 7)  # a new snapshot for every callback
+        telemetry = self.solo.get_telemetry()
+        self.assertIs(telemetry, snapshots[-1])
+        self.assertEqual(telemetry.location().latitude, 51.001)
+        self.assertEqual((telemetry.longitude, telemetry.height), (3.702, 4.5))
+        self.assertEqual((telemetry.orientation, telemetry.battery_level, telemetry.gps_signal), (1.5, 87, 9))
+        self.assertEqual(telemetry.speed, 2.5)
+        self.assertEqual(telemetry.velocity, (1.0, -0.5, 0.1))  # a tuple, a snapshot does not change
+        self.assertTrue(telemetry.armed)
+        # an earlier snapshot keeps its values
+        self.assertIsNone(snapshots[0].orientation)
+
+        # DroneKit sets an attribute back to None when it is not known anymore, e.g. the battery
+        self.vehicle.set('battery', None)
+        self.vehicle.set('velocity', None)
+        self.vehicle.set('gps_0', GPSInfo(0, 0, 0, None))
+        telemetry = self.solo.get_telemetry()
+        self.assertIsNone(telemetry.battery_level)
+        self.assertIsNone(telemetry.velocity)
+        self.assertEqual(telemetry.gps_signal, -1)
+        self.assertEqual(telemetry.orientation, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -111,5 +111,32 @@ class TestStatus(unittest.TestCase):
 
         return
 
+    def test_5_multiple_keys_message(self):
+        status_message = {'message_type': 'status', 'message': [{'key': 'speed'}, {'key': 'height'},
+                                                                {'key': 'gps_signal'}, {'key': 'unknown'}]}
+        json_dt_message = json.dumps(status_message)
+
+        sock = socket.socket(socket.AF_INET,  # Internet
+                             socket.SOCK_STREAM)  # TCP
+        # Connect to server and send data
+        sock.connect(("127.0.0.1", 6330))
+        sock.send(struct.pack(">I", len(json_dt_message)))
+        sock.send(json_dt_message)
+        data = sock.recv(2)
+        ack = struct.unpack(">H", data)[0]
+        data = sock.recv(2)
+        length = struct.unpack(">H", data)[0]
+        response = sock.recv(length)
+        print response
+        sock.close()
+        self.assertEqual(ack, 300)
+        status = json.loads(response[4:])
+        for key in ('speed', 'height', 'gps_signal'):
+            self.assertIn(key, status)
+        self.assertEqual(list(status['errors']), ['unknown'])
+        time.sleep(1)  # wait a bit before going to the next test
+
+        return
+
 if __name__ == '__main__':
     unittest.main()
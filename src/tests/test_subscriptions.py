@@ -0,0 +1,46 @@
+import unittest
+
+from shae.onboard.global_classes import monotonic
+from shae.onboard.subscriptions import SubscriptionSchedule, TokenBucket
+
+
+class TestSubscriptions(unittest.TestCase):
+    def test_1_token_bucket(self):
+        bucket = TokenBucket(rate=100)
+        now = bucket.last
+        self.assertTrue(bucket.consume(80, now))
+        self.assertFalse(bucket.consume(80, now))
+        self.assertAlmostEqual(bucket.delay(80, now), 0.6)
+        self.assertTrue(bucket.consume(80, now + 0.61))
+        # a message larger than the burst is sent once the bucket is full
+        self.assertTrue(bucket.consume(500, now + 10))
+        self.assertFalse(bucket.consume(1, now + 10))
+
+    def test_2_rates(self):
+        schedule = SubscriptionSchedule({'current_location': 10, 'battery_level': 0.5}, max_bandwidth=100000)
+        start = monotonic()
+        pushes = {'current_location': 0, 'battery_level': 0}
+        now = start
+        while now < start + 1.95:
+            fields = schedule.due(now)
+            if fields and schedule.admit(fields, 100, now):
+                for field in fields:
+                    pushes[field] += 1
+            now += max(schedule.next_delay(now), 0.001)
+        self.assertEqual(pushes, {'current_location': 20, 'battery_level': 1})
+
+    def test_3_bandwidth(self):
+        schedule = SubscriptionSchedule({'height': 50}, max_bandwidth=1000)
+        now = schedule.bucket.last
+        end = now + 10.0
+        sent = 0
+        while now < end:
+            fields = schedule.due(now)
+            if fields and schedule.admit(fields, 100, now):
+                sent += 100
+            now += max(schedule.next_delay(now), 0.001)
+        self.assertLessEqual(sent, 1000 + 10 * 1000)  # one burst, then the rate
+        self.assertGreater(schedule.throttled, 0)
+
+if __name__ == '__main__':
+    unittest.main()
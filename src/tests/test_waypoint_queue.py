@@ -0,0 +1,194 @@
+import random
+import unittest
+from threading import Thread
+
+from shae.onboard.global_classes import Location, WayPoint, WayPointQueue
+
+
+def waypoint(order, name=0):
+    return WayPoint(location=Location(longitude=name, latitude=order), order=order)
+
+
+class TestWayPointQueue(unittest.TestCase):
+    def test_1_ordered_insert(self):
+        random_list = [4, 3, 6, 1, 5, 2, 3]
+        wpq = WayPointQueue()
+        for i, order in enumerate(random_list):
+            wpq.insert_waypoint(waypoint(order, i))
+        self.assertEqual([wp.order for wp in wpq.queue], [1, 2, 3, 3, 4, 5, 6])
+        # waypoints with the same order stay in the order they were inserted
+        self.assertEqual([wp.location.longitude for wp in wpq.queue if wp.order == 3], [1, 6])
+
+    def test_2_bulk_insert(self):
+        orders = range(1000)
+        random.shuffle(orders)
+        wpq = WayPointQueue()
+        wpq.insert_waypoint(waypoint(500, -1.0))
+        wpq.insert_waypoints([waypoint(order) for order in orders])
+        waypoints = wpq.waypoints()
+        self.assertEqual([wp.order for wp in waypoints], sorted(orders + [500]))
+        self.assertEqual(waypoints[500].location.longitude, -1.0)
+        orders, latitudes, longitudes = wpq.columns()
+        self.assertEqual(orders, [wp.order for wp in waypoints])
+        self.assertEqual(latitudes, [float(order) for order in orders])
+
+    def test_3_front_and_remove(self):
+        wpq = WayPointQueue()
+        wpq.insert_waypoints([waypoint(order) for order in (2, 3, 4)])
+        first = wpq.remove_waypoint()
+        self.assertEqual(first.order, 2)
+        self.assertEqual(wpq.peek_waypoint().order, 3)
+        wpq.insert_waypoint(first, side='front')  # visited again after a stop
+        self.assertEqual(wpq.remove_waypoint().order, 2)
+        self.assertEqual(wpq.last_waypoint_order, 2)
+        wpq.insert_waypoint(waypoint(-1, 7.0), side='front')  # the home location, when returning to home
+        self.assertEqual(wpq.peek_waypoint().location.longitude, 7.0)
+        self.assertEqual(wpq.remove_waypoint(side='back').order, 4)
+        wpq.clear_queue()
+        self.assertTrue(wpq.is_empty())
+        self.assertIsNone(wpq.peek_waypoint())
+
+    def test_4_invalid_order(self):
+        wpq = WayPointQueue()
+        wpq.insert_records([(1, 51.0, 3.7)])
+        self.assertRaises(ValueError, wpq.insert_records, [(2, 51.0, 3.7), ('3', 51.0, 3.7)])
+        self.assertEqual(wpq.columns(), ([1], [51.0], [3.7]))
+
+    def test_5_snapshot(self):
+        wpq = WayPointQueue()
+        wpq.insert_waypoints([waypoint(order) for order in (1, 2, 3)])
+        snapshot = wpq.snapshot()
+        self.assertIs(wpq.snapshot(), snapshot)  # nothing changed, nothing is copied
+        wpq.remove_waypoint()
+        wpq.insert_waypoint(waypoint(0, 5.0))
+        # the snapshot does not change with the queue
+        self.assertEqual([wp['order'] for wp in snapshot.to_dicts()], [1, 2, 3])
+        self.assertEqual([wp['order'] for wp in wpq.snapshot().to_dicts()], [0, 2, 3])
+        self.assertEqual(wpq.snapshot().version, snapshot.version + 2)
+
+    def test_6_changes_since(self):
+        wpq = WayPointQueue()
+        wpq.insert_waypoints([waypoint(order) for order in (1, 2, 3)])
+        snapshot, insertions, removed = wpq.changes_since(-1)
+        self.assertIsNone(insertions)  # an unknown version, the reader needs all the waypoints
+        known = dict((wp['id'], wp['order']) for wp in snapshot.to_dicts(ids=True))
+        version = snapshot.version
+        wpq.remove_waypoint()
+        wpq.insert_waypoint(waypoint(4))
+        wpq.insert_waypoint(waypoint(5))
+        wpq.remove_waypoint(side='back')  # inserted and removed after 'version', the reader never sees it
+        snapshot, insertions, removed = wpq.changes_since(version)
+        added = snapshot.to_dicts(ids=True, inserted_after=insertions)
+        self.assertEqual([wp['order'] for wp in added], [4])
+        self.assertEqual([known[waypoint_id] for waypoint_id in removed], [1])
+        for waypoint_id in removed:
+            del known[waypoint_id]
+        known.update((wp['id'], wp['order']) for wp in added)
+        self.assertEqual(sorted(known.values()), wpq.columns()[0])
+        self.assertEqual(wpq.changes_since(snapshot.version)[1:], (snapshot.insertions, []))
+        wpq.clear_queue()
+        self.assertIsNone(wpq.changes_since(snapshot.version)[1])
+
+    def test_7_insert_at(self):
+        wpq = WayPointQueue()
+        self.assertTrue(wpq.insert_at(0, 0.0, 1.0, wpq.version, order=3))  # an empty queue, the order is used
+        wpq.insert_waypoints([waypoint(order, 2.0) for order in (1, 1, 2)])
+        self.assertFalse(wpq.insert_at(0, 0.0, 3.0, wpq.version - 1))  # the queue changed since
+        # the queue is (1, 1, 2, 3), a waypoint between the two waypoints with order 1 and one between 2 and 3
+        self.assertTrue(wpq.insert_at(1, 0.0, 4.0, wpq.version))
+        self.assertTrue(wpq.insert_at(4, 0.0, 5.0, wpq.version))
+        self.assertTrue(wpq.insert_at(6, 0.0, 6.0, wpq.version))  # the back
+        self.assertTrue(wpq.insert_at(0, 0.0, 7.0, wpq.version))  # the front
+        orders, latitudes, longitudes = wpq.columns()
+        self.assertEqual(zip(orders, longitudes), [(1, 7.0), (1, 2.0), (1, 4.0), (1, 2.0), (2, 2.0), (2, 5.0),
+                                                   (3, 1.0), (3, 6.0)])
+        # always between the same two waypoints, until the ranks have to be spread again
+        for i in range(200):
+            self.assertTrue(wpq.insert_at(2, 0.0, 100.0 + i, wpq.version))
+        longitudes = wpq.columns()[2]
+        self.assertEqual(longitudes[:2] + longitudes[202:], [7.0, 2.0, 4.0, 2.0, 2.0, 5.0, 1.0, 6.0])
+        self.assertEqual(longitudes[2:202], [100.0 + i for i in reversed(range(200))])
+        # the waypoints that are inserted in order still go before or after the others with the same order
+        wpq.insert_waypoint(waypoint(1, 8.0))
+        wpq.insert_waypoint(waypoint(1, 9.0), side='front')
+        longitudes = wpq.columns()[2]
+        self.assertEqual((longitudes[0], longitudes[205]), (9.0, 8.0))
+        self.assertEqual(len(set(wp['id'] for wp in wpq.snapshot().to_dicts(ids=True))), 210)
+
+    def test_8_insert_lazily(self):
+        wpq = WayPointQueue()
+        generated = []
+
+        def records():
+            for i in range(1200):
+                generated.append(i)
+                yield 5, float(i), 0.0
+
+        wpq.insert_waypoint(waypoint(9))
+        wpq.insert_lazily(records())
+        self.assertEqual(len(generated), wpq.FEED_BATCH)
+        self.assertEqual(wpq.columns()[0], [5] * wpq.FEED_BATCH + [9])
+        latitudes = [wpq.remove_waypoint().location.latitude for i in range(wpq.FEED_BATCH - wpq.FEED_LOW)]
+        self.assertEqual(len(generated), 2 * wpq.FEED_BATCH)  # the next batch, before the first one runs out
+        latitudes += [wpq.remove_waypoint().location.latitude for i in range(1200 + 1 - len(latitudes))]
+        self.assertEqual(latitudes, [float(i) for i in range(1200)] + [9])
+        self.assertTrue(wpq.is_empty())
+        self.assertEqual(wpq.sources, [])
+
+    def test_9_take_waypoint(self):
+        wpq = WayPointQueue()
+        wpq.insert_waypoints([waypoint(order) for order in (1, 2, 3)])
+        ids = [wp['id'] for wp in wpq.snapshot().to_dicts(ids=True)]
+        self.assertEqual(wpq.take_waypoint(ids[1]).order, 2)
+        self.assertIsNone(wpq.take_waypoint(ids[1]))  # it is not in the queue anymore
+        self.assertEqual(wpq.take_waypoint(ids[0]).order, 1)
+        self.assertEqual(wpq.columns()[0], [3])
+        wpq.clear_queue()
+        self.assertRaises(IndexError, wpq.remove_waypoint)
+        # the lock was released, another thread can take it
+        acquired = []
+        thread = Thread(target=lambda: acquired.append(wpq.queue_lock.acquire(False)))
+        thread.start()
+        thread.join()
+        self.assertEqual(acquired, [True])
+
+    def test_10_failing_source(self):
+        wpq = WayPointQueue()
+
+        def records():
+            for i in range(wpq.FEED_BATCH):
+                yield 5, float(i), 0.0
+            raise ZeroDivisionError("a broken pattern")
+
+        wpq.insert_lazily(records())
+        for i in range(wpq.FEED_BATCH - wpq.FEED_LOW - 1):
+            wpq.remove_waypoint()
+        # the error of the next batch is raised, the waypoint is removed anyway and the source is not asked again
+        self.assertRaises(ZeroDivisionError, wpq.remove_waypoint)
+        self.assertEqual(wpq.current_waypoint.location.latitude, wpq.FEED_BATCH - wpq.FEED_LOW - 1)
+        self.assertEqual(len(wpq.orders), wpq.FEED_LOW)
+        self.assertEqual(wpq.sources, [])
+        self.assertEqual(wpq.remove_waypoint().location.latitude, wpq.FEED_BATCH - wpq.FEED_LOW)
+
+    def test_11_merge(self):
+        wpq = WayPointQueue()
+        wpq.insert_records([(order, float(i), 0.0) for i, order in enumerate((1, 3, 3, 5, 8))])
+        wpq.insert_waypoint(waypoint(3, 1.0), side='front')
+        wpq.insert_at(2, 50.0, 0.0, wpq.version, order=3)  # a rank between those of its neighbours
+        records = [(random.choice(range(10)), 100.0 + i, 1.0) for i in range(200)]
+        wpq.insert_records(records)
+        # the same as sorting the whole queue on its keys
+        keys = [wpq.key(index) for index in range(len(wpq.orders))]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(set(wpq.ids)), 207)
+        # the new waypoints with the same order are behind the ones that were in the queue, in the order of the path
+        orders, latitudes, longitudes = wpq.columns()
+        self.assertEqual(orders, sorted(orders))
+        for order in range(10):
+            same_order = [latitudes[i] for i in range(len(orders)) if orders[i] == order]
+            new = [record[1] for record in records if record[0] == order]
+            self.assertEqual(same_order[len(same_order) - len(new):], new)
+
+
+if __name__ == '__main__':
+    unittest.main()
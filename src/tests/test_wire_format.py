@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from shae.onboard import wire_format
+from shae.onboard.global_classes import Location, LocationEncoder, WayPoint
+
+
+class TestWireFormat(unittest.TestCase):
+    def test_1_round_trip(self):
+        message = {u'message_type': u'status', u'heartbeat': True, u'next_waypoint': None,
+                   u'battery_level': 87, u'height': -4.25, u'offset': -20, u'large': 2 ** 40,
+                   u'negative': -2 ** 33, u'drone_type': {u'model': u'Solo'}, u'path': range(20),
+                   u'long_text': u'x' * 300}
+        encoded = wire_format.dumps(message, 'msgpack')
+        self.assertEqual(wire_format.detect(encoded), 'msgpack')
+        self.assertEqual(wire_format.loads(encoded), message)
+        self.assertLess(len(encoded), len(json.dumps(message)))
+
+    def test_2_detect_json(self):
+        message = {'message_type': 'status', 'message': 'all_statuses'}
+        encoded = wire_format.dumps(message)
+        self.assertEqual(wire_format.detect(encoded), 'json')
+        self.assertEqual(wire_format.loads(encoded), message)
+        self.assertRaises(ValueError, wire_format.dumps, message, 'xml')
+
+    def test_3_encoder_class(self):
+        location = Location(longitude=3.7, latitude=51.0)
+        encoded = wire_format.dumps({'current_location': location}, 'msgpack', LocationEncoder)
+        self.assertEqual(wire_format.loads(encoded), {'current_location': {'latitude': 51.0, 'longitude': 3.7}})
+
+    def test_4_packed_waypoints(self):
+        waypoints = [WayPoint(location=Location(longitude=3.7 + i, latitude=51.0 - i), order=i) for i in range(3)]
+        packet = {'message_type': 'navigation', 'message': 'path',
+                  'packed_waypoints': wire_format.pack_waypoints(waypoints)}
+        decoded = wire_format.loads(wire_format.dumps(packet, 'msgpack'))
+        self.assertEqual(wire_format.unpack_waypoints(decoded['packed_waypoints']),
+                         [(0, 51.0, 3.7), (1, 50.0, 4.7), (2, 49.0, 5.7)])
+        self.assertRaises(ValueError, wire_format.unpack_waypoints, decoded['packed_waypoints'][:-1])
+
+    def test_5_truncated(self):
+        encoded = wire_format.dumps({'message_type': 'status'}, 'msgpack')
+        self.assertRaises(ValueError, wire_format.loads, encoded[:-2])
+        self.assertRaises(ValueError, wire_format.loads, encoded + '\x00')
+
+if __name__ == '__main__':
+    unittest.main()